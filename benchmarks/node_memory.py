@@ -0,0 +1,84 @@
+"""
+Memory footprint of query tree nodes
+
+Builds a long expression graph with the slot-based Node and with a node that keeps its
+attributes in a __dict__ and copies its parameters (the previous layout), and prints the
+memory allocated per node as measured by tracemalloc.
+
+Usage: python benchmarks/node_memory.py [number of nodes]
+"""
+import os
+import sys
+import tracemalloc
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..')))
+# the coverage modules import helpers as a top level package
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..', 'wdc')))
+
+from wdc.action import Action
+from wdc.tree.query_tree import Node
+
+
+class DictNode:
+    """Node with a per-instance __dict__, a list of children and copied parameters"""
+    def __init__(self, cube=None, action=None, params=None) -> None:
+        self.action = action
+        self.cube = cube
+        self.children = []
+        self.params = None if params is None else dict(params)
+        self.size = 1
+
+
+def build_slot_nodes(count: int) -> list:
+    leaf = Node()
+    # frozen parameters are shared by all nodes instead of being copied
+    params = Node.freeze_params({'slice': 'ansi("2021-04-09")'})
+    nodes = [leaf]
+    for i in range(count):
+        if i % 2:
+            nodes.append(Node(action=Action.ADD, children=(nodes[-1], leaf)))
+        else:
+            nodes.append(Node(action=Action.MAX, params=params, children=(nodes[-1],)))
+    return nodes
+
+
+def build_dict_nodes(count: int) -> list:
+    leaf = DictNode()
+    params = {'slice': 'ansi("2021-04-09")'}
+    nodes = [leaf]
+    for i in range(count):
+        if i % 2:
+            node = DictNode(action=Action.ADD)
+            node.children.append(nodes[-1])
+            node.children.append(leaf)
+        else:
+            node = DictNode(action=Action.MAX, params=params)
+            node.children.append(nodes[-1])
+        node.size += sum(child.size for child in node.children)
+        nodes.append(node)
+    return nodes
+
+
+def measure(build, count: int) -> float:
+    """Bytes allocated per node while a graph of count nodes is alive"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = build(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nodes
+    return (after - before) / count
+
+
+def main(count: int = 100000) -> None:
+    slot = measure(build_slot_nodes, count)
+    legacy = measure(build_dict_nodes, count)
+    print(f"nodes:            {count}")
+    print(f"slots Node:       {slot:8.1f} bytes/node")
+    print(f"__dict__ Node:    {legacy:8.1f} bytes/node")
+    print(f"saved:            {100 * (1 - slot / legacy):8.1f} %")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,120 @@
+"""
+Load and latency of the client against the local stand-in server
+
+Starts a StandInServer with a fixed latency (and optionally a bandwidth, an error rate and
+a concurrency limit) and measures the wall time of the client features on the same workload:
+sequential fetches, parallel fetches with fetch_many, coalescing of duplicate queries,
+the result cache and HTTP compression. No network access is needed and the server is
+seeded, so runs are repeatable.
+
+Usage:
+    python benchmarks/standin_load.py
+    python benchmarks/standin_load.py --latency 0.05 --queries 64 --max-concurrency 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..')))
+# the coverage modules import helpers as a top level package
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..', 'wdc')))
+
+from wdc import Datacube
+from wdc.connection.cache import ResultCache
+from wdc.connection.resilience import Resilience, RetryPolicy
+from wdc.connection.transport import Transport
+from wdc.helpers.subset import Subset
+from wdc.standin.server import StandInServer
+
+
+def _cubes(count: int) -> list:
+    """count different datacubes, windows of 100 x 100 cells of an S2 coverage"""
+    cubes = []
+    for i in range(count):
+        offset = i * 100
+        cubes.append(Datacube(index=[Subset('ansi', "2021-04-09"),
+                                     Subset('E', 669960 + offset, 669960 + offset + 1000),
+                                     Subset('N', 4990200, 4991200)],
+                              coverage_name="S2_L2A_32631_B04_10m").encode("text/csv"))
+    return cubes
+
+
+def _run(server: StandInServer, name: str, requester, work) -> dict:
+    previous = Datacube.requester
+    Datacube.requester = requester
+    server.reset_stats()
+    start = time.perf_counter()
+    try:
+        work()
+    finally:
+        Datacube.requester = previous
+    seconds = time.perf_counter() - start
+    stats = dict(server.stats)
+    print(f"{name:34} {seconds:8.3f}s {stats['queries']:8} {stats['failed']:7} "
+          f"{stats['bytes_sent'] / 1024:10.0f} KiB {stats['peak_concurrency']:6}")
+    return {'seconds': seconds, **stats}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--queries', type=int, default=32, help="queries per scenario")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per answer")
+    parser.add_argument('--bandwidth', type=float, default=None, help="bytes per second")
+    parser.add_argument('--error-rate', type=float, default=0.1,
+                        help="share of failed requests in the retry scenario")
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                        help="requests the server processes at once")
+    parser.add_argument('--workers', type=int, default=8, help="max_workers of fetch_many")
+    args = parser.parse_args(argv)
+
+    count = args.queries
+    print(f"{'scenario':34} {'time':>9} {'queries':>8} {'failed':>7} {'sent':>14} {'peak':>6}")
+    with StandInServer(latency=args.latency, bandwidth=args.bandwidth,
+                       max_concurrency=args.max_concurrency) as server:
+        transport = Transport()
+
+        def sequential():
+            for cube in _cubes(count):
+                cube.fetch()
+        _run(server, "sequential", server.requester(transport=transport), sequential)
+
+        _run(server, f"fetch_many[{args.workers}]", server.requester(transport=transport),
+             lambda: Datacube.fetch_many(_cubes(count), max_workers=args.workers))
+
+        # every datacube eight times, the same query is in flight several times at once
+        duplicates = _cubes(max(1, count // 8)) * 8
+        _run(server, "duplicates, coalesce=False", server.requester(transport=transport, coalesce=False),
+             lambda: Datacube.fetch_many(duplicates, max_workers=args.workers))
+        _run(server, "duplicates, coalesce=True", server.requester(transport=transport),
+             lambda: Datacube.fetch_many(duplicates, max_workers=args.workers))
+
+        with tempfile.TemporaryDirectory() as directory:
+            requester = server.requester(transport=transport, cache=ResultCache(directory))
+            cubes = _cubes(count)
+            _run(server, "cache, cold", requester,
+                 lambda: Datacube.fetch_many(cubes, max_workers=args.workers))
+            _run(server, "cache, warm", requester,
+                 lambda: Datacube.fetch_many(cubes, max_workers=args.workers))
+
+        identity = Transport(compress=False)
+        _run(server, "fetch_many, no compression", server.requester(transport=identity),
+             lambda: Datacube.fetch_many(_cubes(count), max_workers=args.workers))
+        identity.close()
+        transport.close()
+
+    with StandInServer(latency=args.latency, error_rate=args.error_rate, seed=1) as server:
+        transport = Transport()
+        resilience = Resilience(retry=RetryPolicy(attempts=8, backoff=0.01))
+        _run(server, f"retries, error_rate={args.error_rate}",
+             server.requester(transport=transport, resilience=resilience),
+             lambda: Datacube.fetch_many(_cubes(count), max_workers=args.workers))
+        resilience.close()
+        transport.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+Benchmark suite of the hot paths of the library
+
+Measures the building of query trees (Datacube operators, QueryTree.merge_to, append_action
+and unite_trees on wide and deep trees), query generation with make_process_query_from_tree
+on trees of 10 to 100k nodes, Formatting and Subset in bulk and the random coverages.
+Every benchmark reports the best time of a few runs and the peak memory of one run
+(tracemalloc), and is compared with a saved baseline.
+
+Usage:
+    python benchmarks/suite.py                  run and compare with benchmarks/baseline.json
+    python benchmarks/suite.py --save           run and write the results as the new baseline
+    python benchmarks/suite.py --only compile   run the benchmarks whose name contains "compile"
+
+The exit status is 1 if a benchmark is slower or needs more memory than the baseline allows.
+Times are compared relative to a calibration loop (fixed pure Python work) that is timed with
+every run and saved with the baseline: the baseline times are scaled by the ratio of the
+calibration times, so a baseline saved on one machine can be used on a faster or slower one.
+The allowed slowdown can be set with --time-tolerance (0.5 = 50 % slower).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..')))
+# the coverage modules import helpers as a top level package
+sys.path.append(os.path.abspath(os.path.join(current_directory, '..', 'wdc')))
+
+from wdc import Datacube
+from wdc.action import Action
+from wdc.coverage.args_formatter import Formatting
+from wdc.coverage.subcoverages.average_coverage import AverageCoverage
+from wdc.coverage.subcoverages.s2_coverage import S2Coverage
+from wdc.helpers.subset import Subset
+from wdc.tree.query_tree import QueryTree
+from wdc.tree.tree_parser import make_process_query_from_tree
+
+BASELINE = os.path.join(current_directory, 'baseline.json')
+# allowed slowdown and memory growth before a benchmark counts as a regression
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.2
+# differences of peak memory below this are noise
+MEMORY_SLACK = 64 * 1024
+
+BENCHMARKS = []
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark
+
+    The decorated function does the setup and returns the workload, a function without
+    arguments. Only the workload is measured.
+    """
+    def register(make_workload):
+        BENCHMARKS.append((name, make_workload))
+        return make_workload
+    return register
+
+
+def _leaves(count: int) -> list:
+    return [Datacube(coverage_name="S2_L2A_32631_B04_10m") for _ in range(count)]
+
+
+def _balanced_tree(leaf_count: int) -> QueryTree:
+    """Tree of leaf_count distinct leaves joined by +, about 2 * leaf_count nodes"""
+    trees = [leaf.get_tree() for leaf in _leaves(leaf_count)]
+    while len(trees) > 1:
+        pairs = [trees[i].merge_to(trees[i + 1], action=Action.ADD)
+                 for i in range(0, len(trees) - 1, 2)]
+        trees = pairs + ([trees[-1]] if len(trees) % 2 else [])
+    return trees[0]
+
+
+@benchmark("datacube_operators_deep[5000]")
+def datacube_operators_deep():
+    a, b = _leaves(2)
+
+    def run():
+        cube = a
+        for _ in range(5000):
+            cube = cube + b
+    return run
+
+
+@benchmark("datacube_operators_constants[2000]")
+def datacube_operators_constants():
+    a = _leaves(1)[0]
+
+    def run():
+        cube = a
+        for _ in range(2000):
+            cube = cube * 2 + 1
+    return run
+
+
+@benchmark("merge_to_wide[16384]")
+def merge_to_wide():
+    trees = [leaf.get_tree() for leaf in _leaves(16384)]
+
+    def run():
+        level = trees
+        while len(level) > 1:
+            level = [level[i].merge_to(level[i + 1], action=Action.ADD)
+                     for i in range(0, len(level), 2)]
+    return run
+
+
+@benchmark("append_action_deep[20000]")
+def append_action_deep():
+    tree = _leaves(1)[0].get_tree()
+    params = {"slice": 'ansi("2021-04-09")'}
+
+    def run():
+        current = tree
+        for i in range(20000):
+            current = current.append_action(Action.MAX, params) if i % 2 \
+                else current.append_action(Action.SUBINDEX, {"index": 'E(669960:670000)'})
+    return run
+
+
+@benchmark("unite_trees_wide[5000]")
+def unite_trees_wide():
+    trees = [leaf.get_tree() for leaf in _leaves(5000)]
+    params = [(f"a{i}", f"c{i}") for i in range(5000)]
+
+    def run():
+        for _ in range(10):
+            QueryTree.unite_trees(trees, action=Action.REFACTOR, params=params)
+    return run
+
+
+@benchmark("compile[10]x2000")
+def compile_small():
+    tree = _balanced_tree(5)
+
+    def run():
+        for _ in range(2000):
+            make_process_query_from_tree(tree)
+    return run
+
+
+@benchmark("compile[1000]x20")
+def compile_medium():
+    tree = _balanced_tree(500)
+
+    def run():
+        for _ in range(20):
+            make_process_query_from_tree(tree)
+    return run
+
+
+@benchmark("compile[100000]")
+def compile_large():
+    tree = _balanced_tree(50000)
+
+    def run():
+        make_process_query_from_tree(tree)
+    return run
+
+
+@benchmark("compile_shared[20000]")
+def compile_shared():
+    # a deep chain that uses the same leaf again and again, compiled as a DAG
+    a, b = _leaves(2)
+    cube = a
+    for _ in range(10000):
+        cube = cube * b + a
+    tree = cube.get_tree()
+
+    def run():
+        make_process_query_from_tree(tree)
+    return run
+
+
+@benchmark("formatting[20000]")
+def formatting():
+    subsets = [Subset("ansi", "2021-04-09"), Subset("E", 669960, 670000), Subset("N", 4990200, 4990300)]
+
+    def run():
+        for _ in range(20000):
+            Formatting.subsets_format(subsets)
+            Formatting.ansi_sliceformat("2021", "04", "09")
+            Formatting.ansi_trimformat("2021", "04", "08", "2021", "04", "10")
+    return run
+
+
+@benchmark("subset_construction[100000]")
+def subset_construction():
+    def run():
+        for i in range(50000):
+            Subset("E", 669960 + i, 670000 + i)
+            Subset("ansi", "2021-04-09")
+    return run
+
+
+@benchmark("subset_parse[10000]")
+def subset_parse():
+    index = 'ansi("2021-04-08":"2021-04-10"), E(669960:670000), N(4990200)'
+
+    def run():
+        for _ in range(10000):
+            Subset.parse(index)
+    return run
+
+
+@benchmark("randomize_coverage[500]")
+def randomize_coverage():
+    random.seed(0)
+
+    def run():
+        for _ in range(500):
+            S2Coverage.randomize_coverage()
+            AverageCoverage.randomize_coverage()
+    return run
+
+
+@benchmark("randomize_coverages[100000]")
+def randomize_coverages():
+    def run():
+        S2Coverage.randomize_coverages(50000, seed=0)
+        AverageCoverage.randomize_coverages(50000, seed=0)
+    return run
+
+
+def best_time(make_workload, repeat: int) -> float:
+    """Best time of repeat runs of a workload"""
+    times = []
+    for _ in range(repeat):
+        run = make_workload()
+        gc.collect()
+        # as in timeit, collections triggered by earlier garbage would make the times noisy
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        del run
+    return min(times)
+
+
+def _calibration_workload():
+    def run():
+        table = {}
+        parts = []
+        for i in range(100000):
+            key = f"c{i % 1000}"
+            table[key] = table.get(key, 0) + i
+            if i % 3 == 0:
+                parts.append((key, i))
+        ''.join(key for key, _ in sorted(parts))
+    return run
+
+
+def calibrate(repeat: int) -> float:
+    """
+    Best time of a fixed pure Python workload (strings, dicts, tuples, sorting), the unit
+    the times of the benchmarks are compared in
+    """
+    return best_time(_calibration_workload, repeat)
+
+
+def measure(make_workload, repeat: int) -> dict:
+    """
+    Best time of repeat runs and the peak memory of one more run
+
+    Returns:
+        dict: seconds and peak_bytes
+    """
+    seconds = best_time(make_workload, repeat)
+    run = make_workload()
+    gc.collect()
+    # tracing slows the run down, so memory is measured separately from time
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+
+def compare(name: str, result: dict, baseline: dict, time_tolerance: float,
+            memory_tolerance: float, scale: float = 1.0) -> list:
+    """
+    Messages about the regressions of a benchmark, empty if there are none
+
+    Args:
+        scale (float): ratio of the calibration times of this machine and the baseline's,
+            the baseline time is multiplied by it
+    """
+    base = baseline.get(name)
+    if base is None:
+        return []
+    problems = []
+    expected = base['seconds'] * scale
+    if result['seconds'] > expected * (1 + time_tolerance):
+        problems.append(f"{name}: {result['seconds']:.4f}s, scaled baseline {expected:.4f}s")
+    if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance) + MEMORY_SLACK:
+        problems.append(f"{name}: peak {result['peak_bytes']} bytes, "
+                        f"baseline {base['peak_bytes']} bytes")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--baseline', default=BASELINE, help="baseline JSON file")
+    parser.add_argument('--save', action='store_true', help="write the results as the baseline")
+    parser.add_argument('--only', default=None, help="run the benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE,
+                        help="allowed slowdown against the scaled baseline, 0.5 = 50 %%")
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE,
+                        help="allowed growth of the peak memory, 0.2 = 20 %%")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    base_calibration = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            saved = json.load(file)
+        baseline = saved['benchmarks']
+        base_calibration = saved.get('calibration')
+
+    # the calibration is timed before and after the benchmarks, the better time is less noisy
+    calibration = calibrate(args.repeat)
+    results = {}
+    for name, make_workload in BENCHMARKS:
+        if args.only is None or args.only in name:
+            results[name] = measure(make_workload, args.repeat)
+    calibration = min(calibration, calibrate(args.repeat))
+    # without a calibration in the baseline the times are compared as they are
+    scale = calibration / base_calibration if base_calibration else 1.0
+    if base_calibration:
+        print(f"calibration {calibration:.4f}s, baseline {base_calibration:.4f}s, "
+              f"baseline times x {scale:.2f}")
+    else:
+        print(f"calibration {calibration:.4f}s, the baseline has none")
+
+    problems = []
+    print(f"{'benchmark':36} {'time':>10} {'baseline':>10} {'peak memory':>14} {'baseline':>14}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        base_seconds = f"{base['seconds'] * scale:.4f}s" if base else "-"
+        base_peak = f"{base['peak_bytes'] / 1024:.0f} KiB" if base else "-"
+        print(f"{name:36} {result['seconds']:9.4f}s {base_seconds:>10} "
+              f"{result['peak_bytes'] / 1024:10.0f} KiB {base_peak:>14}")
+        problems.extend(compare(name, result, baseline, args.time_tolerance, args.memory_tolerance,
+                                scale))
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'calibration': calibration, 'benchmarks': results},
+                      file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
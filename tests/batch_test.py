@@ -0,0 +1,90 @@
+import unittest
+from concurrent.futures import TimeoutError, wait
+from unittest import mock
+import threading
+import time
+import sys
+import os
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+
+
+class FakeRequester:
+    """Requester that answers with the coverage name and fails for one coverage"""
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def evaluate_query(self, query, deadline=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if 'BROKEN' in query:
+            raise ConnectionError("server is not reachable")
+        return query.split('(')[1].split(')')[0].encode()
+
+
+class TestFetchMany(unittest.TestCase):
+    def make_cubes(self, names, requester):
+        cubes = [Datacube(coverage_name=name) for name in names]
+        for cube in cubes:
+            cube.requester = requester
+        return cubes
+
+    def test_ordered_with_errors(self):
+        requester = FakeRequester()
+        names = ["S2_L2A_32631_B01_60m", "BROKEN", "S2_L2A_32631_B03_10m", "S2_L2A_32631_B04_10m"]
+        results = Datacube.fetch_many(self.make_cubes(names, requester), max_workers=2)
+        self.assertEqual([r.ok for r in results], [True, False, True, True])
+        self.assertEqual(results[0].result(), b"S2_L2A_32631_B01_60m")
+        self.assertIsInstance(results[1].error, ConnectionError)
+        with self.assertRaises(ConnectionError):
+            results[1].result()
+        self.assertLessEqual(requester.peak, 2)
+
+    def test_parallel(self):
+        requester = FakeRequester(delay=0.2)
+        names = [f"AvgTemperatureColor_{i}" for i in range(8)]
+        start = time.time()
+        results = Datacube.fetch_many(self.make_cubes(names, requester), max_workers=8)
+        # all requests run at once, so the batch takes about one round trip
+        self.assertLess(time.time() - start, 0.2 * 4)
+        self.assertEqual([r.data for r in results], [name.encode() for name in names])
+
+    def test_as_completed(self):
+        requester = FakeRequester()
+        names = [f"AverageChloroColor_{i}" for i in range(5)]
+        results = list(Datacube.fetch_many(self.make_cubes(names, requester), ordered=False))
+        self.assertEqual(sorted(r.index for r in results), list(range(5)))
+        for r in results:
+            self.assertEqual(r.data, names[r.index].encode())
+
+    def test_completed_after_the_timeout(self):
+        def as_completed(futures, timeout=None):
+            # every request finishes after the wait for the next one has timed out
+            wait(futures)
+            raise TimeoutError()
+            yield
+
+        requester = FakeRequester()
+        names = [f"AverageChloroColor_{i}" for i in range(3)]
+        with mock.patch('wdc.connection.batch.as_completed', as_completed):
+            results = list(Datacube.fetch_many(self.make_cubes(names, requester), ordered=False,
+                                               deadline=5))
+        self.assertEqual(sorted(r.index for r in results), [0, 1, 2])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual([r.data for r in sorted(results, key=lambda r: r.index)],
+                         [name.encode() for name in names])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+import os
+import sys
+import tempfile
+import time
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.cache import ResultCache
+from wdc.connection.requester import ClientRequest
+from wdc.connection.transport import Transport
+
+ENDPOINT = "https://ows.rasdaman.org/rasdaman/ows"
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_roundtrip_with_compression(self):
+        for compression in [None, 'zlib', 'lzma']:
+            cache = ResultCache(self.directory.name, compression=compression)
+            cache.put(ENDPOINT, f"query {compression}", b"data" * 100)
+            self.assertEqual(cache.get(ENDPOINT, f"query {compression}"), b"data" * 100)
+        self.assertIsNone(cache.get(ENDPOINT, "unknown query"))
+        self.assertIsNone(cache.get("http://localhost/ows", "query None"))
+
+    def test_survives_new_instance(self):
+        ResultCache(self.directory.name).put(ENDPOINT, "q", b"result")
+        self.assertEqual(ResultCache(self.directory.name).get(ENDPOINT, "q"), b"result")
+
+    def test_ttl(self):
+        cache = ResultCache(self.directory.name, ttl=0.05)
+        cache.put(ENDPOINT, "q", b"result")
+        self.assertEqual(cache.get(ENDPOINT, "q"), b"result")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(ENDPOINT, "q"))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.directory.name, max_bytes=3 * 1100)
+        for i in range(3):
+            cache.put(ENDPOINT, f"q{i}", bytes(1000))
+            # make the order of use unambiguous for the file system clock
+            os.utime(cache._path(cache.make_key(ENDPOINT, f"q{i}")), (i, i))
+        cache.get(ENDPOINT, "q0")
+        cache.put(ENDPOINT, "q3", bytes(1000))
+        self.assertIsNotNone(cache.get(ENDPOINT, "q0"))
+        self.assertIsNone(cache.get(ENDPOINT, "q1"))
+        self.assertIsNotNone(cache.get(ENDPOINT, "q3"))
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith('.tmp')], [])
+
+    def test_requester_uses_cache(self):
+        transport = Transport()
+        cache = ResultCache(self.directory.name, compression='zlib')
+        cube = Datacube().avg("")
+        cube.requester = ClientRequest(transport=transport, cache=cache)
+        response = mock.Mock(content=b'42.5', ok=True)
+        with mock.patch.object(transport, 'post', return_value=response) as post:
+            self.assertEqual(cube.fetch(), b'42.5')
+            self.assertEqual(cube.fetch(), b'42.5')
+        post.assert_called_once()
+        transport.close()
+
+    def test_rebuilt_expression_hits(self):
+        # e.g. a notebook cell that is run again, or a new process with the same cache directory
+        def build():
+            cube = (Datacube(coverage_name="S2_L2A_32631_B04_60m") * 2).avg("")
+            cube.requester = ClientRequest(transport=transport,
+                                           cache=ResultCache(self.directory.name))
+            return cube
+        transport = Transport()
+        first, second = build(), build()
+        self.assertNotEqual(first.explain().query, second.explain().query)
+        response = mock.Mock(content=b'42.5', ok=True)
+        with mock.patch.object(transport, 'post', return_value=response) as post:
+            self.assertEqual(first.fetch(), b'42.5')
+            self.assertEqual(second.fetch(), b'42.5')
+            self.assertEqual(second.fetch_array().data, 42.5)
+        post.assert_called_once()
+        transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
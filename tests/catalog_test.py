@@ -0,0 +1,152 @@
+import unittest
+import os
+import sys
+import tempfile
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc.coverage.catalog import CoverageCatalog, CoverageDescription
+from wdc.coverage.subcoverages.s2_coverage import S2Coverage
+
+CAPABILITIES = b'''<?xml version="1.0" encoding="UTF-8"?>
+<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0">
+  <wcs:ServiceMetadata>
+    <wcs:formatSupported>image/png</wcs:formatSupported>
+    <wcs:formatSupported>application/json</wcs:formatSupported>
+  </wcs:ServiceMetadata>
+  <wcs:Contents>
+    <wcs:CoverageSummary>
+      <wcs:CoverageId>S2_L2A_32631_B01_60m</wcs:CoverageId>
+      <wcs:CoverageSubtype>RectifiedGridCoverage</wcs:CoverageSubtype>
+    </wcs:CoverageSummary>
+    <wcs:CoverageSummary>
+      <wcs:CoverageId>AvgLandTemp</wcs:CoverageId>
+      <wcs:CoverageSubtype>ReferenceableGridCoverage</wcs:CoverageSubtype>
+    </wcs:CoverageSummary>
+  </wcs:Contents>
+</wcs:Capabilities>'''
+
+DESCRIPTION = b'''<?xml version="1.0" encoding="UTF-8"?>
+<wcs:CoverageDescriptions xmlns:wcs="http://www.opengis.net/wcs/2.0"
+    xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0"
+    xmlns:gmlrgrid="http://www.opengis.net/gml/3.3/rgrid" xmlns:swe="http://www.opengis.net/swe/2.0">
+  <wcs:CoverageDescription gml:id="S2_L2A_32631_B01_60m">
+    <gml:boundedBy>
+      <gml:Envelope srsName="http://www.opengis.net/def/crs-compound?1=AnsiDate&amp;2=EPSG/0/32631"
+          axisLabels="ansi E N" uomLabels="d metre metre" srsDimension="3">
+        <gml:lowerCorner>"2021-04-08T00:00:00.000Z" 669960 4990200</gml:lowerCorner>
+        <gml:upperCorner>"2021-04-10T00:00:00.000Z" 729960 5015220</gml:upperCorner>
+      </gml:Envelope>
+    </gml:boundedBy>
+    <wcs:CoverageId>S2_L2A_32631_B01_60m</wcs:CoverageId>
+    <gml:domainSet>
+      <gmlrgrid:ReferenceableGridByVectors dimension="3">
+        <gml:limits><gml:GridEnvelope><gml:low>0 0 0</gml:low><gml:high>2 999 416</gml:high></gml:GridEnvelope></gml:limits>
+        <gml:axisLabels>ansi E N</gml:axisLabels>
+        <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis>
+          <gmlrgrid:offsetVector>1 0 0</gmlrgrid:offsetVector>
+          <gmlrgrid:coefficients>"2021-04-08T00:00:00.000Z" "2021-04-09T00:00:00.000Z" "2021-04-10T00:00:00.000Z"</gmlrgrid:coefficients>
+          <gmlrgrid:gridAxesSpanned>ansi</gmlrgrid:gridAxesSpanned>
+        </gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+        <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis>
+          <gmlrgrid:offsetVector>0 60 0</gmlrgrid:offsetVector>
+          <gmlrgrid:coefficients/>
+          <gmlrgrid:gridAxesSpanned>E</gmlrgrid:gridAxesSpanned>
+        </gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+        <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis>
+          <gmlrgrid:offsetVector>0 0 -60</gmlrgrid:offsetVector>
+          <gmlrgrid:coefficients/>
+          <gmlrgrid:gridAxesSpanned>N</gmlrgrid:gridAxesSpanned>
+        </gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+      </gmlrgrid:ReferenceableGridByVectors>
+    </gml:domainSet>
+    <gmlcov:rangeType><swe:DataRecord>
+      <swe:field name="B01"><swe:Quantity definition="http://www.opengis.net/def/dataType/OGC/0/unsignedShort"/></swe:field>
+    </swe:DataRecord></gmlcov:rangeType>
+  </wcs:CoverageDescription>
+</wcs:CoverageDescriptions>'''
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeRequester:
+    def __init__(self):
+        self.calls = []
+
+    def get_capabilities(self, headers=None):
+        self.calls.append(('capabilities', headers))
+        if headers and headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, CAPABILITIES, {'ETag': '"v1"'})
+
+    def describe_coverage(self, cov_id, headers=None):
+        self.calls.append((cov_id, headers))
+        return FakeResponse(200, DESCRIPTION, {'Last-Modified': 'Fri, 09 Apr 2021 00:00:00 GMT'})
+
+
+class TestCoverageDescription(unittest.TestCase):
+    def test_parse(self):
+        description = CoverageDescription.from_xml(DESCRIPTION)
+        self.assertEqual(description.coverage_id, "S2_L2A_32631_B01_60m")
+        self.assertEqual(description.axis_labels, ["ansi", "E", "N"])
+        self.assertEqual(description.bounds("E"), (669960.0, 729960.0))
+        self.assertEqual(description.bounds("ansi")[0], "2021-04-08T00:00:00.000Z")
+        self.assertEqual(description.resolution, [None, 60.0, 60.0])
+        self.assertEqual(description.grid_size, [3, 1000, 417])
+        self.assertEqual(len(description.coefficients["ansi"]), 3)
+        self.assertEqual(description.bands, [("B01", "unsignedShort")])
+
+
+class TestCoverageCatalog(unittest.TestCase):
+    def test_cached_and_revalidated(self):
+        requester = FakeRequester()
+        catalog = CoverageCatalog(requester=requester, ttl=3600)
+        self.assertEqual(catalog.coverage_ids(), ["AvgLandTemp", "S2_L2A_32631_B01_60m"])
+        self.assertEqual(catalog.coverage_ids(prefix="S2_"), ["S2_L2A_32631_B01_60m"])
+        self.assertEqual(len(requester.calls), 1)
+        # an expired entry is revalidated with its ETag and kept on 304
+        catalog.ttl = 0
+        self.assertEqual(catalog.coverage_ids(prefix="Avg"), ["AvgLandTemp"])
+        self.assertEqual(requester.calls[-1], ('capabilities', {'If-None-Match': '"v1"'}))
+
+    def test_capabilities_fetched_once(self):
+        requester = FakeRequester()
+        catalog = CoverageCatalog(requester=requester)
+        self.assertEqual(catalog.formats(), ["image/png", "application/json"])
+        self.assertEqual(catalog.summaries()["AvgLandTemp"], "ReferenceableGridCoverage")
+        self.assertEqual(requester.calls, [('capabilities', None)])
+
+    def test_snapshot(self):
+        requester = FakeRequester()
+        catalog = CoverageCatalog(requester=requester)
+        catalog.coverage_ids()
+        catalog.describe("S2_L2A_32631_B01_60m")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.json')
+            catalog.save(path)
+            warm = CoverageCatalog.load(path, requester=FakeRequester())
+        description = warm.describe("S2_L2A_32631_B01_60m")
+        self.assertEqual(description.bounds("N"), (4990200.0, 5015220.0))
+        self.assertEqual(warm.formats(), ["image/png", "application/json"])
+        self.assertEqual(warm.requester.calls, [])
+
+    def test_randomize_from_catalog(self):
+        catalog = CoverageCatalog(requester=FakeRequester())
+        name, subsets = S2Coverage.randomize_coverage(catalog)
+        self.assertEqual(name, "S2_L2A_32631_B01_60m")
+        e = subsets[1][2:-1].split(',')
+        self.assertTrue(669960 <= int(e[0]) <= 729960)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import sys
+import warnings
+
+import numpy as np
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.coverage.catalog import CoverageDescription
+from wdc.helpers.subset import Subset
+from wdc.tree.cost import LargeQueryWarning, QueryTooLarge
+
+DATES = [f"2021-04-{day:02d}T00:00:00.000Z" for day in range(1, 31)]
+E0 = 600000
+N0 = 4990200
+
+
+class CachedCatalog:
+    """Catalog whose descriptions are all cached, describe must not be called"""
+    def __init__(self):
+        self.descriptions = {}
+        for name, resolution, band in [("S2_L2A_32631_B04_10m", 10, 'unsignedShort'),
+                                       ("S2_L2A_32631_TCI_60m", 60, 'unsignedChar')]:
+            cells = 109800 // resolution
+            bands = [('B04', band)] if band == 'unsignedShort' else \
+                [('red', band), ('green', band), ('blue', band)]
+            self.descriptions[name] = CoverageDescription(
+                name, ['ansi', 'E', 'N'], [DATES[0], E0, N0], [DATES[-1], E0 + 109800, N0 + 109800],
+                resolution=[None, resolution, resolution], grid_size=[len(DATES), cells, cells],
+                bands=bands, coefficients={'ansi': DATES})
+
+    def cached(self, cov_id):
+        return self.descriptions.get(cov_id)
+
+    def describe(self, cov_id):
+        raise AssertionError("no request is expected")
+
+
+class TestExplain(unittest.TestCase):
+    def setUp(self):
+        self.catalog = CachedCatalog()
+
+    def test_window(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_B04_10m",
+                        index=[Subset("ansi", "2021-04-09"), Subset("E", E0, E0 + 1000),
+                               Subset("N", N0, N0 + 500)])
+        estimate = cube.encode("application/octet-stream").explain(self.catalog)
+        self.assertIn("encode", estimate.query)
+        self.assertEqual(estimate.axis_labels, ['E', 'N'])
+        self.assertEqual(estimate.shape, (100, 50))
+        self.assertEqual(estimate.dtype, np.dtype('<u2'))
+        self.assertEqual(estimate.nbytes, 100 * 50 * 2)
+        self.assertEqual(estimate.cells_read, 5000)
+        self.assertEqual(estimate.warnings, [])
+
+    def test_arithmetic_and_aggregate(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_B04_10m",
+                        index=[Subset("ansi", "2021-04-01", "2021-04-10"), Subset("E", E0, E0 + 100),
+                               Subset("N", N0, N0 + 100)])
+        estimate = ((cube - cube) / (cube + 1)).explain(self.catalog)
+        self.assertEqual(estimate.shape, (10, 10, 10))
+        self.assertEqual(estimate.dtype.kind, 'f')
+        self.assertEqual(estimate.operations, 3000)
+        estimate = cube.avg('ansi("2021-04-01":"2021-04-05")').explain(self.catalog)
+        self.assertEqual(estimate.shape, ())
+        self.assertEqual(estimate.operations, 500)
+        self.assertEqual(estimate.dtype, np.dtype(np.float64))
+
+    def test_subindex(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_TCI_60m")
+        estimate = cube[[Subset("ansi", "2021-04-09"), Subset("E", E0, E0 + 6000)]] \
+            .encode("image/png").explain(self.catalog)
+        self.assertEqual(estimate.shape, (100, 1830))
+        self.assertEqual(estimate.nbytes, 100 * 1830 * 3)
+        # the N axis was not subset
+        self.assertEqual(len(estimate.warnings), 1)
+        self.assertIn("N", estimate.warnings[0])
+
+    def test_unbounded_fetch(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_B04_10m").encode("image/tiff")
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            estimate = cube.explain(self.catalog)
+        self.assertEqual(estimate.nbytes, 30 * 10980 * 10980 * 2)
+        self.assertTrue(any(issubclass(w.category, LargeQueryWarning) for w in caught))
+        with self.assertRaises(QueryTooLarge):
+            cube.explain(self.catalog, max_bytes=1 << 30)
+
+        class Requester:
+            def evaluate_query(self, query):
+                raise AssertionError("the query must not be sent")
+        cube.requester = Requester()
+        with self.assertRaises(QueryTooLarge):
+            cube.fetch(max_bytes=1 << 30, catalog=self.catalog)
+
+    def test_without_catalog(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_B04_10m",
+                        index=[Subset("ansi", "2021-04-09"), Subset("E", E0, E0 + 1000)])
+        estimate = cube.explain()
+        self.assertEqual(estimate.axis_labels, ['E'])
+        self.assertIsNone(estimate.nbytes)
+        # an unknown size is refused when there is a limit
+        with self.assertRaises(QueryTooLarge):
+            cube.explain(max_bytes=1 << 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
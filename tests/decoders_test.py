@@ -0,0 +1,82 @@
+import unittest
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers import decoders
+from wdc.helpers.subset import Subset
+from fakes import FakeRequester, s2_catalog
+
+
+def make_cube(data, encode_format):
+    cube = Datacube(index=[Subset('ansi', "2021-04-09"), Subset('E', 669960, 670260),
+                           Subset('N', 4990200, 4990320)],
+                    coverage_name="S2_L2A_32631_B01_60m").encode(encode_format)
+    cube.requester = FakeRequester(data)
+    return cube
+
+
+class TestDecoders(unittest.TestCase):
+    def test_raw_zero_copy(self):
+        values = np.arange(10, dtype='<u2')
+        data = values.tobytes()
+        cube = make_cube(data, "application/octet-stream")
+        result = cube.fetch_array(catalog=s2_catalog([("B01", "unsignedShort")]))
+        # 5 cells along E and 2 along N, the ansi axis is sliced
+        self.assertEqual(result.shape, (5, 2))
+        self.assertEqual(result.dtype, np.uint16)
+        self.assertEqual(result.axis_labels, ['E', 'N'])
+        # a read-only view of the received bytes
+        self.assertFalse(result.data.flags.owndata)
+        self.assertFalse(result.data.flags.writeable)
+        np.testing.assert_array_equal(np.asarray(result).ravel(), values)
+
+    def test_raw_bands(self):
+        data = np.arange(20, dtype='<u1').tobytes()
+        result = make_cube(data, "application/octet-stream").fetch_array(
+            catalog=s2_catalog([("R", "unsignedChar"), ("G", "unsignedChar")]))
+        self.assertEqual(result.dtype.names, ("R", "G"))
+        self.assertEqual(result.data["G"][0, 0], 1)
+
+    def test_raw_explicit(self):
+        data = np.arange(6, dtype='<f4').tobytes()
+        result = make_cube(data, "application/octet-stream").fetch_array(dtype='<f4', shape=(3, 2))
+        self.assertEqual(result.shape, (3, 2))
+        self.assertEqual(result.data[2, 1], 5.0)
+
+    def test_image(self):
+        image = np.arange(30, dtype=np.uint8).reshape(2, 5, 3)
+        output = io.BytesIO()
+        Image.fromarray(image).save(output, format='PNG')
+        result = make_cube(output.getvalue(), "image/png").fetch_array()
+        np.testing.assert_array_equal(result.data, image)
+        self.assertEqual(result.axis_labels, ['N', 'E', 'band'])
+
+    def test_csv_and_scalar(self):
+        result = make_cube(b"{1,2,3},{4,5,6}", "text/csv").fetch_array()
+        np.testing.assert_array_equal(result.data, [[1, 2, 3], [4, 5, 6]])
+        cube = Datacube().avg("")
+        cube.requester = FakeRequester(b"42.5")
+        result = cube.fetch_array()
+        self.assertEqual(result.shape, ())
+        self.assertEqual(result.axis_labels, [])
+        self.assertEqual(float(result.data), 42.5)
+
+    def test_registry(self):
+        with self.assertRaises(ValueError):
+            decoders.get_decoder("application/x-unknown")
+        decoders.register_decoder("application/x-unknown",
+                                  lambda data, dtype, shape: np.array([len(data)]))
+        self.assertEqual(decoders.decode(b"abc", "application/x-unknown")[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+
+from wdc.connection.transfer import TransferReport
+from wdc.coverage.catalog import CoverageDescription
+from wdc.helpers import decoders
+
+
+class FakeCatalog:
+    """Catalog that describes every coverage with the same axes and lists the given formats"""
+    def __init__(self, axis_labels, lower_bounds, upper_bounds, formats=None, **description):
+        self.axis_labels = axis_labels
+        self.lower_bounds = lower_bounds
+        self.upper_bounds = upper_bounds
+        self.supported = formats
+        # further arguments of CoverageDescription, e.g. resolution or bands
+        self.description = description
+
+    def describe(self, cov_id):
+        return CoverageDescription(cov_id, self.axis_labels, self.lower_bounds, self.upper_bounds,
+                                   **self.description)
+
+    def formats(self):
+        return self.supported if self.supported is not None else list(decoders.DEFAULT_FORMATS)
+
+
+def s2_catalog(bands, formats=None):
+    """FakeCatalog of a Sentinel-2 coverage with three dates and cells of 60 m"""
+    return FakeCatalog(['ansi', 'E', 'N'],
+                       ['2021-04-08', 669960, 4990200], ['2021-04-10', 729960, 5015220],
+                       formats=formats, resolution=[None, 60, 60], grid_size=[3, 1000, 417],
+                       bands=bands)
+
+
+class FakeRequester:
+    """
+    Requester that records the queries and answers them with fixed bytes, or with
+    answer(query) in subclasses. The transfer is reported as gzip compressed to half the size
+    """
+    def __init__(self, data=b""):
+        self.data = data
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def answer(self, query):
+        return self.data
+
+    def evaluate_query_with_report(self, query, deadline=None, key=None):
+        with self.lock:
+            self.queries.append(query)
+        data = self.answer(query)
+        return data, TransferReport(len(data) // 2, len(data), 'gzip')
+
+    def evaluate_query(self, query, deadline=None, key=None):
+        return self.evaluate_query_with_report(query, deadline, key)[0]
+
+    async def aevaluate_query(self, query, deadline=None, key=None):
+        return self.evaluate_query(query, deadline, key)
+
+    def stream_query(self, query, chunk_size=65536, deadline=None):
+        data = self.evaluate_query(query)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
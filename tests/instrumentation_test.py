@@ -0,0 +1,116 @@
+import unittest
+import os
+import sys
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection import instrumentation
+from wdc.connection.requester import ClientRequest
+from wdc.connection.transport import Transport
+
+BODY = b"{1,2,3},{4,5,6}"
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Thinks for 0.1s before the headers and sends the body in two parts 0.1s apart"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(0.1)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY[:5])
+        self.wfile.flush()
+        time.sleep(0.1)
+        self.wfile.write(BODY[5:])
+
+    def log_message(self, *args):
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.transport = Transport(compress=False)
+        self.requester = ClientRequest(transport=self.transport)
+        self.requester.service_endpoint = \
+            f"http://127.0.0.1:{self.server.server_address[1]}/rasdaman/ows"
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_cube(self):
+        cube = Datacube(coverage_name="AvgLandTemp")
+        cube = (cube + cube * 2).encode("text/csv")
+        cube.requester = self.requester
+        return cube
+
+    def test_phases_of_fetch_array(self):
+        cube = self.make_cube()
+        with instrumentation.record_fetches() as recorder:
+            result = cube.fetch_array()
+        self.assertEqual(result.shape, (2, 3))
+        self.assertEqual(len(recorder.records), 1)
+        record = recorder.records[0]
+        self.assertEqual(list(record.phases), ['compile', 'connect', 'ttfb', 'download', 'decode'])
+        self.assertGreaterEqual(record.phases['ttfb'], 0.09)
+        self.assertGreaterEqual(record.phases['download'], 0.09)
+        self.assertLess(record.phases['connect'], 0.09)
+        self.assertEqual(record.tree_size, cube.get_tree().root.size)
+        self.assertGreater(record.query_length, 0)
+        self.assertEqual(record.response_bytes, len(BODY))
+        self.assertEqual(record.wire_bytes, len(BODY))
+        self.assertEqual(record.encode_format, "text/csv")
+        self.assertTrue(record.ok)
+
+    def test_fetch_and_batch(self):
+        records = []
+        instrumentation.add_listener(records.append)
+        try:
+            self.make_cube().fetch()
+            Datacube.fetch_many([self.make_cube(), self.make_cube()])
+        finally:
+            instrumentation.remove_listener(records.append)
+        self.assertEqual(len(records), 3)
+        self.assertTrue(all('decode' not in record.phases for record in records))
+        # nothing is recorded without listeners
+        self.make_cube().fetch()
+        self.assertEqual(len(records), 3)
+
+    def test_errors(self):
+        class BrokenRequester:
+            def evaluate_query(self, query):
+                raise ValueError("broken")
+        cube = self.make_cube()
+        cube.requester = BrokenRequester()
+
+        def failing_listener(record):
+            raise RuntimeError("listener")
+        with instrumentation.record_fetches() as recorder:
+            instrumentation.add_listener(failing_listener)
+            try:
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always")
+                    with self.assertRaises(ValueError):
+                        cube.fetch()
+            finally:
+                instrumentation.remove_listener(failing_listener)
+        self.assertIsInstance(recorder.records[0].error, ValueError)
+        self.assertEqual(list(recorder.records[0].phases), ['compile'])
+        self.assertTrue(any(issubclass(w.category, RuntimeWarning) for w in caught))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers.decoders import DecodedResult
+from wdc.helpers.subset import Subset
+
+
+class TestArithmetic(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.a = Datacube()
+        self.b = Datacube()
+        self.x = rng.random((37, 11))
+        self.y = rng.integers(1, 100, size=(37, 11)).astype(np.uint16)
+
+    def test_elementwise(self):
+        cube = ((self.a + self.b) * 2 - self.a / self.b).encode("application/octet-stream")
+        result = cube.evaluate_local({self.a: self.x, self.b: self.y}, chunk_size=50)
+        np.testing.assert_allclose(result.data, (self.x + self.y) * 2 - self.x / self.y)
+        self.assertEqual(result.encode_format, "application/octet-stream")
+
+    def test_dtype(self):
+        result = (self.b + self.b * 3).evaluate_local({self.b: self.y})
+        self.assertEqual(result.dtype, (self.y + self.y * 3).dtype)
+        result = (self.b / 2).evaluate_local({self.b: self.y})
+        self.assertEqual(result.dtype, np.float64)
+
+    def test_constants_and_broadcasting(self):
+        row = np.arange(11.0)
+        result = (self.a * 2 + self.b + (Datacube.cast_to_datacube(3) - 1)).evaluate_local(
+            {self.a: self.x, self.b: row})
+        np.testing.assert_allclose(result.data, self.x * 2 + row + 2)
+
+    def test_aggregates(self):
+        bindings = {self.a: self.x, self.b: self.y}
+        self.assertAlmostEqual(float((self.a + self.b).avg("").evaluate_local(bindings, chunk_size=7).data),
+                               np.mean(self.x + self.y))
+        self.assertAlmostEqual(float((self.a * self.b).max().evaluate_local(bindings).data),
+                               np.max(self.x * self.y))
+        self.assertEqual(int(self.b.min().evaluate_local(bindings).data), np.min(self.y))
+
+    def test_shared_subexpression(self):
+        c = self.a + self.b
+        result = (c * c).evaluate_local({self.a: self.x, self.b: self.y})
+        np.testing.assert_allclose(result.data, (self.x + self.y) ** 2)
+
+    def test_deep_chain(self):
+        cube = self.a
+        for _ in range(20000):
+            cube = cube + self.b
+        result = cube.evaluate_local({self.a: np.zeros(4), self.b: np.ones(4)})
+        np.testing.assert_array_equal(result.data, np.full(4, 20000.0))
+
+    def test_fused_memory(self):
+        x = np.ones((1000, 1000))
+        cube = self.a
+        for i in range(10):
+            cube = cube * 2 + i
+        tracemalloc.start()
+        result = cube.evaluate_local({self.a: x}, chunk_size=1 << 14)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # the result and a few chunk buffers, no full-size temporaries
+        self.assertLess(peak, 1.5 * x.nbytes)
+        self.assertEqual(result.data[0, 0], cube.evaluate_local({self.a: np.ones(1)}).data[0])
+
+    def test_missing_binding(self):
+        with self.assertRaises(KeyError):
+            (self.a + self.b).evaluate_local({self.a: self.x})
+
+
+class TestAxes(unittest.TestCase):
+    def setUp(self):
+        self.cube = Datacube()
+        self.data = np.arange(3 * 4 * 5).reshape(3, 4, 5)
+        self.bound = DecodedResult(self.data, ['ansi', 'E', 'N'], coordinates={
+            'ansi': np.array(["2021-04-08T00:00:00.000Z", "2021-04-09T00:00:00.000Z",
+                              "2021-04-10T00:00:00.000Z"]),
+            'E': np.array([0, 60, 120, 180])})
+
+    def test_subindex(self):
+        cube = self.cube[[Subset('ansi', "2021-04-09"), Subset('E', 60, 150), Subset('N', 1, 3)]]
+        result = cube.evaluate_local({self.cube: self.bound})
+        np.testing.assert_array_equal(result.data, self.data[1, 1:3, 1:4])
+        self.assertEqual(result.axis_labels, ['E', 'N'])
+        np.testing.assert_array_equal(result.coordinates['E'], [60, 120])
+
+    def test_aggregate_with_slice(self):
+        result = self.cube.max([Subset('ansi', "2021-04-08", "2021-04-09")]).evaluate_local(
+            {self.cube: self.bound})
+        self.assertEqual(result.data, self.data[:2].max())
+
+    def test_refactor(self):
+        red = self.cube[[Subset('ansi', "2021-04-08")]]
+        green = red * 2
+        result = Datacube.refactor([("red", red), ("green", green)]).evaluate_local(
+            {self.cube: self.bound})
+        self.assertEqual(result.dtype.names, ("red", "green"))
+        np.testing.assert_array_equal(result.data["green"], self.data[0] * 2)
+        self.assertEqual(result.axis_labels, ['E', 'N'])
+
+    def test_unlabelled_subindex(self):
+        with self.assertRaises(ValueError):
+            self.cube[[Subset('E', 0, 60)]].evaluate_local({self.cube: self.data})
+
+
+if __name__ == '__main__':
+    unittest.main()
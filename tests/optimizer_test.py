@@ -0,0 +1,161 @@
+import unittest
+
+# Need to add the .. folder to PATH to access a module via tests folder
+import sys
+import os
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers.subset import Subset
+from wdc.standin import wcps
+from wdc.standin.coverages import s2_coverage
+from wdc.tree import optimizer
+from wdc.tree.optimizer import optimize_tree, push_down_subsets
+from wdc.tree.tree_parser import make_process_query_from_tree
+
+
+class TestOptimizer(unittest.TestCase):
+    def test_constant_chain(self):
+        a = Datacube()
+        b = ((a + 35.0) * 0.2 * 2).optimize()
+        self.assertEqual(str(b.get_tree()), f"(({a.name})+(35.0))*(0.4)")
+
+    def test_constant_subtree(self):
+        a = Datacube()
+        two = Datacube.cast_to_datacube(2)
+        b = (a + two * 3 - 1).optimize()
+        self.assertEqual(str(b.get_tree()), f"({a.name})+(5)")
+
+    def test_identities(self):
+        a = Datacube()
+        for cube in [a * 1, a + 0, a - 0, Datacube.cast_to_datacube(1) * a]:
+            self.assertIs(cube.optimize().get_tree().root, a.get_tree().root)
+        # float constants turn an integer coverage into floats, these are not identities
+        for cube in [a * 1.0, a + 0.0, a - 0.0, (a * 2) * 0.5, a / 1]:
+            root = cube.optimize().get_tree().root
+            self.assertIsNot(root, a.get_tree().root)
+            self.assertIs(root.children[0], a.get_tree().root)
+            self.assertIsInstance(optimizer.constant_value(root.children[1]), float)
+
+    def test_no_infinite_constants(self):
+        a = Datacube()
+        b = ((a * 1e200) * 1e200).optimize()
+        query = make_process_query_from_tree(b.get_tree())
+        self.assertNotIn("inf", query)
+        self.assertEqual(str(b.get_tree()), f"(({a.name})*(1e+200))*(1e+200)")
+        c = (Datacube.cast_to_datacube(1e200) * 1e200 + a).optimize()
+        self.assertNotIn("inf", make_process_query_from_tree(c.get_tree()))
+        self.assertNotIn("inf", str((a / 1e-320).optimize().get_tree()))
+
+    def test_division(self):
+        a = Datacube()
+        self.assertEqual(str((a / 4).optimize().get_tree()), f"({a.name})*(0.25)")
+        # division by zero is left to the server
+        self.assertEqual(str((a / 0).optimize().get_tree()), f"({a.name})/(0)")
+
+    def test_negative_constant_query(self):
+        a = Datacube()
+        b = ((a - 5) + 2).optimize()
+        self.assertEqual(str(b.get_tree()), f"({a.name})-(3)")
+        c = ((a + 2) - 5).optimize()
+        self.assertIn("$f2 := -3", make_process_query_from_tree(c.get_tree()))
+
+    def test_nested_aggregates(self):
+        a = Datacube()
+        b = a.max().avg("").optimize()
+        self.assertEqual(b.get_tree().root.action, "max")
+        self.assertEqual(b.get_tree().root.children[0], a.get_tree().root)
+        # aggregates with slices are kept
+        c = a.max([Subset("ansi", "2021-04-09")]).avg("").optimize()
+        self.assertEqual(c.get_tree().root.action, "avg")
+
+    def test_repeated_subindex(self):
+        a = Datacube()
+        b = a[[Subset("ansi", "2021-04-09")]][[Subset("E", 670000, 679000)]].optimize()
+        root = b.get_tree().root
+        self.assertEqual(root.params["index"], 'ansi("2021-04-09"), E(670000:679000)')
+        self.assertIs(root.children[0], a.get_tree().root)
+        # the same axis twice can not be merged
+        c = a[[Subset("E", 670000, 679000)]][[Subset("E", 671000)]].optimize()
+        self.assertEqual(c.get_tree().root.children[0].action, "subindex")
+
+    def test_refactor_and_sharing(self):
+        a = Datacube()
+        s = a * 1
+        c = Datacube.refactor([("red", (s + 0) / 2), ("green", s * 1)]).encode("image/png")
+        tree = optimize_tree(c.get_tree())
+        query = make_process_query_from_tree(tree)
+        self.assertIn(f"$f2 := ${a.name}", query)
+        self.assertIn("{ red: $f1; green: $f2 }", query)
+        self.assertEqual(tree.root.size, 6)
+
+
+class TestPushDown(unittest.TestCase):
+    def test_through_arithmetic(self):
+        a = Datacube(index=[Subset("ansi", "2021-04-09"), Subset("E", 669960, 729960)],
+                     coverage_name="S2_L2A_32631_B01_60m")
+        b = Datacube(coverage_name="S2_L2A_32631_B02_60m")
+        window = [Subset("E", 670000, 680000), Subset("N", 4990200, 4991200)]
+        c = ((a + b) * 2)[window].encode("image/png")
+        tree = push_down_subsets(c.get_tree())
+        root = tree.root.children[0]
+        self.assertEqual(root.action, "*")
+        self.assertTrue(root.children[1].is_constant())
+        left, right = root.children[0].children
+        # the trims of E are intersected with the index of the leaf
+        self.assertEqual(left.cube.index,
+                         'ansi("2021-04-09"), E(670000:680000), N(4990200:4991200)')
+        self.assertEqual(left.cube.coverage_name, "S2_L2A_32631_B01_60m")
+        self.assertEqual(right.cube.index, 'E(670000:680000), N(4990200:4991200)')
+        self.assertNotIn("subindex", make_process_query_from_tree(tree))
+        # the original tree is not changed
+        self.assertEqual(c.get_tree().root.children[0].action, "subindex")
+
+    def test_refactor_and_sharing(self):
+        a = Datacube()
+        s = a + a
+        c = Datacube.refactor([("red", s), ("green", s * 2)])[[Subset("E", 1, 2)]]
+        root = c.optimize(push_down=True).get_tree().root
+        self.assertEqual(root.action, "refactor")
+        red, green = root.children
+        self.assertIs(green.children[0], red)
+        self.assertIs(red.children[0], red.children[1])
+        self.assertEqual(red.children[0].cube.index, "E(1:2)")
+
+    def test_not_mergeable(self):
+        a = Datacube(index=[Subset("ansi", "2021-04-09")])
+        c = (a * 2)[[Subset("ansi", "2021-04-10")]]
+        root = push_down_subsets(c.get_tree()).root
+        # a sliced axis can not be indexed again, the subindex stays on the leaf
+        self.assertEqual(root.children[0].action, "subindex")
+        self.assertIs(root.children[0].children[0], a.get_tree().root)
+
+    def test_aggregate_operand(self):
+        a = Datacube(index=[Subset("ansi", "2021-04-09")], coverage_name="S2_L2A_32631_B01_60m")
+        c = (a - a.avg(''))[[Subset("E", 669960, 670260), Subset("N", 4990200, 4990320)]]
+        c = c.encode("text/csv")
+        tree = push_down_subsets(c.get_tree())
+        left, right = tree.root.children[0].children
+        self.assertEqual(left.cube.index, 'ansi("2021-04-09"), E(669960:670260), N(4990200:4990320)')
+        # the average of the whole coverage is a scalar, it is not indexed
+        self.assertIs(right, c.get_tree().root.children[0].children[0].children[1])
+        coverages = {"S2_L2A_32631_B01_60m": s2_coverage("S2_L2A_32631_B01_60m")}
+        expected, _ = wcps.evaluate(make_process_query_from_tree(c.get_tree()), coverages)
+        optimized, _ = wcps.evaluate(make_process_query_from_tree(tree), coverages)
+        self.assertEqual(optimized, expected)
+
+    def test_scalar_expression_operand(self):
+        a = Datacube(coverage_name="S2_L2A_32631_B01_60m")
+        c = (a * (a.max() - a.min()))[[Subset("E", 1, 2)]]
+        root = push_down_subsets(c.get_tree()).root
+        left, right = root.children
+        self.assertEqual(left.cube.index, "E(1:2)")
+        self.assertIs(right, c.get_tree().root.children[0].children[1])
+        self.assertNotIn("subindex", make_process_query_from_tree(push_down_subsets(c.get_tree())))
+
+
+if __name__ == '__main__':
+    unittest.main()
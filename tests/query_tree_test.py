@@ -9,6 +9,8 @@ sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
 sys.path.append(sprint_1_directory)
 
 from wdc import Datacube
+from wdc.helpers.subset import Subset
+from wdc.tree.tree_parser import make_process_query_from_tree
 
 
 class TestQueryTree(unittest.TestCase):
@@ -27,5 +29,57 @@ class TestQueryTree(unittest.TestCase):
         self.assertEqual(tmp, str(c))
 
 
+class TestStructuralHash(unittest.TestCase):
+    def build(self):
+        index = [Subset("ansi", "2021-04-09"), Subset("E", 670000, 679000)]
+        a = Datacube(coverage_name="S2_L2A_32631_B08_10m", index=index)
+        b = Datacube(coverage_name="S2_L2A_32631_B04_10m", index=index)
+        return ((a - b) / (a + b) * 2).avg("").encode("text/csv")
+
+    def test_identical_expressions(self):
+        first = self.build().get_tree()
+        second = self.build().get_tree()
+        # different generated names, same structure
+        self.assertNotEqual(make_process_query_from_tree(first),
+                            make_process_query_from_tree(second))
+        self.assertEqual(first.structural_hash(), second.structural_hash())
+        self.assertEqual(first, second)
+        self.assertEqual(len({first, second}), 1)
+
+    def test_different_expressions(self):
+        a = Datacube(coverage_name="S2_L2A_32631_B08_10m")
+        b = Datacube(coverage_name="S2_L2A_32631_B04_10m")
+        trees = [(a + b).get_tree(), (b + a).get_tree(), (a - b).get_tree(),
+                 (a + 2).get_tree(), (a + 3).get_tree(), a.max().get_tree(),
+                 a.max([Subset("ansi", "2021-04-09")]).get_tree(),
+                 Datacube.refactor([("red", a), ("green", b)]).get_tree(),
+                 Datacube.refactor([("red", a), ("blue", b)]).get_tree()]
+        self.assertEqual(len({tree.structural_hash() for tree in trees}), len(trees))
+
+    def test_hash_is_cached(self):
+        a = Datacube()
+        c = a
+        for _ in range(50000):
+            c = c + 1
+        # a deep tree is hashed without recursion, the second call only reads the cache
+        digest = c.get_tree().structural_hash()
+        self.assertIs(c.get_tree().root._digest, digest)
+        self.assertEqual((c + 1).get_tree().root.children[0]._digest, digest)
+
+    def test_nodes_are_immutable(self):
+        a = Datacube()
+        root = (a + 1).get_tree().root
+        digest = root.structural_hash()
+        for name, value in [("action", "-"), ("children", ()), ("params", None), ("_digest", None)]:
+            with self.assertRaises(AttributeError):
+                setattr(root, name, value)
+        with self.assertRaises(AttributeError):
+            del root.children
+        self.assertEqual(root.action, "+")
+        self.assertIs(root.structural_hash(), digest)
+        # copies share the cached hash
+        self.assertIs(root.copy()._digest, digest)
+
+
 if __name__ == '__main__':
     unittest.main()
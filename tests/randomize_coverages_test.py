@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+import numpy as np
+
+from wdc import Datacube
+from wdc.coverage.catalog import CoverageCatalog
+from wdc.coverage.coverage import Coverage
+from wdc.coverage.subcoverages.average_coverage import AverageCoverage
+from wdc.coverage.subcoverages.s2_coverage import S2Coverage
+from wdc.helpers.subset import Subset
+from wdc.standin.coverages import s2_coverage
+from wdc.standin.server import StandInServer
+
+
+def bounds(formatted: str) -> list:
+    '''Bounds of a formatted subset like 'E(1,2)' or 'ansi("2021-04-08")' '''
+    return [value.strip('"') for value in formatted[formatted.index('(') + 1:-1].split(',')]
+
+
+class TestRandomRanges(unittest.TestCase):
+    def test_ordered_and_within_bounds(self):
+        rng = np.random.default_rng(0)
+        low = np.array([0, 5, -10, 7])
+        high = np.array([10, 5, 10, 8])
+        for _ in range(100):
+            first, second = Coverage.random_ranges(rng, low, high)
+            self.assertTrue(np.all(low <= first))
+            self.assertTrue(np.all(first <= second))
+            self.assertTrue(np.all(second <= high))
+            self.assertEqual((first[1], second[1]), (5, 5))
+
+    def test_axis_subsets(self):
+        self.assertEqual(Coverage.axis_subsets("E", np.array([1, 3]), np.array([2, 3])),
+                         ["E(1,2)", "E(3)"])
+        self.assertEqual(Coverage.axis_subsets("ansi", ["2021-04-08", "2021-04-09"],
+                                               ["2021-04-10", "2021-04-09"]),
+                         ['ansi("2021-04-08","2021-04-10")', 'ansi("2021-04-09")'])
+        subsets = Coverage.axis_subsets("E", [1, 3], [2, 3], as_subsets=True)
+        self.assertEqual([subset.query for subset in subsets], ["E(1:2)", "E(3)"])
+        self.assertTrue(subsets[1].is_slice())
+
+
+class TestRandomizeCoverages(unittest.TestCase):
+    def test_s2(self):
+        coverages = S2Coverage.randomize_coverages(1000, seed=1)
+        self.assertEqual(len(coverages), 1000)
+        for name, (ansi, e, n) in coverages:
+            self.assertIn(name, S2Coverage.IDs)
+            self.assertTrue(ansi.startswith('ansi(') and e.startswith('E(') and n.startswith('N('))
+            dates = bounds(ansi)
+            self.assertTrue(all(date in ["2021-04-08", "2021-04-09", "2021-04-10"] for date in dates))
+            self.assertEqual(dates, sorted(dates))
+            for subset, (low, high) in [(e, S2Coverage.E_bounds), (n, S2Coverage.N_bounds)]:
+                values = [int(value) for value in bounds(subset)]
+                self.assertEqual(values, sorted(values))
+                self.assertTrue(low <= values[0] and values[-1] <= high)
+                # a slice only when the bounds are equal
+                self.assertTrue(len(values) == 1 or values[0] < values[1])
+
+    def test_average(self):
+        coverages = AverageCoverage.randomize_coverages(1000, seed=1)
+        self.assertEqual(len(coverages), 1000)
+        for name, (ansi, lat, lon) in coverages:
+            self.assertIn(name, AverageCoverage.IDs)
+            dates = bounds(ansi)
+            self.assertEqual(dates, sorted(dates))
+            for date in dates:
+                self.assertTrue("2015-01-01" <= date <= "2015-04-30")
+                self.assertLessEqual(int(date[-2:]), 30)
+            for subset, (low, high) in [(lat, AverageCoverage.Lat_bounds), (lon, AverageCoverage.Lon_bounds)]:
+                values = [int(value) for value in bounds(subset)]
+                self.assertEqual(values, sorted(values))
+                self.assertTrue(low <= values[0] and values[-1] <= high)
+        # February 29 and 30 are never drawn
+        self.assertFalse(any("2015-02-29" in ansi or "2015-02-30" in ansi
+                             for _, (ansi, _, _) in AverageCoverage.randomize_coverages(5000, seed=2)))
+
+    def test_seed(self):
+        self.assertEqual(S2Coverage.randomize_coverages(50, seed=7), S2Coverage.randomize_coverages(50, seed=7))
+        self.assertEqual(AverageCoverage.randomize_coverages(50, seed=7),
+                         AverageCoverage.randomize_coverages(50, seed=7))
+        self.assertNotEqual(S2Coverage.randomize_coverages(50, seed=7), S2Coverage.randomize_coverages(50, seed=8))
+        self.assertEqual(S2Coverage.randomize_coverages(0, seed=7), [])
+
+    def test_as_subsets(self):
+        coverages = S2Coverage.randomize_coverages(20, seed=3)
+        subsets = S2Coverage.randomize_coverages(20, seed=3, as_subsets=True)
+        for (name, formatted), (subset_name, index) in zip(coverages, subsets):
+            self.assertEqual(name, subset_name)
+            self.assertTrue(all(isinstance(subset, Subset) for subset in index))
+            self.assertEqual([subset.operation for subset in index], ['ansi', 'E', 'N'])
+            self.assertEqual([subset.values for subset in index],
+                             [tuple(bounds(subset)) if i == 0 else tuple(int(value) for value in bounds(subset))
+                              for i, subset in enumerate(formatted)])
+            # usable as the index of a datacube
+            Datacube(index=index, coverage_name=name)
+
+    def test_catalog(self):
+        coverage = s2_coverage("S2_L2A_32631_B01_60m")
+        with StandInServer(coverages=[coverage]) as server:
+            catalog = CoverageCatalog(requester=server.requester())
+            coverages = S2Coverage.randomize_coverages(200, seed=4, catalog=catalog)
+        self.assertEqual({name for name, _ in coverages}, {"S2_L2A_32631_B01_60m"})
+        low, high = catalog.describe("S2_L2A_32631_B01_60m").bounds("N")
+        for _, (_, _, n) in coverages:
+            values = [int(value) for value in bounds(n)]
+            self.assertTrue(low <= values[0] <= values[-1] <= high)
+
+
+if __name__ == '__main__':
+    unittest.main()
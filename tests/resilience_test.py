@@ -0,0 +1,162 @@
+import unittest
+from unittest import mock
+import os
+import sys
+import threading
+import time
+
+import requests
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.requester import ClientRequest
+from wdc.connection.resilience import (Deadline, DeadlineExceeded, HedgePolicy, Resilience,
+                                       RetryPolicy)
+from wdc.connection.transport import Transport
+
+
+def answer(status_code=200, content=b'42'):
+    return mock.Mock(status_code=status_code, content=content, ok=status_code < 400)
+
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        self.transport = Transport()
+        self.requester = ClientRequest(transport=self.transport, resilience=Resilience(
+            RetryPolicy(attempts=3, backoff=0.01)))
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_connection_errors(self):
+        side_effect = [requests.ConnectionError(), requests.Timeout(), answer()]
+        with mock.patch.object(self.transport, 'post', side_effect=side_effect) as post:
+            self.assertEqual(self.requester.evaluate_query("query"), b'42')
+        self.assertEqual(post.call_count, 3)
+
+    def test_server_errors(self):
+        with mock.patch.object(self.transport, 'post', side_effect=[answer(503), answer()]) as post:
+            self.assertEqual(self.requester.evaluate_query("query"), b'42')
+        self.assertEqual(post.call_count, 2)
+        # the last answer is returned when all attempts fail
+        with mock.patch.object(self.transport, 'post', return_value=answer(500, b'error')) as post:
+            self.assertEqual(self.requester.evaluate_query("query"), b'error')
+        self.assertEqual(post.call_count, 3)
+
+    def test_give_up(self):
+        with mock.patch.object(self.transport, 'post', side_effect=requests.ConnectionError()) as post:
+            with self.assertRaises(requests.ConnectionError):
+                self.requester.evaluate_query("query")
+        self.assertEqual(post.call_count, 3)
+        # other errors are not retried
+        with mock.patch.object(self.transport, 'post', side_effect=ValueError()) as post:
+            with self.assertRaises(ValueError):
+                self.requester.evaluate_query("query")
+        self.assertEqual(post.call_count, 1)
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=0.1, max_backoff=0.3, jitter=False)
+        self.assertEqual([policy.delay(i) for i in range(1, 5)], [0.1, 0.2, 0.3, 0.3])
+        policy = RetryPolicy(backoff=0.1, jitter=True)
+        self.assertTrue(all(0 <= policy.delay(3) <= 0.4 for _ in range(20)))
+
+
+class TestHedgeAndDeadline(unittest.TestCase):
+    def setUp(self):
+        self.transport = Transport()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_hedge(self):
+        calls = []
+        lock = threading.Lock()
+
+        def post(url, data=None, **kwargs):
+            with lock:
+                calls.append(time.monotonic())
+                first = len(calls) == 1
+            # the first request hangs, the duplicate answers at once
+            time.sleep(1.0 if first else 0.0)
+            return answer(content=b'first' if first else b'hedged')
+
+        resilience = Resilience(hedge=HedgePolicy(initial_delay=0.05))
+        requester = ClientRequest(transport=self.transport, resilience=resilience)
+        start = time.monotonic()
+        with mock.patch.object(self.transport, 'post', side_effect=post):
+            self.assertEqual(requester.evaluate_query("query"), b'hedged')
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(calls), 2)
+        resilience.close()
+
+    def test_hedge_error_does_not_win(self):
+        calls = []
+        lock = threading.Lock()
+
+        def post(url, data=None, **kwargs):
+            with lock:
+                calls.append(time.monotonic())
+                first = len(calls) == 1
+            # the first request is slow but succeeds, the duplicate fails at once
+            if first:
+                time.sleep(0.3)
+                return answer(content=b'slow')
+            return answer(503, b'error')
+
+        resilience = Resilience(RetryPolicy(attempts=3, backoff=0.01),
+                                hedge=HedgePolicy(initial_delay=0.05, max_hedges=1))
+        requester = ClientRequest(transport=self.transport, resilience=resilience)
+        with mock.patch.object(self.transport, 'post', side_effect=post):
+            self.assertEqual(requester.evaluate_query("query"), b'slow')
+        self.assertEqual(len(calls), 2)
+        resilience.close()
+
+    def test_hedge_percentile(self):
+        policy = HedgePolicy(percentile=90, min_samples=10)
+        self.assertIsNone(policy.delay())
+        for latency in range(1, 11):
+            policy.record(latency / 10)
+        self.assertEqual(policy.delay(), 1.0)
+
+    def test_deadline(self):
+        timeouts = []
+
+        def post(url, data=None, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            time.sleep(1.0)
+            return answer()
+
+        requester = ClientRequest(transport=self.transport)
+        start = time.monotonic()
+        with mock.patch.object(self.transport, 'post', side_effect=post):
+            with self.assertRaises(DeadlineExceeded):
+                requester.evaluate_query("query", deadline=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        # the timeouts of the connection are limited by the deadline
+        self.assertLessEqual(max(timeouts[0]), 0.1)
+        requester.resilience.close()
+
+    def test_batch_deadline(self):
+        class Requester:
+            def evaluate_query(self, query, deadline=None):
+                if 'SLOW' in query:
+                    time.sleep(1.0)
+                return b'ok'
+
+        cubes = [Datacube(coverage_name=name) for name in ["FAST_1", "SLOW", "FAST_2"]]
+        for cube in cubes:
+            cube.requester = Requester()
+        start = time.monotonic()
+        results = Datacube.fetch_many(cubes, deadline=Deadline(0.2))
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertIsInstance(results[1].error, DeadlineExceeded)
+        unordered = list(Datacube.fetch_many(cubes, ordered=False, deadline=0.2))
+        self.assertEqual(sorted(r.ok for r in unordered), [False, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
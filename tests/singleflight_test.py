@@ -0,0 +1,137 @@
+import unittest
+from unittest import mock
+import os
+import sys
+import threading
+import time
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.requester import ClientRequest
+from wdc.connection.resilience import Resilience, RetryPolicy
+from wdc.connection.singleflight import SingleFlight, normalize_query, tree_key
+from wdc.connection.transport import Transport
+from wdc.helpers.subset import Subset
+
+
+class SlowServer:
+    """Answers every query after a delay and counts the requests"""
+    def __init__(self, delay=0.2, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return mock.Mock(status_code=200, ok=True, content=data['query'].encode())
+
+
+def build(requester, coverage_name="S2_L2A_32631_B04_60m"):
+    """A separately built expression, its datacubes get new generated names"""
+    a = Datacube(coverage_name=coverage_name, index=[Subset("E", 669960, 670260)])
+    b = Datacube(coverage_name=coverage_name)
+    cube = (a * 2 + b).max()
+    cube.requester = requester
+    return cube
+
+
+def run_concurrently(function, arguments):
+    results = [None] * len(arguments)
+
+    def target(i):
+        try:
+            results[i] = function(arguments[i])
+        except Exception as error:
+            results[i] = error
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(len(arguments))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    def test_whitespace(self):
+        self.assertEqual(normalize_query("  for $c in (A)\n\treturn   avg($c) "),
+                         "for $c in (A) return avg($c)")
+        # string literals are kept as they are
+        self.assertEqual(normalize_query('encode($c,  "text/csv  ")'), 'encode($c, "text/csv  ")')
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.transport = Transport()
+        self.server = SlowServer()
+        self.requester = ClientRequest(transport=self.transport,
+                                       resilience=Resilience(RetryPolicy(attempts=1)))
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_identical_expressions_share_one_request(self):
+        cubes = [build(self.requester) for _ in range(8)]
+        # the generated names differ, the structure does not
+        self.assertEqual(len({cube.explain().query for cube in cubes}), 8)
+        self.assertEqual(len({tree_key(cube.get_tree()) for cube in cubes}), 1)
+        with mock.patch.object(self.transport, 'post', side_effect=self.server.post):
+            results = run_concurrently(lambda cube: cube.fetch(), cubes)
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.transport.single_flight.in_flight(), 0)
+
+    def test_different_expressions_and_requesters(self):
+        other = ClientRequest(transport=self.transport)
+        cubes = [build(self.requester, "A"), build(other, "B"), build(self.requester, "A"),
+                 build(other, "B")]
+        with mock.patch.object(self.transport, 'post', side_effect=self.server.post):
+            results = run_concurrently(lambda cube: cube.fetch(), cubes)
+        self.assertEqual(self.server.calls, 2)
+        self.assertEqual([b'(A)' in result for result in results], [True, False, True, False])
+        self.assertEqual([b'(B)' in result for result in results], [False, True, False, True])
+
+    def test_error_reaches_every_waiter(self):
+        self.server.error = ValueError("broken")
+        cubes = [build(self.requester) for _ in range(4)]
+        with mock.patch.object(self.transport, 'post', side_effect=self.server.post):
+            results = run_concurrently(lambda cube: cube.fetch(), cubes)
+        self.assertEqual(self.server.calls, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        # nothing is remembered once the call is completed
+        self.server.error = None
+        with mock.patch.object(self.transport, 'post', side_effect=self.server.post):
+            self.assertIn(b'max(', build(self.requester).fetch())
+        self.assertEqual(self.server.calls, 2)
+
+    def test_disabled(self):
+        requester = ClientRequest(transport=self.transport, coalesce=False)
+        with mock.patch.object(self.transport, 'post', side_effect=self.server.post):
+            run_concurrently(lambda cube: cube.fetch(), [build(requester) for _ in range(3)])
+        self.assertEqual(self.server.calls, 3)
+
+    def test_waiter_timeout(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.3)
+            return 1
+        thread = threading.Thread(target=flight.do, args=("key", slow))
+        thread.start()
+        started.wait()
+        with self.assertRaises(TimeoutError):
+            flight.do("key", slow, timeout=0.05)
+        thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
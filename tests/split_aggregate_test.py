@@ -0,0 +1,95 @@
+import unittest
+import os
+import re
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers.subset import Subset
+from wdc.helpers.tiling import split_domain
+from fakes import FakeCatalog, FakeRequester
+
+DATES = [f"2021-04-{day:02d}T00:00:00.000Z" for day in range(1, 11)]
+VALUES = [3, 9, 4, 1, 7, 5, 8, 2, 6, 10]
+E0 = 669960
+
+
+class AggregateServer(FakeRequester):
+    """Requester that computes the aggregate of VALUES over the dates (or E cells) of a query"""
+    def __init__(self, axis):
+        super().__init__()
+        self.axis = axis
+
+    def answer(self, query):
+        if self.axis == "ansi":
+            low, high = re.findall(r'ansi\("([^"]+)":"([^"]+)"\)', query)[-1]
+            cells = [v for d, v in zip(DATES, VALUES) if low <= d <= high]
+        else:
+            low, high = map(float, re.findall(r'E\(([\d.]+):([\d.]+)\)', query)[-1])
+            cells = [v for i, v in enumerate(VALUES) if low <= E0 + 60 * i + 30 <= high]
+        if re.search(r':= 0[,\n]', query):
+            return str(len(cells)).encode()
+        aggregate = re.search(r'(add|min|max)\(', query).group(1)
+        return str({'add': sum, 'min': min, 'max': max}[aggregate](cells)).encode()
+
+
+CATALOG = FakeCatalog(['ansi', 'E'], [DATES[0], E0], [DATES[-1], E0 + 600],
+                      resolution=[None, 60], grid_size=[10, 10], coefficients={'ansi': DATES})
+
+
+class TestSplitDomain(unittest.TestCase):
+    def test_dates(self):
+        windows = split_domain('ansi', "2021-04-02", "2021-04-08", 3, coefficients=DATES)
+        self.assertEqual([w.query for w in windows],
+                         [f'ansi("{DATES[1]}":"{DATES[3]}")', f'ansi("{DATES[4]}":"{DATES[6]}")',
+                          f'ansi("{DATES[7]}":"{DATES[7]}")'])
+
+    def test_grid(self):
+        windows = split_domain('E', 0, 600, 4, resolution=60, origin=0)
+        self.assertEqual([w.query for w in windows],
+                         ['E(30:150)', 'E(210:330)', 'E(390:510)', 'E(570:570)'])
+
+
+class TestSplitAggregate(unittest.TestCase):
+    def bind(self, cube, server):
+        cube.requester = server
+        return cube
+
+    def test_avg_over_dates(self):
+        server = AggregateServer("ansi")
+        cube = Datacube(coverage_name="AvgLandTemp").avg('ansi("2021-04-01":"2021-04-10")')
+        self.bind(cube, server)
+        result = cube.fetch_split("ansi", parts=4, catalog=CATALOG)
+        self.assertAlmostEqual(result, sum(VALUES) / len(VALUES))
+        # a sum and a count for every part
+        self.assertEqual(len(server.queries), 8)
+        self.assertTrue(all(query.count("add(") == 1 for query in server.queries))
+
+    def test_min_max_sum(self):
+        server = AggregateServer("ansi")
+        cube = Datacube(coverage_name="AvgLandTemp")
+        window = [Subset("ansi", "2021-04-03", "2021-04-07")]
+        self.assertEqual(self.bind(cube.min(window), server).fetch_split("ansi", 2, CATALOG),
+                         min(VALUES[2:7]))
+        self.assertEqual(self.bind(cube.max(window), server).fetch_split("ansi", 2, CATALOG),
+                         max(VALUES[2:7]))
+        self.assertEqual(self.bind(cube.sum(window), server).fetch_split("ansi", 3, CATALOG),
+                         sum(VALUES[2:7]))
+
+    def test_spatial_window_of_leaf(self):
+        server = AggregateServer("E")
+        cube = Datacube(index=[Subset("E", E0, E0 + 600)], coverage_name="AvgLandTemp").max()
+        self.bind(cube, server)
+        self.assertEqual(cube.fetch_split("E", parts=3, catalog=CATALOG), max(VALUES))
+        self.assertEqual(len(server.queries), 3)
+
+    def test_not_an_aggregate(self):
+        with self.assertRaises(ValueError):
+            Datacube().fetch_split("ansi", catalog=CATALOG)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,313 @@
+import unittest
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.resilience import Resilience, RetryPolicy
+from wdc.connection.transport import Transport
+from wdc.coverage.catalog import CoverageCatalog, CoverageDescription
+from wdc.helpers import tiling
+from wdc.helpers.subset import Subset
+from wdc.standin import wcps
+from wdc.standin.coverages import SyntheticAxis, average_coverage, s2_coverage
+from wdc.standin.server import StandInServer
+from wdc.tree.tree_parser import make_process_query_from_tree
+
+WINDOW = [Subset('ansi', "2021-04-09"), Subset('E', 669960, 670260), Subset('N', 4990200, 4990320)]
+
+
+class TestSyntheticCoverages(unittest.TestCase):
+    def test_cells_follow_the_grid_of_split_axis(self):
+        axis = SyntheticAxis('E', 669960, 729960, 60)
+        for low, high in [(669960, 670260), (670000, 670100), (669990, 669991), (729900, 729960)]:
+            offset = tiling.split_axis(low, high, 60, 1 << 62, 669960)[0]
+            start, stop = axis.cells(low, high)
+            self.assertEqual(stop - start, offset[1])
+        self.assertEqual(axis.cell(669960), 0)
+        self.assertEqual(axis.cell(729960), 999)
+        with self.assertRaises(ValueError):
+            axis.cells(600000, 600100)
+
+    def test_descending_axis(self):
+        axis = SyntheticAxis('N', 4990200, 5015220, 60, descending=True)
+        self.assertEqual(axis.size, 417)
+        # the northern cells come first
+        self.assertEqual(axis.cell(5015220), 0)
+        self.assertEqual(axis.cell(4990200), 416)
+        self.assertEqual(axis.cells(4990200, 4990320), (415, 417))
+
+    def test_dates(self):
+        coverage = average_coverage("AvgLandTemp")
+        ansi = coverage.axis('ansi')
+        self.assertEqual(ansi.cells("2015-01", "2015-01"), (0, 31))
+        self.assertEqual(ansi.cell("2015-02-01"), 31)
+        with self.assertRaises(ValueError):
+            ansi.cell("2015-02-30")
+
+    def test_description(self):
+        description = CoverageDescription.from_xml(s2_coverage("S2_L2A_32631_B12_20m").describe_xml())
+        self.assertEqual(description.coverage_id, "S2_L2A_32631_B12_20m")
+        self.assertEqual(description.axis_labels, ['ansi', 'E', 'N'])
+        self.assertEqual(description.lower_bounds[1:], [669960, 4990200])
+        self.assertEqual(description.upper_bounds[1:], [729960, 5015220])
+        self.assertEqual(description.resolution, [None, 20, 20])
+        self.assertEqual(description.grid_size, [3, 3000, 1251])
+        self.assertEqual(len(description.coefficients['ansi']), 3)
+        self.assertEqual(description.bands, [('B12', 'unsignedShort')])
+        description = CoverageDescription.from_xml(average_coverage("AvgTemperatureColor").describe_xml())
+        self.assertEqual(description.axis_labels, ['ansi', 'Lat', 'Lon'])
+        self.assertEqual([band for band, _ in description.bands], ['red', 'green', 'blue'])
+
+    def test_read_is_the_same_for_every_window(self):
+        coverage = s2_coverage("S2_L2A_32631_TCI_60m")
+        full = coverage.read([1, (0, 20), (0, 10)])
+        part = coverage.read([1, (5, 8), (2, 4)])
+        self.assertEqual(full.dtype.names, ('red', 'green', 'blue'))
+        np.testing.assert_array_equal(part, full[5:8, 2:4])
+
+
+class TestWCPS(unittest.TestCase):
+    def setUp(self):
+        self.coverages = {coverage.coverage_id: coverage for coverage in
+                          [s2_coverage("S2_L2A_32631_B04_10m"), s2_coverage("S2_L2A_32631_B08_10m")]}
+        self.a = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B04_10m")
+        self.b = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B08_10m")
+
+    def evaluate(self, cube):
+        return wcps.evaluate(make_process_query_from_tree(cube.get_tree()), self.coverages)
+
+    def window(self, coverage_id):
+        body, _ = wcps.get_coverage(self.coverages[coverage_id], WINDOW, 'application/octet-stream')
+        return np.frombuffer(body, '<u2').reshape(30, 12)
+
+    def test_arithmetic(self):
+        a = self.window("S2_L2A_32631_B04_10m")
+        b = self.window("S2_L2A_32631_B08_10m")
+        body, content_type = self.evaluate(((self.a + self.b) * 2 - 1).encode("application/octet-stream"))
+        self.assertEqual(content_type, 'application/octet-stream')
+        expected = (a + b) * 2 - 1
+        np.testing.assert_array_equal(np.frombuffer(body, '<u2').reshape(30, 12), expected)
+        body, _ = self.evaluate((self.a / self.b).encode("text/csv"))
+        self.assertEqual(body.count(b'{'), 31)
+
+    def test_aggregates_and_subindex(self):
+        a = self.window("S2_L2A_32631_B04_10m")
+        self.assertEqual(self.evaluate(self.a.max())[0], str(a.max()).encode())
+        self.assertEqual(float(self.evaluate(self.a.avg(""))[0]), a.mean())
+        self.assertEqual(int(self.evaluate(self.a.sum())[0]), int(a.sum()))
+        self.assertEqual(int(self.evaluate(self.a.min([Subset('E', 669960, 670000)]))[0]),
+                         a[:4].min())
+        body, _ = self.evaluate(self.a[[Subset('E', 670000, 670100)]].encode("application/json"))
+        self.assertEqual(np.asarray(json.loads(body)).shape, (10, 12))
+
+    def test_errors(self):
+        with self.assertRaises(wcps.WCPSError):
+            wcps.evaluate('for $c0 in (Missing) return $c0', self.coverages)
+        with self.assertRaises(wcps.WCPSError):
+            self.evaluate(self.a.encode("application/netcdf"))
+        with self.assertRaises(wcps.WCPSError):
+            wcps.evaluate('for $c0 in (S2_L2A_32631_B04_10m) return encode($c0[E(1:2)], "csv")',
+                          self.coverages)
+        with self.assertRaises(wcps.WCPSError):
+            # a 3D result is not an image
+            self.evaluate(Datacube(index=WINDOW[1:], coverage_name="S2_L2A_32631_B04_10m")
+                          .encode("image/png"))
+
+
+class TestStandInServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.transport = Transport()
+        self.requester = self.server.requester(transport=self.transport)
+        self.previous = Datacube.requester
+        Datacube.requester = self.requester
+
+    def tearDown(self):
+        Datacube.requester = self.previous
+        self.transport.close()
+
+    def test_wcs_requests(self):
+        self.assertEqual(self.requester.get_capabilities().status_code, 200)
+        self.assertEqual(self.requester.describe_coverage("S2_L2A_32631_TCI_60m").status_code, 200)
+        self.assertEqual(self.requester.describe_coverage("Missing").status_code, 404)
+        subsets = ["ansi(\"2021-04-09\")", "E(669960,729960)", "N(4990200,5015220)"]
+        response = self.requester.get_subset_coverage("S2_L2A_32631_TCI_60m", subsets, "jpeg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'image/jpeg')
+
+    def test_catalog(self):
+        catalog = CoverageCatalog(self.requester, ttl=0)
+        self.assertIn("S2_L2A_32631_B01_60m", catalog.coverage_ids())
+        self.assertIn("AvgLandTemp", catalog.coverage_ids())
+        self.assertIn('application/octet-stream', catalog.formats())
+        description = catalog.describe("AvgLandTemp")
+        self.assertEqual(description.grid_size, [121, 180, 360])
+        # revalidated with the ETag, the server answers 304
+        self.assertIs(catalog.describe("AvgLandTemp"), description)
+
+    def test_fetch_matches_the_local_engine(self):
+        catalog = CoverageCatalog(self.requester)
+        a = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B04_10m")
+        b = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B08_10m")
+        bindings = {a.name: a.encode("auto").fetch_array(catalog=catalog),
+                    b.name: b.encode("application/json").fetch_array(catalog=catalog)}
+        self.assertEqual(bindings[a.name].encode_format, 'application/octet-stream')
+        cube = (a - b) * 3 + a
+        remote = cube.encode("application/octet-stream").fetch_array(catalog=catalog, shape=(30, 12))
+        local = cube.evaluate_local({a.name: bindings[a.name],
+                                     b.name: np.asarray(bindings[b.name].data, dtype='<u2')})
+        np.testing.assert_array_equal(remote.data, local.data)
+
+    def test_tiled_fetch_is_the_full_image(self):
+        catalog = CoverageCatalog(self.requester)
+        cube = Datacube(index=[Subset('ansi', "2021-04-09"), Subset('E', 669960, 689960),
+                               Subset('N', 4990200, 5015220)],
+                        coverage_name="S2_L2A_32631_TCI_60m").encode("image/png")
+        full = cube.fetch_array(catalog=catalog)
+        self.assertEqual(full.shape, (417, 334, 3))
+        np.testing.assert_array_equal(cube.fetch_tiled(tile_size=128, catalog=catalog), full.data)
+
+    def test_gzip(self):
+        cube = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B04_10m").encode("text/csv")
+        content, report = self.requester.evaluate_query_with_report(
+            make_process_query_from_tree(cube.get_tree()))
+        self.assertEqual(report.content_encoding, 'gzip')
+        self.assertLess(report.wire_bytes, len(content))
+
+    def test_query_error(self):
+        response = self.transport.post(self.server.endpoint, data={'query': 'for $c0 in (Missing) return $c0'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'ExceptionReport', response.content)
+
+
+class TestServerLimits(unittest.TestCase):
+    def query(self, server, transport, latitude=0):
+        cube = Datacube(index=[Subset('ansi', "2015-01-01"), Subset('Lat', latitude, latitude + 1),
+                               Subset('Lon', 0, 10)], coverage_name="AvgLandTemp")
+        return server.requester(transport=transport, coalesce=False).evaluate_query(
+            make_process_query_from_tree(cube.encode("text/csv").get_tree()))
+
+    def run_parallel(self, server, transport, count):
+        results = [None] * count
+
+        def run(i):
+            try:
+                results[i] = self.query(server, transport, i)
+            except Exception as error:
+                results[i] = error
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - start
+
+    def test_latency(self):
+        with StandInServer(latency=0.2) as server:
+            transport = Transport()
+            start = time.perf_counter()
+            self.query(server, transport)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+            transport.close()
+
+    def test_concurrency_limit(self):
+        with StandInServer(latency=0.1, max_concurrency=2) as server:
+            transport = Transport()
+            results, elapsed = self.run_parallel(server, transport, 6)
+            transport.close()
+            self.assertTrue(all(result.startswith(b'{') for result in results))
+            self.assertEqual(server.stats['peak_concurrency'], 2)
+            # three rounds of two requests
+            self.assertGreaterEqual(elapsed, 0.29)
+
+    def test_reject_when_busy(self):
+        with StandInServer(latency=0.2, max_concurrency=1, reject_when_busy=True) as server:
+            transport = Transport()
+            cube = Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B04_10m").encode("text/csv")
+            query = make_process_query_from_tree(cube.get_tree())
+            responses = []
+            threads = [threading.Thread(target=lambda: responses.append(
+                transport.post(server.endpoint, data={'query': query}).status_code)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            transport.close()
+            self.assertIn(200, responses)
+            self.assertIn(503, responses)
+            self.assertEqual(server.stats['rejected'], responses.count(503))
+
+    def test_error_rate_is_repeatable_and_retried(self):
+        counts = []
+        for _ in range(2):
+            with StandInServer(error_rate=0.3, seed=7) as server:
+                transport = Transport()
+                resilience = Resilience(retry=RetryPolicy(attempts=10, backoff=0.0, jitter=False))
+                requester = server.requester(transport=transport, resilience=resilience)
+                query = make_process_query_from_tree(
+                    Datacube(index=WINDOW, coverage_name="S2_L2A_32631_B04_10m").max().get_tree())
+                for _ in range(20):
+                    self.assertTrue(requester.evaluate_query(query).isdigit())
+                transport.close()
+                resilience.close()
+                counts.append(server.stats['failed'])
+        self.assertGreater(counts[0], 0)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_failed_requests_are_errors(self):
+        with StandInServer(error_rate=1.0) as server:
+            transport = Transport()
+            resilience = Resilience(retry=RetryPolicy(attempts=2, backoff=0.0, jitter=False))
+            requester = server.requester(transport=transport, resilience=resilience)
+            cubes = [Datacube(index=WINDOW, coverage_name=name).max()
+                     for name in ["S2_L2A_32631_B04_10m", "S2_L2A_32631_B08_10m"]]
+            with self.assertRaises(requests.HTTPError) as context:
+                requester.evaluate_query(make_process_query_from_tree(cubes[0].get_tree()))
+            self.assertEqual(context.exception.response.status_code, 503)
+            previous = Datacube.requester
+            Datacube.requester = requester
+            try:
+                results = Datacube.fetch_many(cubes)
+            finally:
+                Datacube.requester = previous
+            transport.close()
+            resilience.close()
+            self.assertEqual([result.ok for result in results], [False, False])
+            self.assertTrue(all(isinstance(result.error, requests.HTTPError) for result in results))
+
+    def test_bandwidth(self):
+        with StandInServer(bandwidth=200000, compress=False) as server:
+            transport = Transport(compress=False)
+            cube = Datacube(index=[Subset('ansi', "2021-04-09"), Subset('E', 669960, 671960),
+                                   Subset('N', 4990200, 4992700)],
+                            coverage_name="S2_L2A_32631_B04_10m").encode("application/octet-stream")
+            start = time.perf_counter()
+            content = server.requester(transport=transport).evaluate_query(
+                make_process_query_from_tree(cube.get_tree()))
+            elapsed = time.perf_counter() - start
+            transport.close()
+            self.assertEqual(len(content), 200 * 250 * 2)
+            # 100 kB at 200 kB/s
+            self.assertGreaterEqual(elapsed, 0.45)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from unittest import mock
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.requester import ClientRequest
+from wdc.connection.resilience import DeadlineExceeded, Resilience, RetryPolicy
+from wdc.connection.transport import Transport
+
+
+PAYLOAD = bytes(range(256)) * 1000
+
+
+class FakeStreamResponse:
+    def __init__(self, payload, status_code=200, delay=0.0):
+        self.payload = payload
+        self.status_code = status_code
+        # seconds before every chunk
+        self.delay = delay
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Server Error", response=self)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.payload), chunk_size):
+            time.sleep(self.delay)
+            yield self.payload[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.transport = Transport()
+        self.response = FakeStreamResponse(PAYLOAD)
+        self.patch = mock.patch.object(self.transport, 'post', return_value=self.response)
+        self.post = self.patch.start()
+        self.cube = Datacube().encode("image/tiff")
+        self.cube.requester = ClientRequest(transport=self.transport)
+
+    def tearDown(self):
+        self.patch.stop()
+        self.transport.close()
+
+    def test_fetch_stream(self):
+        chunks = list(self.cube.fetch_stream(chunk_size=4096))
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual(b''.join(chunks), PAYLOAD)
+        self.assertTrue(self.post.call_args.kwargs['stream'])
+        self.assertTrue(self.response.closed)
+
+    def test_fetch_to_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'result.tif')
+            written = self.cube.fetch_to(path, chunk_size=1000)
+            self.assertEqual(written, len(PAYLOAD))
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), PAYLOAD)
+            self.assertEqual(os.listdir(directory), ['result.tif'])
+
+    def test_concurrent_fetch_to_same_path(self):
+        # the chunks arrive slowly, so both fetches write at the same time
+        self.response.delay = 0.002
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'result.tif')
+            results = []
+
+            def fetch():
+                try:
+                    results.append(self.cube.fetch_to(path, chunk_size=10000))
+                except Exception as error:
+                    results.append(error)
+            threads = [threading.Thread(target=fetch) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results, [len(PAYLOAD)] * 2)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), PAYLOAD)
+            self.assertEqual(os.listdir(directory), ['result.tif'])
+
+    def test_retried_until_the_answer_starts(self):
+        failed = FakeStreamResponse(b'', status_code=503)
+        self.post.side_effect = [failed, self.response]
+        self.cube.requester.resilience = Resilience(RetryPolicy(attempts=2, backoff=0.01))
+        self.assertEqual(b''.join(self.cube.fetch_stream()), PAYLOAD)
+        self.assertEqual(self.post.call_count, 2)
+        self.assertTrue(failed.closed)
+        # without retries left the error status is raised
+        self.post.side_effect = [FakeStreamResponse(b'', status_code=503)] * 2
+        with self.assertRaises(requests.HTTPError):
+            list(self.cube.fetch_stream())
+
+    def test_deadline(self):
+        def hung(url, **kwargs):
+            time.sleep(1.0)
+            return self.response
+        self.post.side_effect = hung
+        self.cube.requester.resilience = Resilience(RetryPolicy(attempts=1))
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            list(self.cube.fetch_stream(deadline=0.1))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.cube.requester.resilience.close()
+
+    def test_fetch_to_file_object(self):
+        buffer = io.BytesIO()
+        self.assertEqual(self.cube.fetch_to(buffer), len(PAYLOAD))
+        self.assertEqual(buffer.getvalue(), PAYLOAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import io
+import os
+import re
+import sys
+
+import numpy as np
+from PIL import Image
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers.subset import Subset
+from wdc.helpers.tiling import split_axis, make_tiles
+from fakes import FakeCatalog, FakeRequester
+
+E0, N0, RESOLUTION = 669960, 4990200, 60
+HEIGHT, WIDTH = 30, 40
+# synthetic coverage, north up: row 0 is the northern edge
+IMAGE = (np.arange(HEIGHT * WIDTH, dtype=np.uint32).reshape(HEIGHT, WIDTH) % 251).astype(np.uint8)
+TRIM = re.compile(r'E\(([\d.]+):([\d.]+)\), N\(([\d.]+):([\d.]+)\)')
+
+
+class TileServer(FakeRequester):
+    """Requester that cuts the requested tile out of IMAGE and returns it as PNG"""
+    def __init__(self, fail_once=None):
+        super().__init__()
+        self.fail_once = fail_once
+
+    def answer(self, query):
+        e_low, e_high, n_low, n_high = map(float, TRIM.findall(query)[-1])
+        if self.fail_once is not None and e_low == self.fail_once:
+            self.fail_once = None
+            raise ConnectionError("connection reset")
+        columns = slice(int((e_low - E0) // RESOLUTION), int((e_high - E0) // RESOLUTION) + 1)
+        rows = slice(HEIGHT - 1 - int((n_high - N0) // RESOLUTION),
+                     HEIGHT - int((n_low - N0) // RESOLUTION))
+        output = io.BytesIO()
+        Image.fromarray(IMAGE[rows, columns]).save(output, format='PNG')
+        return output.getvalue()
+
+
+CATALOG = FakeCatalog(['ansi', 'E', 'N'], ['2021-04-09', E0, N0],
+                      ['2021-04-09', E0 + WIDTH * RESOLUTION, N0 + HEIGHT * RESOLUTION],
+                      resolution=[None, RESOLUTION, RESOLUTION])
+
+
+def make_cube(server):
+    cube = Datacube(index=[Subset('E', E0, E0 + WIDTH * RESOLUTION),
+                           Subset('N', N0, N0 + HEIGHT * RESOLUTION)],
+                    coverage_name="S2_L2A_32631_B01_60m").encode("image/png")
+    cube.requester = server
+    return cube
+
+
+class TestSplit(unittest.TestCase):
+    def test_split_axis(self):
+        parts = split_axis(0, 100, 10, 4)
+        self.assertEqual([(offset, count) for offset, count, _, _ in parts], [(0, 4), (4, 4), (8, 2)])
+        # bounds are centres of the first and last cells of a part
+        self.assertEqual(parts[0][2:], (5, 35))
+        self.assertEqual(parts[2][2:], (85, 95))
+
+    def test_split_axis_aligned_to_origin(self):
+        # the trim starts inside a cell, the cell is taken as a whole
+        parts = split_axis(15, 40, 10, 100, origin=0)
+        self.assertEqual(parts, [(0, 3, 15, 35)])
+
+    def test_make_tiles(self):
+        shape, tiles = make_tiles({'E': (0, 100), 'N': (0, 50)}, ('E', 'N'), {'E': 10, 'N': 10}, 4)
+        self.assertEqual(shape, (5, 10))
+        self.assertEqual(len(tiles), 6)
+        # the lowest N values are the last rows
+        self.assertEqual((tiles[0].row, tiles[0].height), (1, 4))
+        self.assertEqual(tiles[0].subsets[1].query, 'N(5:35)')
+
+
+class TestTiledFetch(unittest.TestCase):
+    def test_stitched_with_catalog(self):
+        server = TileServer()
+        result = make_cube(server).fetch_tiled(tile_size=16, catalog=CATALOG, max_workers=4)
+        self.assertEqual(len(server.queries), 6)
+        self.assertTrue(all('encode(' in query for query in server.queries))
+        np.testing.assert_array_equal(result, IMAGE)
+
+    def test_retry_failed_tile(self):
+        server = TileServer(fail_once=E0 + 16 * RESOLUTION + RESOLUTION / 2)
+        result = make_cube(server).fetch_tiled(tile_size=(16, 8), resolution={'E': 60, 'N': 60})
+        self.assertEqual(len(server.queries), 3 * 4 + 1)
+        np.testing.assert_array_equal(result, IMAGE)
+
+    def test_not_encoded(self):
+        with self.assertRaises(ValueError):
+            Datacube().fetch_tiled(resolution={'E': 60, 'N': 60})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import json
+import os
+import re
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.helpers.subset import Subset
+from wdc.helpers.tiling import cell_positions
+from fakes import FakeCatalog, FakeRequester
+
+DATES = [f"2021-04-{day:02d}T00:00:00.000Z" for day in (1, 2, 5, 6, 9, 12)]
+E0 = 669960
+N0 = 4990200
+
+
+class TimeSeriesServer(FakeRequester):
+    """Requester that answers a trim of ansi with JSON, the value of a cell is 100 * date + E"""
+    def answer(self, query):
+        low, high = re.search(r'ansi\("([^"]+)":"([^"]+)"\)', query).groups()
+        days = [int(d[8:10]) for d in DATES if low <= d[:len(low)] and d[:len(high)] <= high]
+        e_slice = re.search(r'E\((\d+)\)', query)
+        columns = [int(e_slice.group(1))] if e_slice else [0, 1, 2]
+        values = [[100 * day + column for column in columns] for day in days]
+        if e_slice:
+            values = [row[0] for row in values]
+        return json.dumps(values).encode()
+
+
+CATALOG = FakeCatalog(['ansi', 'E', 'N'], [DATES[0], E0, N0], [DATES[-1], E0 + 180, N0 + 60],
+                      resolution=[None, 60, 60], grid_size=[len(DATES), 3, 1],
+                      coefficients={'ansi': DATES})
+
+
+class TestTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.server = TimeSeriesServer()
+        self.cube = Datacube(coverage_name="S2_L2A_32631_B04_60m")
+        self.cube.requester = self.server
+
+    def test_pixel(self):
+        result = self.cube.timeseries(["2021-04-09", "2021-04-02", "2021-04-05"],
+                                      window=[Subset("E", 1), Subset("N", N0)], catalog=CATALOG)
+        # one query for all dates
+        self.assertEqual(len(self.server.queries), 1)
+        self.assertIn('ansi("2021-04-02":"2021-04-09")', self.server.queries[0])
+        self.assertEqual(result.data.tolist(), [901, 201, 501])
+        self.assertEqual(result.coordinates['ansi'], [DATES[4], DATES[1], DATES[2]])
+        self.assertEqual(result.axis_labels, ['ansi'])
+
+    def test_window(self):
+        result = self.cube.timeseries([("2021", "04", "12"), ("2021", "04", "01")],
+                                      window=[Subset("N", N0)], catalog=CATALOG)
+        self.assertEqual(result.shape, (2, 3))
+        self.assertEqual(result.data[:, 0].tolist(), [1200, 100])
+        self.assertEqual(result.axis_labels, ['ansi', 'E'])
+        # the parts of a tuple can be numbers
+        numbers = self.cube.timeseries([(2021, 4, 12), (2021, 4, 1)], window=[Subset("N", N0)],
+                                       catalog=CATALOG)
+        self.assertEqual(numbers.data.tolist(), result.data.tolist())
+        self.assertEqual(numbers.coordinates['ansi'], result.coordinates['ansi'])
+
+    def test_without_catalog(self):
+        result = self.cube.timeseries(["2021-04-06", "2021-04-05"], window=[Subset("E", 2)])
+        self.assertEqual(result.data.tolist(), [602, 502])
+        # the trim contains dates that were not requested
+        with self.assertRaises(ValueError):
+            self.cube.timeseries(["2021-04-01", "2021-04-12"], window=[Subset("E", 2)])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.cube.timeseries(["2021-13-01"])
+        with self.assertRaises(ValueError):
+            self.cube.timeseries(["2021-04-03"], window=[Subset("E", 1)], catalog=CATALOG)
+        with self.assertRaises(ValueError):
+            self.cube.timeseries([])
+        for date in [(2021, 2, 30), (2021, 4), ("2021", "April", "09")]:
+            with self.assertRaises(ValueError):
+                self.cube.timeseries([date])
+
+    def test_cell_positions(self):
+        self.assertEqual(cell_positions(DATES, ["2021-04-12", DATES[0], "2021-04"]), [5, 0, 0])
+        self.assertEqual(cell_positions([10, 20], [20]), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
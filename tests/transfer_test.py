@@ -0,0 +1,158 @@
+import unittest
+import asyncio
+import gzip
+import io
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.requester import ClientRequest
+from wdc.connection.transport import Transport
+from wdc.coverage.catalog import parse_formats
+from wdc.helpers import decoders
+from wdc.helpers.subset import Subset
+from fakes import FakeRequester, s2_catalog
+
+CSV = (",".join(f"{i * 0.5:.1f}" for i in range(2000))).encode()
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Answers every query with the same CSV, compressed if the client accepts gzip"""
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.accept_encoding = self.headers.get('Accept-Encoding')
+        body = CSV
+        self.send_response(200)
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(CSV)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCompressedTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GzipHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requester(self, transport):
+        requester = ClientRequest(transport=transport)
+        requester.service_endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/rasdaman/ows"
+        return requester
+
+    def test_gzip(self):
+        transport = Transport()
+        content, report = self.requester(transport).evaluate_query_with_report("query")
+        transport.close()
+        self.assertEqual(content, CSV)
+        self.assertEqual(self.server.accept_encoding, 'gzip, deflate')
+        self.assertEqual(report.content_encoding, 'gzip')
+        self.assertEqual(report.content_bytes, len(CSV))
+        self.assertEqual(report.wire_bytes, len(gzip.compress(CSV)))
+        self.assertGreater(report.compression_ratio, 2)
+
+    def test_identity(self):
+        transport = Transport(compress=False)
+        content, report = self.requester(transport).evaluate_query_with_report("query")
+        transport.close()
+        self.assertEqual(content, CSV)
+        self.assertEqual(self.server.accept_encoding, 'identity')
+        self.assertIsNone(report.content_encoding)
+        self.assertEqual(report.wire_bytes, len(CSV))
+
+
+class TestAutoEncode(unittest.TestCase):
+    def make_cube(self, data):
+        cube = Datacube(index=[Subset('ansi', "2021-04-09"), Subset('E', 669960, 670260),
+                               Subset('N', 4990200, 4990320)],
+                        coverage_name="S2_L2A_32631_TCI_60m").encode("auto")
+        cube.requester = FakeRequester(data)
+        return cube
+
+    def test_compact_format(self):
+        self.assertEqual(decoders.compact_format('<u2', (5, 2)), 'image/png')
+        rgb = np.dtype([('red', '|u1'), ('green', '|u1'), ('blue', '|u1')])
+        self.assertEqual(decoders.compact_format(rgb, (5, 2)), 'image/png')
+        self.assertEqual(decoders.compact_format('<f4', (5, 2)), 'image/tiff')
+        self.assertEqual(decoders.compact_format('<f8', (5, 2)), 'text/csv')
+        self.assertEqual(decoders.compact_format('<u1', (3, 5, 2)), 'text/csv')
+        self.assertEqual(decoders.compact_format('<f8', (5, 2), ['application/json']), 'application/json')
+        self.assertEqual(decoders.compact_format('<f8', (3, 5, 2), ['application/octet-stream']),
+                         'application/octet-stream')
+        # a number is not encoded, unknown data types fall back to text
+        self.assertIsNone(decoders.compact_format('<f8', ()))
+        self.assertEqual(decoders.compact_format(None, (5, None)), 'text/csv')
+
+    def test_auto_image(self):
+        values = np.arange(10, dtype=np.uint8).reshape(2, 5)
+        output = io.BytesIO()
+        Image.fromarray(values).save(output, format='PNG')
+        cube = self.make_cube(output.getvalue())
+        result = cube.fetch_array(catalog=s2_catalog([("gray", "unsignedChar")]))
+        self.assertIn('"image/png"', cube.requester.queries[0])
+        self.assertNotIn('auto', cube.requester.queries[0])
+        self.assertEqual(result.encode_format, 'image/png')
+        np.testing.assert_array_equal(result.data, values)
+        self.assertEqual(result.transfer.decoded_bytes, 10)
+        self.assertEqual(result.transfer.wire_bytes, len(output.getvalue()) // 2)
+        self.assertEqual(result.transfer.encode_format, 'image/png')
+
+    def test_auto_raw(self):
+        values = np.arange(10, dtype='<f8')
+        cube = self.make_cube(values.tobytes())
+        catalog = s2_catalog([("value", "double")], formats=['application/octet-stream', 'text/csv'])
+        result = cube.fetch_array(catalog=catalog)
+        self.assertIn('"application/octet-stream"', cube.requester.queries[0])
+        self.assertEqual(result.shape, (5, 2))
+        self.assertEqual(result.transfer.decoded_ratio, 2.0)
+
+    def test_auto_every_fetch(self):
+        # fetch_many, afetch, fetch_stream and fetch_to send the chosen format, never "auto"
+        catalog = s2_catalog([("gray", "unsignedChar")])
+        cube = self.make_cube(b"data")
+        self.assertEqual(Datacube.fetch_many([cube], catalog=catalog)[0].result(), b"data")
+        self.assertEqual(asyncio.run(cube.afetch()), b"data")
+        self.assertEqual(b"".join(cube.fetch_stream(catalog=catalog)), b"data")
+        output = io.BytesIO()
+        self.assertEqual(cube.fetch_to(output, catalog=catalog), 4)
+        self.assertEqual(len(cube.requester.queries), 4)
+        for query in cube.requester.queries:
+            self.assertNotIn('auto', query)
+            self.assertIn('encode(', query)
+        # the catalog is used like in fetch_array
+        self.assertIn('"image/png"', cube.requester.queries[0])
+        self.assertIn('"image/png"', cube.requester.queries[2])
+
+    def test_auto_aggregate(self):
+        cube = Datacube(coverage_name="S2_L2A_32631_TCI_60m").max().encode("auto")
+        cube.requester = FakeRequester(b"42")
+        self.assertEqual(cube.fetch_array().data, 42)
+        self.assertNotIn('encode', cube.requester.queries[0])
+
+    def test_parse_formats(self):
+        document = b"""<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0">
+            <wcs:ServiceMetadata><wcs:formatSupported>image/png</wcs:formatSupported>
+            <wcs:formatSupported>text/csv</wcs:formatSupported></wcs:ServiceMetadata>
+            </wcs:Capabilities>"""
+        self.assertEqual(parse_formats(document), ['image/png', 'text/csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest import mock
+import threading
+import asyncio
+import time
+import sys
+import os
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
+sys.path.append(sprint_1_directory)
+
+from wdc import Datacube
+from wdc.connection.requester import ClientRequest
+from wdc.connection.transport import Transport
+from wdc.tree.tree_parser import make_process_query_from_tree
+
+
+class TestTransport(unittest.TestCase):
+    def test_session_is_shared(self):
+        transport = Transport()
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(transport.session))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # every thread has to get the same pooled session
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+        transport.close()
+
+    def test_pool_size(self):
+        transport = Transport(pool_maxsize=32)
+        adapter = transport.session.get_adapter('https://ows.rasdaman.org')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        transport.close()
+
+    def test_certificates_are_verified(self):
+        transport = Transport()
+        self.assertTrue(transport.session.verify)
+        transport.close()
+        transport = Transport(verify=False)
+        self.assertFalse(transport.session.verify)
+        transport.close()
+
+    def test_timeouts_are_passed(self):
+        transport = Transport(connect_timeout=1.5, read_timeout=7.0)
+        with mock.patch.object(transport.session, 'post') as post:
+            transport.post('https://example.org', data={'query': 'q'})
+        self.assertEqual(post.call_args.kwargs['timeout'], (1.5, 7.0))
+        transport.close()
+
+    def test_requesters_share_default_transport(self):
+        self.assertIs(ClientRequest().transport, ClientRequest().transport)
+        self.assertIs(Datacube().requester, Datacube().requester)
+
+    def test_evaluate_query_uses_transport(self):
+        transport = Transport()
+        request = ClientRequest(transport=transport)
+        response = mock.Mock(content=b'42')
+        with mock.patch.object(transport, 'post', return_value=response) as post:
+            self.assertEqual(request.evaluate_query('for $c in (A) return avg($c)'), b'42')
+        post.assert_called_once()
+
+
+class TestAsyncFetch(unittest.TestCase):
+    def test_afetch_is_bounded(self):
+        transport = Transport(max_concurrency=4)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def slow_post(url, data=None, **kwargs):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+            return mock.Mock(content=data['query'].encode())
+
+        # different coverages, identical datacubes would share one request
+        cubes = [Datacube(coverage_name=f"S2_L2A_32631_B{i:02d}_60m") for i in range(12)]
+        for cube in cubes:
+            cube.requester = ClientRequest(transport=transport)
+
+        async def fetch_all():
+            return await asyncio.gather(*(cube.afetch() for cube in cubes))
+
+        with mock.patch.object(transport, 'post', side_effect=slow_post):
+            results = asyncio.run(fetch_all())
+        # results keep the order of the cubes and no more than 4 requests ran at once
+        self.assertEqual(results, [make_process_query_from_tree(cube.get_tree()).encode()
+                                   for cube in cubes])
+        self.assertLessEqual(state['peak'], 4)
+        self.assertGreater(state['peak'], 1)
+        transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
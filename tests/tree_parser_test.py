@@ -1,4 +1,5 @@
 import unittest
+import time
 
 # Need to add the .. folder to PATH to access a module via tests folder
 import sys
@@ -164,10 +165,18 @@ class TestQueryTreeParser(unittest.TestCase):
     def test_refactor(self):
         self.maxDiff = None
         a = Datacube(
-            index='ansi( "2021-04-09" ), E( 670000:679000 ), N( 4990220:4993220 )'
+            index=[
+                Subset("ansi", "2021-04-09"),
+                Subset("E", 670000, 679000),
+                Subset("N", 4990220, 4993220),
+            ]
         )
         b = Datacube(
-            index='ansi( "2021-04-09" ), E( 670000:679000 ), N( 4990220:4993220 )'
+            index=[
+                Subset("ansi", "2021-04-09"),
+                Subset("E", 670000, 679000),
+                Subset("N", 4990220, 4993220),
+            ]
         )
         c = Datacube.refactor(
             [("myfirstAxis", a + b), ("mySecondAxis", a - b), ("myThirdAxis", a / b)]
@@ -176,16 +185,12 @@ class TestQueryTreeParser(unittest.TestCase):
     ${b.name} in (S2_L2A_32631_TCI_60m)
     let $index{a.name} := [ansi("2021-04-09"), E(670000:679000), N(4990220:4993220)],
         $index{b.name} := [ansi("2021-04-09"), E(670000:679000), N(4990220:4993220)],
-        $f9 := ${b.name}[ $index{b.name}],
-        $f8 := ${a.name}[ $index{a.name}],
-        $f7 := ($f8)/($f9),
-        $f6 := ${b.name}[ $index{b.name}],
-        $f5 := ${a.name}[ $index{a.name}],
-        $f4 := ($f5)-($f6),
         $f3 := ${b.name}[ $index{b.name}],
         $f2 := ${a.name}[ $index{a.name}],
+        $f5 := ($f2)/($f3),
+        $f4 := ($f2)-($f3),
         $f1 := ($f2)+($f3),
-        $f0 := {{ myfirstAxis: $f1; mySecondAxis: $f4; myThirdAxis: $f7 }}
+        $f0 := {{ myfirstAxis: $f1; mySecondAxis: $f4; myThirdAxis: $f5 }}
     return $f0"""
         self.assertEqual(query, make_process_query_from_tree(c.get_tree()))
 
@@ -213,28 +218,75 @@ class TestQueryTreeParser(unittest.TestCase):
             ]
         )
         query = f"""for ${a.name} in (S2_L2A_32631_TCI_60m),
-    $c38 in (S2_L2A_32631_TCI_60m)
+    ${b.name} in (S2_L2A_32631_TCI_60m)
     let $index{a.name} := [ansi("2021-04-09"), E(670000:679000), N(4990220:4993220)],
         $index{b.name} := [ansi("2021-04-09"), E(670000:679000), N(4990220:4993220)],
         $indexf1 := [ansi("2021-04-09")],
         $indexf5 := [ansi("2021-04-09")],
-        $indexf9 := [ansi("2021-04-09")],
-        $f12 := ${b.name}[ $indexc38],
-        $f11 := ${a.name}[ $indexc37],
-        $f10 := ($f11)/($f12),
-        $f9 := $f10[ $indexf9],
-        $f8 := ${b.name}[ $indexc38],
-        $f7 := ${a.name}[ $indexc37],
-        $f6 := ($f7)-($f8),
+        $indexf7 := [ansi("2021-04-09")],
+        $f4 := ${b.name}[ $index{b.name}],
+        $f3 := ${a.name}[ $index{a.name}],
+        $f8 := ($f3)/($f4),
+        $f7 := $f8[ $indexf7],
+        $f6 := ($f3)-($f4),
         $f5 := $f6[ $indexf5],
-        $f4 := ${b.name}[ $indexc38],
-        $f3 := ${a.name}[ $indexc37],
         $f2 := ($f3)+($f4),
         $f1 := $f2[ $indexf1],
-        $f0 := {{ myfirstAxis: $f1; mySecondAxis: $f5; myThirdAxis: $f9 }}
+        $f0 := {{ myfirstAxis: $f1; mySecondAxis: $f5; myThirdAxis: $f7 }}
     return $f0"""
         self.assertEqual(query, make_process_query_from_tree(c.get_tree()))
 
+    def test_common_subexpressions(self):
+        a = Datacube(index=[Subset("E", 670000, 679000)])
+        b = Datacube(index=[Subset("E", 670000, 679000)])
+        c = a + b
+        query = f"""for ${a.name} in (S2_L2A_32631_TCI_60m),
+    ${b.name} in (S2_L2A_32631_TCI_60m)
+    let $index{a.name} := [E(670000:679000)],
+        $index{b.name} := [E(670000:679000)],
+        $f3 := ${b.name}[ $index{b.name}],
+        $f2 := ${a.name}[ $index{a.name}],
+        $f1 := ($f2)+($f3),
+        $f0 := ($f1)*($f1)
+    return $f0"""
+        # the same subtree and a separately built identical subtree are bound only once
+        self.assertEqual(query, make_process_query_from_tree((c * c).get_tree()))
+        self.assertEqual(query, make_process_query_from_tree(((a + b) * (a + b)).get_tree()))
+        self.assertEqual((c * c).get_tree().root.size, 7)
+        self.assertEqual((c * c).get_tree().dag_size(), 4)
+
+    def test_tree_without_sharing(self):
+        a = Datacube()
+        b = Datacube()
+        # no shared node: variables in DFS preorder, every node is bound once
+        lines = make_process_query_from_tree(((a + 2) * (b + 3)).get_tree()).split("\n")
+        self.assertEqual([line.strip().rstrip(',') for line in lines[2:-1]],
+                         ["let $f6 := 3", f"$f5 := ${b.name}", "$f4 := ($f5)+($f6)", "$f3 := 2",
+                          f"$f2 := ${a.name}", "$f1 := ($f2)+($f3)", "$f0 := ($f1)*($f4)"])
+        # equal constants are the same subexpression, even in different leaves
+        query = make_process_query_from_tree(((a + 2) * (b + 2)).get_tree())
+        self.assertEqual(query.count(":= 2"), 1)
+        self.assertIn("$f0 := ($f1)*($f4)", query)
+
+    def test_deep_tree(self):
+        REPEATS = 100000
+        TIME_BOUND = 2.0
+        a = Datacube()
+        b = Datacube()
+        c = a
+        for _ in range(REPEATS):
+            c = c + b
+        # the compilation must not hit the recursion limit and stay linear
+        start_time = time.time()
+        query = make_process_query_from_tree(c.get_tree())
+        self.assertLess(time.time() - start_time, TIME_BOUND)
+        lines = query.split("\n")
+        # b is bound to one variable, that is used by every addition
+        self.assertEqual(len(lines), 2 + (REPEATS + 2) + 1)
+        self.assertEqual(lines[-2], f"        $f0 := ($f1)+($f{REPEATS + 1})")
+        self.assertEqual(len(str(c.get_tree())), len(str(a.get_tree())) +
+                         REPEATS * (len(str(b.get_tree())) + 5))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -13,6 +13,7 @@ class Action(str, Enum):
     AVG = 'avg'
     MIN = 'min'
     MAX = 'max'
+    SUM = 'add'
     REFACTOR = 'refactor'
     SUBINDEX = 'subindex'
     
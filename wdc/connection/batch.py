@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed, wait
+
+from . import instrumentation
+from .resilience import Deadline, DeadlineExceeded
+from .singleflight import tree_key
+
+
+class FetchResult:
+    '''
+    Outcome of one datacube in a batch fetch, either data or the error that occurred
+    '''
+
+    def __init__(self, index: int, cube, query: str = None, data=None, error: Exception = None):
+        self.index = index
+        self.cube = cube
+        self.query = query
+        self.data = data
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        '''True if the datacube was fetched without errors'''
+        return self.error is None
+
+    def result(self):
+        '''
+        Returns the fetched data or raises the error of this item
+
+        Raises:
+            Exception: the error that occurred while compiling or fetching the datacube
+        '''
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
+def _fetch_one(index: int, cube, deadline: Deadline = None, catalog=None) -> FetchResult:
+    query = None
+    try:
+        # the encode format "auto" is resolved like in fetch
+        tree = cube.resolved_tree(catalog)
+        query, record = instrumentation.compile_tree(tree)
+        data, _ = instrumentation.send_query(cube.requester, query, record, deadline, tree_key(tree))
+        if record is not None:
+            instrumentation.emit(record)
+        return FetchResult(index, cube, query, data=data)
+    except Exception as error:
+        return FetchResult(index, cube, query, error=error)
+
+
+def _expired(index: int, cube) -> FetchResult:
+    return FetchResult(index, cube, error=DeadlineExceeded("The deadline of the batch has passed"))
+
+
+def _fetch_as_completed(cubes: list, max_workers: int, deadline: Deadline, catalog=None):
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(_fetch_one, i, cube, deadline, catalog): i
+               for i, cube in enumerate(cubes)}
+    yielded = set()
+    try:
+        try:
+            for future in as_completed(futures, timeout=deadline.remaining() if deadline else None):
+                yielded.add(futures[future])
+                yield future.result()
+        except TimeoutError:
+            # requests that completed meanwhile are still reported, the ones that have not
+            # started are cancelled, the others are not waited for
+            for future, i in futures.items():
+                if i in yielded:
+                    continue
+                if future.done() and not future.cancelled():
+                    yield future.result()
+                else:
+                    future.cancel()
+                    yield _expired(i, cubes[i])
+    finally:
+        executor.shutdown(wait=deadline is None, cancel_futures=True)
+
+
+def fetch_batch(cubes: list, max_workers: int = 8, ordered: bool = True, deadline=None,
+                catalog=None):
+    '''
+    Compiles and fetches several datacubes on a bounded pool of worker threads
+
+    An error of one datacube does not abort the batch, it is stored in its FetchResult.
+
+    Args:
+        cubes (list): datacubes to be fetched
+        max_workers (int): maximum number of requests running at the same time
+        ordered (bool): return a list in the order of cubes, otherwise an iterator
+            that yields results as soon as they are completed
+        deadline (Deadline or float): (optional) deadline or seconds for the whole batch,
+            datacubes that are not fetched in time get a DeadlineExceeded error
+        catalog (CoverageCatalog): (optional) catalog used to resolve the encode format "auto"
+    Returns:
+        list or iterator of FetchResult
+    '''
+    cubes = list(cubes)
+    deadline = Deadline.of(deadline)
+    if not ordered:
+        return _fetch_as_completed(cubes, max_workers, deadline, catalog)
+    if len(cubes) == 0:
+        return []
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(_fetch_one, i, cube, deadline, catalog)
+                   for i, cube in enumerate(cubes)]
+        if deadline is None:
+            return [future.result() for future in futures]
+        wait(futures, timeout=deadline.remaining())
+        # requests that have not started are cancelled on shutdown, the others are not waited for
+        return [future.result() if future.done() and not future.cancelled() else _expired(i, cubes[i])
+                for i, future in enumerate(futures)]
+    finally:
+        executor.shutdown(wait=deadline is None, cancel_futures=True)
@@ -0,0 +1,175 @@
+import hashlib
+import lzma
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+
+class ResultCache:
+    '''
+    Persistent on-disk cache of query results, keyed by the endpoint and the query text
+
+    Instead of the text, a query compiled from a datacube is stored under the tree_key of its
+    tree: the generated names of datacubes change with every build and every process, the
+    structural hash does not.
+
+    Every entry is a single file that is written to a temporary file first and then
+    renamed into place, so several processes can share one cache directory and never
+    see a partially written entry. The modification time of a file is its last use,
+    which is what the LRU eviction relies on.
+    '''
+
+    # file header: magic, compression code, creation time
+    _MAGIC = b'WDC1'
+    _HEADER = struct.Struct('<4sBd')
+    _COMPRESSIONS = {None: 0, 'zlib': 1, 'lzma': 2}
+    _SUFFIX = '.bin'
+
+    def __init__(self, directory, max_bytes=1 << 30, ttl=None, compression=None):
+        '''
+        Args:
+            directory (str): directory of the cache, created if it does not exist
+            max_bytes (int): size limit of all entries, least recently used ones are evicted
+            ttl (float): seconds after which an entry expires, None to never expire
+            compression (str): None, "zlib" or "lzma"
+        '''
+        if compression not in self._COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compression = compression
+        os.makedirs(self.directory, exist_ok=True)
+        # estimate of the size on disk, the directory is rescanned when it is exceeded
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint: str, query: str) -> str:
+        '''
+        Returns the key of a query sent to an endpoint
+
+        Args:
+            endpoint (str): url of the service
+            query (str): WCPS query, or the key of its result (e.g. tree_key of its tree)
+        Returns:
+            str: hex digest identifying the entry
+        '''
+        return hashlib.sha256(f"{endpoint}\n{query}".encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+    def get(self, endpoint: str, query: str):
+        '''
+        Returns the cached result of a query or None if there is no valid entry
+
+        Args:
+            endpoint (str): url of the service
+            query (str): WCPS query, or the key of its result (e.g. tree_key of its tree)
+        Returns:
+            bytes or None
+        '''
+        path = self._path(self.make_key(endpoint, query))
+        try:
+            with open(path, 'rb') as file:
+                blob = file.read()
+        except FileNotFoundError:
+            return None
+        if len(blob) < self._HEADER.size:
+            return None
+        magic, code, created = self._HEADER.unpack_from(blob)
+        if magic != self._MAGIC:
+            return None
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self._remove(path)
+            return None
+        payload = blob[self._HEADER.size:]
+        if code == 1:
+            payload = zlib.decompress(payload)
+        elif code == 2:
+            payload = lzma.decompress(payload)
+        try:
+            # mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return payload
+
+    def put(self, endpoint: str, query: str, data: bytes):
+        '''
+        Stores the result of a query
+
+        Args:
+            endpoint (str): url of the service
+            query (str): WCPS query, or the key of its result (e.g. tree_key of its tree)
+            data (bytes): result of the query
+        '''
+        payload = data
+        if self.compression == 'zlib':
+            payload = zlib.compress(data)
+        elif self.compression == 'lzma':
+            payload = lzma.compress(data)
+        header = self._HEADER.pack(self._MAGIC, self._COMPRESSIONS[self.compression], time.time())
+        path = self._path(self.make_key(endpoint, query))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(header)
+                file.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += len(header) + len(payload)
+            over_limit = self._size is None or self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits into max_bytes
+        '''
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self._SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        '''
+        Removes all entries of the cache
+        '''
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self._SUFFIX):
+                self._remove(entry.path)
+        with self._lock:
+            self._size = 0
+
+    @staticmethod
+    def _remove(path: str):
+        # another process might have removed the file already
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,218 @@
+import threading
+import time
+import warnings
+
+from ..tree.tree_parser import make_process_query_from_tree
+from .singleflight import tree_key
+
+# phases of a fetch in the order they happen
+PHASES = ('compile', 'connect', 'ttfb', 'download', 'decode')
+
+# callbacks that get a FetchRecord after every fetch, replaced as a whole when it changes
+_listeners = ()
+_lock = threading.Lock()
+
+
+class FetchRecord:
+    '''
+    Timing of one fetch broken down by phase, with the sizes of the tree, the query and the result
+
+    The phases (in seconds) are compile (query generation from the tree), connect (waiting for
+    a pooled connection or opening a new one), ttfb (sending the query until the headers of the
+    answer arrive, mostly the work of the server), download (reading the body) and decode
+    (turning the body into an array). Phases that did not happen are missing, e.g. the network
+    phases of a result from the cache.
+    '''
+
+    def __init__(self, tree_size: int, query_length: int = None):
+        '''
+        Args:
+            tree_size (int): number of nodes of the query tree (Node.size of the root)
+            query_length (int): (optional) number of characters of the query
+        '''
+        self.tree_size = tree_size
+        self.query_length = query_length
+        self.response_bytes = None
+        self.wire_bytes = None
+        self.encode_format = None
+        self.cached = False
+        self.error = None
+        self.phases = {}
+
+    @property
+    def total(self) -> float:
+        '''Sum of all measured phases in seconds'''
+        return sum(self.phases.values())
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def add_transfer(self, transfer, content: bytes):
+        '''
+        Adds the sizes and the network phases of the answer
+
+        Args:
+            transfer (TransferReport): report of the answer, None if the requester gives none
+            content (bytes): the answer
+        '''
+        self.response_bytes = len(content)
+        if transfer is None:
+            return
+        self.wire_bytes = transfer.wire_bytes
+        self.cached = transfer.cached
+        for phase, seconds in transfer.timing.items():
+            self.phases[phase] = seconds
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={self.phases[phase] * 1000:.1f}ms"
+                           for phase in PHASES if phase in self.phases)
+        return (f"FetchRecord({phases}, tree_size={self.tree_size}, "
+                f"query_length={self.query_length}, response_bytes={self.response_bytes})")
+
+
+def add_listener(callback):
+    '''
+    Registers a callback that gets a FetchRecord after every fetch of a datacube
+
+    Callbacks are called in the thread of the fetch, they should return quickly.
+
+    Args:
+        callback (callable): function (record) -> None
+    '''
+    global _listeners
+    with _lock:
+        _listeners = _listeners + (callback,)
+
+
+def remove_listener(callback):
+    '''
+    Removes a callback registered with add_listener
+
+    Args:
+        callback (callable): the registered function
+    '''
+    global _listeners
+    with _lock:
+        listeners = list(_listeners)
+        if callback in listeners:
+            listeners.remove(callback)
+        _listeners = tuple(listeners)
+
+
+def listening() -> bool:
+    '''True if a callback is registered, otherwise nothing is measured'''
+    return bool(_listeners)
+
+
+def emit(record: FetchRecord):
+    '''
+    Passes a record to every callback, an error of a callback does not fail the fetch
+
+    Args:
+        record (FetchRecord): the record of a fetch
+    '''
+    for listener in _listeners:
+        try:
+            listener(record)
+        except Exception as error:
+            warnings.warn(f"Fetch listener {listener!r} failed: {error!r}", RuntimeWarning)
+
+
+class record_fetches:
+    '''
+    Context manager that collects the records of all fetches made inside it
+
+    Example:
+        with record_fetches() as recorder:
+            cube.fetch()
+        print(recorder.records)
+    '''
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def _append(self, record: FetchRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def __enter__(self) -> 'record_fetches':
+        add_listener(self._append)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_listener(self._append)
+        return False
+
+
+def compile_tree(tree):
+    '''
+    Generates the query of a tree, with a record of the compile phase if a callback is registered
+
+    Args:
+        tree (QueryTree): the tree of the datacube
+    Returns:
+        tuple: query and FetchRecord (or None)
+    '''
+    if not _listeners:
+        return make_process_query_from_tree(tree), None
+    start = time.perf_counter()
+    query = make_process_query_from_tree(tree)
+    record = FetchRecord(tree.root.size, len(query))
+    record.phases['compile'] = time.perf_counter() - start
+    return query, record
+
+
+def send_query(requester, query: str, record: FetchRecord = None, deadline=None, key: str = None):
+    '''
+    Sends a query and adds the sizes and network phases of the answer to the record
+
+    The record is not emitted after a success, so the caller can add the decode phase first.
+
+    Args:
+        requester (ClientRequest): requester that sends the query
+        query (str): WCPS query
+        record (FetchRecord): (optional) record of the fetch, from compile_tree
+        deadline (Deadline or float): (optional) deadline of the request
+        key (str): (optional) key of the result of the query, e.g. tree_key of its tree,
+            only passed to requesters with evaluate_query_with_report
+    Raises:
+        Exception: the error of the request, the record is emitted before
+    Returns:
+        tuple: content of the answer and TransferReport (or None)
+    '''
+    kwargs = {'deadline': deadline} if deadline is not None else {}
+    evaluate = getattr(requester, 'evaluate_query_with_report', None)
+    try:
+        if evaluate is not None:
+            if key is not None:
+                kwargs['key'] = key
+            content, transfer = evaluate(query, **kwargs)
+        else:
+            content, transfer = requester.evaluate_query(query, **kwargs), None
+    except Exception as error:
+        if record is not None:
+            record.error = error
+            emit(record)
+        raise
+    if record is not None:
+        record.add_transfer(transfer, content)
+    return content, transfer
+
+
+def send_tree(requester, tree, deadline=None):
+    '''
+    Compiles a query tree and sends the query (see compile_tree and send_query),
+    with the tree_key of the tree as the key of its result
+
+    Args:
+        requester (ClientRequest): requester that sends the query
+        tree (QueryTree): the tree of the datacube
+        deadline (Deadline or float): (optional) deadline of the request
+    Returns:
+        tuple: content of the answer, TransferReport (or None) and FetchRecord (or None)
+    '''
+    query, record = compile_tree(tree)
+    content, transfer = send_query(requester, query, record, deadline, tree_key(tree))
+    return content, transfer, record
@@ -1,6 +1,10 @@
 # need library for images, we use Pillow
 # for Jupyter Notebook, keep from IPython.display import Image
-import requests
+from .transport import Transport
+from .cache import ResultCache
+from .resilience import Deadline, DeadlineExceeded, Resilience
+from .singleflight import normalize_query
+from .transfer import TransferReport, report_of
 
 class ClientRequest:
     '''Class for server connection and certain methods'''
@@ -9,38 +13,73 @@ class ClientRequest:
     service_endpoint = "https://ows.rasdaman.org/rasdaman/ows"
     
     # connection to server, use default value (if unspecified)
-    def __init__(self, base_wcs_url = service_endpoint + "?service=WCS&version=2.0.1"):
+    # all requests share the pooled session of the default transport unless another one is given
+    # results of WCPS queries are looked up in the cache first, if there is one
+    # failed requests are retried (and optionally hedged) by the resilience layer
+    def __init__(self, base_wcs_url = service_endpoint + "?service=WCS&version=2.0.1",
+                 transport: Transport = None, cache: ResultCache = None,
+                 resilience: Resilience = None, coalesce: bool = True):
         self.base_wcs_url = base_wcs_url
+        self.transport = transport if transport is not None else Transport.default()
+        self.cache = cache
+        self.resilience = resilience if resilience is not None else Resilience()
+        # identical queries sent at the same time through the same transport share one request
+        self.coalesce = coalesce
+
+    def _timeout(self, remaining):
+        '''(connect, read) timeout of the transport, limited to the time left until a deadline'''
+        connect, read = self.transport.timeout
+        return (min(connect, remaining), min(read, remaining))
+
+    def _send(self, method, url, deadline=None, **kwargs):
+        '''
+        Sends a request through the resilience layer
+
+        Args:
+            method: transport.get or transport.post
+            url (str): request url
+            deadline (Deadline or float): (optional) deadline or seconds for the whole request
+            kwargs: further arguments of the request
+        Returns:
+            response
+        '''
+        def send(remaining):
+            if remaining is not None:
+                return method(url, timeout=self._timeout(remaining), **kwargs)
+            return method(url, **kwargs)
+        return self.resilience.call(send, Deadline.of(deadline))
     
 
 
-    def get_capabilities(self):
+    def get_capabilities(self, headers=None):
         '''
         Returns XML description of service capabilities and overview of covarages
         
         Args:
             self: Self@ClientRequest
+            headers (dict): (optional) extra HTTP headers, e.g. for conditional requests
         Returns:
             response
         '''
         request_url = self.base_wcs_url + "&request=GetCapabilities"
-        response = requests.get(request_url, verify=False)
+        response = self._send(self.transport.get, request_url, headers=headers)
         return response
     
 
 
-    def describe_coverage(self, cov_id):
+    def describe_coverage(self, cov_id, headers=None):
         '''Returns XML-encoded description of a specific coverage
     
         Args:
             self: Self@ClientRequest
             cov_id (str): coverage id (e.g. "S2_L2A_32631_TCI_60m")
+            headers (dict): (optional) extra HTTP headers, e.g. for conditional requests
         Returns:
             response
         '''
         request_url = self.base_wcs_url + "&request=DescribeCoverage"
         request_url += f"&coverageId={cov_id}"
-        response = requests.get(request_url, verify=False)
+        response = self._send(self.transport.get, request_url, headers=headers)
         return response
 
 
@@ -63,14 +102,125 @@ class ClientRequest:
         if not encode_format is None:
             request_url += f"&FORMAT={encode_format}"
         # storing data we get in response
-        response = requests.get(request_url, verify=False)
+        response = self._send(self.transport.get, request_url)
         return response
     
 
 
-    def evaluate_query(self, query):
-        '''Method to send WCPS query for evaluation'''
-        response = requests.post(self.service_endpoint, data = {'query': query}, verify=False)
-        return response.content
+    def evaluate_query(self, query, deadline=None, key=None):
+        '''
+        Method to send WCPS query for evaluation
+
+        Callers that send the same query (up to whitespace, or with the same key) while it is
+        in flight share one request and all get its result or its error.
+
+        Args:
+            self: Self@ClientRequest
+            query (str): WCPS query
+            deadline (Deadline or float): (optional) deadline or seconds for the whole request,
+                including retries
+            key (str): (optional) key of the result of the query, e.g. the tree_key of the tree
+                it was compiled from, used for the cache and for sharing requests in flight,
+                the query itself if not given
+        Raises:
+            DeadlineExceeded: if the query is not answered before the deadline
+            requests.HTTPError: if the server still answers with an error status after the retries
+        Returns:
+            bytes: the content of the response
+        '''
+        return self.evaluate_query_with_report(query, deadline, key)[0]
+
+    def evaluate_query_with_report(self, query, deadline=None, key=None):
+        '''
+        Method to send WCPS query for evaluation that also reports the size of the transfer
+
+        Args:
+            self: Self@ClientRequest
+            query (str): WCPS query
+            deadline (Deadline or float): (optional) deadline or seconds for the whole request
+            key (str): (optional) key of the result of the query (see evaluate_query)
+        Raises:
+            DeadlineExceeded: if the query is not answered before the deadline
+            requests.HTTPError: if the server still answers with an error status after the retries
+        Returns:
+            tuple: the content of the response and its TransferReport
+        '''
+        if self.cache is not None:
+            data = self.cache.get(self.service_endpoint, key if key is not None else query)
+            if data is not None:
+                return data, TransferReport(0, len(data), cached=True)
+        if not self.coalesce:
+            return self._evaluate(query, deadline, key)
+        deadline = Deadline.of(deadline)
+        flight_key = (self.service_endpoint, key if key is not None else normalize_query(query))
+        try:
+            return self.transport.single_flight.do(
+                flight_key, lambda: self._evaluate(query, deadline, key),
+                timeout=deadline.remaining() if deadline is not None else None)
+        except TimeoutError as error:
+            if isinstance(error, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("The deadline passed while waiting for the same query") from error
+
+    def _evaluate(self, query, deadline=None, key=None):
+        response = self._send(self.transport.post, self.service_endpoint, deadline,
+                              data = {'query': query})
+        # the resilience layer gave up, an error answer is not a result
+        # (and is not stored, it should be retried next time)
+        response.raise_for_status()
+        if self.cache is not None:
+            self.cache.put(self.service_endpoint, key if key is not None else query,
+                           response.content)
+        return response.content, report_of(response)
+
+
+
+    def stream_query(self, query, chunk_size=65536, deadline=None):
+        '''
+        Method to send WCPS query for evaluation and read the result piece by piece
+
+        The response is never held in memory as a whole, the connection is released
+        to the pool once the iterator is exhausted or closed.
+        Until the headers of the answer arrive the request goes through the resilience layer
+        like evaluate_query (retries, hedging, deadline). The body is not: chunks that have
+        been yielded can not be taken back, so an error while reading it is raised as it is,
+        and only the read timeout of the transport bounds the wait for every chunk.
+
+        Args:
+            self: Self@ClientRequest
+            query (str): WCPS query
+            chunk_size (int): maximum number of bytes per chunk
+            deadline (Deadline or float): (optional) deadline or seconds until the answer starts,
+                including retries
+        Raises:
+            DeadlineExceeded: if the answer does not start before the deadline
+            requests.HTTPError: if the server still answers with an error status after the retries
+        Returns:
+            iterator over chunks of bytes
+        '''
+        response = self._send(self.transport.post, self.service_endpoint, deadline,
+                              data = {'query': query}, stream=True)
+        try:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+        finally:
+            response.close()
+
+
+    # asyncio versions of the requests above, they run on the worker threads of the transport
+    async def aget_capabilities(self, headers=None):
+        '''Asynchronous version of get_capabilities'''
+        return await self.transport.run_async(self.get_capabilities, headers)
+
+    async def adescribe_coverage(self, cov_id, headers=None):
+        '''Asynchronous version of describe_coverage'''
+        return await self.transport.run_async(self.describe_coverage, cov_id, headers)
 
+    async def aget_subset_coverage(self, cov_id, subsets, encode_format=None):
+        '''Asynchronous version of get_subset_coverage'''
+        return await self.transport.run_async(self.get_subset_coverage, cov_id, subsets,
+                                              encode_format)
 
+    async def aevaluate_query(self, query, deadline=None, key=None):
+        '''Asynchronous version of evaluate_query'''
+        return await self.transport.run_async(self.evaluate_query, query, deadline, key)
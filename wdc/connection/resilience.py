@@ -0,0 +1,284 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+
+class DeadlineExceeded(TimeoutError):
+    '''Raised when a fetch or a batch did not complete before its deadline'''
+
+
+class Deadline:
+    '''
+    Point in time by which a fetch or a whole batch must be completed
+    '''
+
+    def __init__(self, seconds: float):
+        '''
+        Args:
+            seconds (float): time from now until the deadline
+        '''
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def of(cls, value) -> 'Deadline':
+        '''
+        Deadline from a number of seconds, an existing deadline is returned as it is
+
+        Args:
+            value (float, Deadline or None): seconds from now or a deadline
+        Returns:
+            Deadline or None
+        '''
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value)
+
+    def remaining(self) -> float:
+        '''Seconds left until the deadline, 0 if it has passed'''
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        '''
+        Raises:
+            DeadlineExceeded: if the deadline has passed
+        '''
+        if self.expired:
+            raise DeadlineExceeded("The deadline of the request has passed")
+
+
+class RetryPolicy:
+    '''
+    When and after which delay a failed request is sent again
+
+    Connection errors, timeouts and 5xx answers are retried with exponential backoff.
+    With jitter the delay is random between 0 and the backoff ("full jitter"),
+    so clients that failed at the same time do not retry at the same time.
+    '''
+
+    def __init__(self, attempts: int = 3, backoff: float = 0.2, max_backoff: float = 5.0,
+                 jitter: bool = True, statuses=(500, 502, 503, 504),
+                 exceptions=(requests.ConnectionError, requests.Timeout)):
+        '''
+        Args:
+            attempts (int): maximum number of attempts, 1 means no retries
+            backoff (float): delay before the first retry in seconds, it doubles on every retry
+            max_backoff (float): upper limit of the delay
+            jitter (bool): randomize the delay
+            statuses (tuple): HTTP status codes of answers that are retried
+            exceptions (tuple): errors that are retried
+        '''
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+
+    def delay(self, attempt: int) -> float:
+        '''
+        Delay before the next attempt
+
+        Args:
+            attempt (int): number of attempts that have failed so far (1 after the first failure)
+        '''
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def retries_error(self, error: Exception) -> bool:
+        return isinstance(error, self.exceptions)
+
+    def retries_response(self, response) -> bool:
+        return getattr(response, 'status_code', None) in self.statuses
+
+
+class HedgePolicy:
+    '''
+    When a duplicate of a slow request is sent
+
+    A duplicate is sent if a request has not answered after the given percentile of
+    the latencies of recent requests, and the first successful answer of both is used.
+    An answer with a retried status (e.g. 503) only wins if the other one fails as well.
+    '''
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, initial_delay: float = None,
+                 window: int = 200, max_hedges: int = 1):
+        '''
+        Args:
+            percentile (float): percentile of recent latencies after which a duplicate is sent
+            min_samples (int): number of latencies needed before the percentile is used
+            initial_delay (float): (optional) delay in seconds used until there are enough samples,
+                no duplicates are sent without it
+            window (int): number of recent latencies that are kept
+            max_hedges (int): maximum number of duplicates of one request
+        '''
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.max_hedges = max_hedges
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        '''Adds the latency of a successful request'''
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self):
+        '''Seconds after which a duplicate is sent, None if no duplicate should be sent'''
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        position = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return latencies[position]
+
+
+def _close(response):
+    close = getattr(response, 'close', None)
+    if close is not None:
+        close()
+
+
+class Resilience:
+    '''
+    Sends a request with retries, optional hedging and an optional deadline
+
+    Without hedging and deadline a request runs in the calling thread. Otherwise the attempts
+    run on worker threads, so the caller can stop waiting for a request that hangs.
+    '''
+
+    def __init__(self, retry: RetryPolicy = None, hedge: HedgePolicy = None, max_workers: int = 16):
+        '''
+        Args:
+            retry (RetryPolicy): (optional) retry policy, by default 3 attempts with backoff
+            hedge (HedgePolicy): (optional) hedging policy, no hedging by default
+            max_workers (int): number of worker threads for hedged and deadline-bound requests
+        '''
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.hedge = hedge
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='wdc-resilience')
+        return self._executor
+
+    def call(self, send, deadline: Deadline = None):
+        '''
+        Sends a request until it succeeds, retries are exhausted or the deadline passes
+
+        Args:
+            send (callable): function (timeout) -> response that sends the request once,
+                timeout is the number of seconds left until the deadline or None
+            deadline (Deadline): (optional) deadline of the whole call
+        Raises:
+            DeadlineExceeded: if the deadline passes first
+            Exception: the error of the last attempt
+        Returns:
+            the first successful response, or the last one if it was an error status
+        '''
+        attempt = 0
+        while True:
+            attempt += 1
+            if deadline is not None:
+                deadline.check()
+            try:
+                response = self._attempt(send, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as error:
+                if attempt >= self.retry.attempts or not self.retry.retries_error(error):
+                    raise
+            else:
+                if attempt >= self.retry.attempts or not self.retry.retries_response(response):
+                    return response
+                # the connection of a streamed answer goes back to the pool
+                _close(response)
+            self._sleep(self.retry.delay(attempt), deadline)
+
+    @staticmethod
+    def _sleep(delay: float, deadline: Deadline):
+        if deadline is not None and delay >= deadline.remaining():
+            raise DeadlineExceeded("The deadline passes before the next attempt")
+        time.sleep(delay)
+
+    def _timed(self, send, deadline: Deadline):
+        start = time.monotonic()
+        response = send(deadline.remaining() if deadline is not None else None)
+        if self.hedge is not None and not self.retry.retries_response(response):
+            self.hedge.record(time.monotonic() - start)
+        return response
+
+    def _attempt(self, send, deadline: Deadline):
+        '''One attempt, possibly with duplicates, bounded by the deadline'''
+        hedge_delay = self.hedge.delay() if self.hedge is not None else None
+        if hedge_delay is None and deadline is None:
+            return self._timed(send, None)
+        futures = [self.executor.submit(self._timed, send, deadline)]
+        pending = set(futures)
+        hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+        error = None
+        # an answer with a retried status, returned only if no other attempt succeeds
+        failed = None
+        while True:
+            timeouts = []
+            if hedge_at is not None:
+                timeouts.append(max(0.0, hedge_at - time.monotonic()))
+            if deadline is not None:
+                timeouts.append(deadline.remaining())
+            done, pending = wait(pending, timeout=min(timeouts) if timeouts else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if self.retry.retries_response(response):
+                    # a fast error answer must not beat a slow success, the others are awaited
+                    if failed is not None:
+                        _close(failed)
+                    failed = response
+                    continue
+                for other in pending:
+                    other.cancel()
+                if failed is not None:
+                    _close(failed)
+                return response
+            if deadline is not None and deadline.expired:
+                for other in pending:
+                    other.cancel()
+                if failed is not None:
+                    _close(failed)
+                raise DeadlineExceeded("The deadline of the request has passed")
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                # the request is slow, a duplicate is sent and the first answer wins
+                futures.append(self.executor.submit(self._timed, send, deadline))
+                pending.add(futures[-1])
+                hedge_at = time.monotonic() + hedge_delay \
+                    if len(futures) <= self.hedge.max_hedges else None
+            elif not pending:
+                if failed is not None:
+                    return failed
+                raise error
+
+    def close(self):
+        '''Stops the worker threads, requests in flight are not waited for'''
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import threading
+
+
+def normalize_query(query: str) -> str:
+    '''
+    Query with runs of whitespace outside of string literals replaced by one space,
+    so queries that differ only in formatting are the same
+
+    Args:
+        query (str): WCPS query
+    Returns:
+        str
+    '''
+    parts = []
+    quoted = False
+    space = False
+    for char in query.strip():
+        if char == '"':
+            quoted = not quoted
+        if not quoted and char.isspace():
+            space = True
+            continue
+        if space:
+            parts.append(' ')
+            space = False
+        parts.append(char)
+    return ''.join(parts)
+
+
+def tree_key(tree) -> str:
+    '''
+    Key of the query compiled from a tree, based on its structural hash
+
+    The generated names of datacubes ($cN) are not a part of it, so two separately built
+    identical expressions have the same key although their query texts differ.
+
+    Args:
+        tree (QueryTree): tree that is compiled into the query
+    Returns:
+        str
+    '''
+    return 'tree:' + tree.structural_hash().hex()
+
+
+class _Call:
+    '''One request in flight and the callers waiting for it'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Runs one call per key at a time, concurrent callers with the same key share its result
+
+    A caller that arrives while a call with its key is in flight does not start another one,
+    it waits and receives the same result or the same error. The key is forgotten as soon
+    as the call is completed, so results are not cached.
+    '''
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout: float = None):
+        '''
+        Calls function, or waits for the call that is in flight for the same key
+
+        Args:
+            key: hashable key of the call (e.g. endpoint and normalized query)
+            function (callable): function without arguments that makes the call
+            timeout (float): (optional) seconds a waiting caller waits for the call in flight
+        Raises:
+            TimeoutError: if the call in flight was not completed within timeout
+            Exception: the error of the call
+        Returns:
+            the result of the call
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise TimeoutError("The shared request was not completed in time")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        '''Number of keys with a call in flight'''
+        with self._lock:
+            return len(self._calls)
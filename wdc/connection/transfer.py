@@ -0,0 +1,80 @@
+class TransferReport:
+    '''
+    Sizes of one result on its way from the server: on the wire, after HTTP decompression
+    and after decoding into an array
+    '''
+
+    def __init__(self, wire_bytes: int, content_bytes: int, content_encoding: str = None,
+                 encode_format: str = None, decoded_bytes: int = None, cached: bool = False,
+                 timing: dict = None):
+        '''
+        Args:
+            wire_bytes (int): bytes received from the server, compressed if the transfer was
+            content_bytes (int): bytes of the result after HTTP decompression
+            content_encoding (str): (optional) HTTP compression of the response, e.g. "gzip"
+            encode_format (str): (optional) format the result was encoded with by the server
+            decoded_bytes (int): (optional) bytes of the decoded array
+            cached (bool): True if the result came from the result cache and nothing was received
+            timing (dict): (optional) seconds of the network phases connect, ttfb and download
+        '''
+        self.wire_bytes = wire_bytes
+        self.content_bytes = content_bytes
+        self.content_encoding = content_encoding
+        self.encode_format = encode_format
+        self.decoded_bytes = decoded_bytes
+        self.cached = cached
+        self.timing = timing if timing is not None else {}
+
+    @property
+    def compression_ratio(self) -> float:
+        '''Content bytes per byte on the wire, 1.0 without HTTP compression'''
+        return self.content_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+    @property
+    def decoded_ratio(self):
+        '''Decoded bytes per byte on the wire, None if the result is not decoded'''
+        if self.decoded_bytes is None:
+            return None
+        return self.decoded_bytes / self.wire_bytes if self.wire_bytes else None
+
+    def __repr__(self):
+        return (f"TransferReport(wire_bytes={self.wire_bytes}, content_bytes={self.content_bytes}, "
+                f"decoded_bytes={self.decoded_bytes}, content_encoding={self.content_encoding}, "
+                f"encode_format={self.encode_format})")
+
+
+def wire_size(response) -> int:
+    '''
+    Number of bytes of a response body as received, before HTTP decompression
+
+    Args:
+        response: response whose content has been read
+    Returns:
+        int
+    '''
+    raw = getattr(response, 'raw', None)
+    try:
+        size = raw.tell()
+    except (AttributeError, OSError, ValueError, TypeError):
+        size = None
+    if isinstance(size, int) and size > 0:
+        return size
+    return len(response.content)
+
+
+def report_of(response, encode_format: str = None) -> TransferReport:
+    '''
+    Transfer report of a response whose content has been read
+
+    Args:
+        response: the response
+        encode_format (str): (optional) format the result was encoded with
+    Returns:
+        TransferReport
+    '''
+    headers = getattr(response, 'headers', None)
+    encoding = headers.get('Content-Encoding') if headers is not None else None
+    timing = getattr(response, 'timing', None)
+    return TransferReport(wire_size(response), len(response.content),
+                          encoding if isinstance(encoding, str) else None, encode_format,
+                          timing=dict(timing) if isinstance(timing, dict) else None)
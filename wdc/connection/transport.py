@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .singleflight import SingleFlight
+
+# seconds spent on getting a connection by the request running in this thread
+_connect_time = threading.local()
+
+
+def _add_connect_time(seconds: float):
+    _connect_time.seconds = getattr(_connect_time, 'seconds', 0.0) + seconds
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            return super()._get_conn(timeout)
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            return super()._get_conn(timeout)
+        finally:
+            _add_connect_time(time.perf_counter() - start)
+
+
+class _TimedAdapter(HTTPAdapter):
+    '''
+    Adapter that measures how long a request waits for a connection (taken from the pool or
+    newly opened, including TLS) and for the headers of the answer
+
+    The times are stored as response.timing with the phases connect and ttfb,
+    the transport adds download once the body has been read.
+    '''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        _connect_time.seconds = 0.0
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        elapsed = time.perf_counter() - start
+        connect = min(_connect_time.seconds, elapsed)
+        response.timing = {'connect': connect, 'ttfb': elapsed - connect}
+        return response
+
+
+class Transport:
+    '''
+    Class that owns a pooled, keep-alive HTTP session shared by the client requests
+
+    A single Transport keeps the TCP/TLS connections to the rasdaman server open between
+    requests, so repeated queries do not pay a new handshake each time.
+    The session is created lazily and can be used from several threads at once.
+
+    The asyncio methods are not natively asynchronous: every request in flight occupies one
+    worker thread, so at most max_concurrency requests run at a time and the others wait.
+    '''
+
+    # shared transport used by every ClientRequest that does not get its own one
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, pool_connections=10, pool_maxsize=32,
+                 connect_timeout=10.0, read_timeout=120.0,
+                 keep_alive=True, verify=True, max_concurrency=32, compress=True):
+        '''
+        Args:
+            pool_connections (int): number of hosts to keep connection pools for
+            pool_maxsize (int): maximum number of kept-alive connections per host
+            connect_timeout (float): seconds to wait for a connection to be established
+            read_timeout (float): seconds to wait between bytes of a response
+            keep_alive (bool): reuse connections between requests
+            verify (bool): verify TLS certificates of the server
+            max_concurrency (int): maximum number of requests in flight from asyncio code,
+                also the number of worker threads that run them (one thread per request)
+            compress (bool): ask the server for gzip or deflate compressed responses
+        '''
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self.verify = verify
+        self.max_concurrency = max_concurrency
+        self.compress = compress
+        self._session = None
+        self._executor = None
+        # one semaphore per event loop, asyncio primitives can not be shared between loops
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # identical queries in flight at the same time share one request
+        self.single_flight = SingleFlight()
+
+    @classmethod
+    def default(cls) -> 'Transport':
+        '''
+        Returns the process-wide transport, creating it on first use
+        '''
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls()
+        return cls._default
+
+    @classmethod
+    def set_default(cls, transport: 'Transport'):
+        '''
+        Replaces the process-wide transport, closing the previous one
+
+        Args:
+            transport (Transport): transport to be shared by new client requests
+        '''
+        with cls._default_lock:
+            previous = cls._default
+            cls._default = transport
+        if previous is not None and previous is not transport:
+            previous.close()
+
+    @property
+    def timeout(self):
+        '''(connect, read) timeout pair in the form accepted by requests'''
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def session(self) -> requests.Session:
+        '''
+        Session with mounted connection pools, created on first use
+        '''
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_session()
+        return self._session
+
+    def _make_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _TimedAdapter(pool_connections=self.pool_connections,
+                                pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.verify = self.verify
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        # responses are decompressed by requests, text encodings often shrink several times
+        session.headers['Accept-Encoding'] = 'gzip, deflate' if self.compress else 'identity'
+        return session
+
+    def get(self, url, **kwargs) -> requests.Response:
+        '''
+        Sends a GET request through the pooled session
+
+        Args:
+            url (str): request url
+            kwargs: further arguments for requests (e.g. stream, headers)
+        Returns:
+            response
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        return self._timed(self.session.get(url, **kwargs), start)
+
+    def post(self, url, data=None, **kwargs) -> requests.Response:
+        '''
+        Sends a POST request through the pooled session
+
+        Args:
+            url (str): request url
+            data (dict): form data of the request
+            kwargs: further arguments for requests (e.g. stream, headers)
+        Returns:
+            response
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        return self._timed(self.session.post(url, data=data, **kwargs), start)
+
+    @staticmethod
+    def _timed(response, start: float):
+        # the body of a response that is not streamed has been read after the headers
+        timing = getattr(response, 'timing', None)
+        if isinstance(timing, dict):
+            elapsed = time.perf_counter() - start
+            timing['download'] = max(0.0, elapsed - timing['connect'] - timing['ttfb'])
+        return response
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        '''
+        Worker threads that run the blocking requests of the asyncio methods
+
+        Every request in flight holds one of the max_concurrency threads until it is answered.
+        '''
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                        thread_name_prefix='wdc-transport')
+        return self._executor
+
+    def _semaphore(self, loop) -> asyncio.Semaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run_async(self, function, *args, **kwargs):
+        '''
+        Runs a blocking request function without blocking the event loop
+
+        The function runs on a worker thread of the executor, so the thread is held for the
+        whole request. At most max_concurrency calls are in flight per event loop, the others
+        wait for a free slot.
+
+        Args:
+            function: blocking function that uses this transport
+            args, kwargs: arguments of the function
+        Returns:
+            the result of the function
+        '''
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(function, *args, **kwargs))
+
+    def close(self):
+        '''
+        Closes all pooled connections and worker threads, they are recreated on next use
+        '''
+        with self._lock:
+            session = self._session
+            executor = self._executor
+            self._session = None
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if session is not None:
+            session.close()
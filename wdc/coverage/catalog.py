@@ -0,0 +1,342 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from wdc.connection.requester import ClientRequest
+
+
+def _local(tag: str) -> str:
+    '''Name of an XML tag without its namespace'''
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find(element, name: str):
+    '''First descendant with the given local name, or None'''
+    for child in element.iter():
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _find_all(element, name: str) -> list:
+    '''All descendants with the given local name, in document order'''
+    return [child for child in element.iter() if _local(child.tag) == name]
+
+
+def _parse_value(value: str):
+    '''Number if possible, otherwise the string without quotes (e.g. ansi dates)'''
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip('"')
+
+
+class CoverageDescription:
+    '''
+    In-memory model of a DescribeCoverage response
+    '''
+
+    def __init__(self, coverage_id, axis_labels, lower_bounds, upper_bounds,
+                 resolution=None, grid_size=None, crs=None, bands=None,
+                 coefficients=None, subtype=None):
+        '''
+        Args:
+            coverage_id (str): coverage id (e.g. "S2_L2A_32631_TCI_60m")
+            axis_labels (list): names of the axes in the order of the coverage (e.g. ansi, E, N)
+            lower_bounds (list): lower bound of every axis, numbers or ansi date strings
+            upper_bounds (list): upper bound of every axis
+            resolution (list): size of a grid cell along every axis, None for irregular axes
+            grid_size (list): number of grid cells along every axis
+            crs (str): name of the (compound) coordinate reference system
+            bands (list): pairs (band name, data type)
+            coefficients (dict): coordinates of the cells of irregular axes, e.g. the ansi dates
+            subtype (str): coverage subtype (e.g. "RectifiedGridCoverage")
+        '''
+        self.coverage_id = coverage_id
+        self.axis_labels = list(axis_labels)
+        self.lower_bounds = list(lower_bounds)
+        self.upper_bounds = list(upper_bounds)
+        self.resolution = list(resolution) if resolution is not None else [None] * len(axis_labels)
+        self.grid_size = list(grid_size) if grid_size is not None else [None] * len(axis_labels)
+        self.crs = crs
+        self.bands = [tuple(band) for band in bands] if bands is not None else []
+        self.coefficients = dict(coefficients) if coefficients is not None else {}
+        self.subtype = subtype
+
+    def bounds(self, axis: str) -> tuple:
+        '''
+        Returns (lower bound, upper bound) of an axis
+
+        Args:
+            axis (str): axis label (e.g. "E")
+        '''
+        i = self.axis_labels.index(axis)
+        return self.lower_bounds[i], self.upper_bounds[i]
+
+    def axis_resolution(self, axis: str):
+        '''Size of a grid cell along an axis, None for irregular axes'''
+        return self.resolution[self.axis_labels.index(axis)]
+
+    @classmethod
+    def from_xml(cls, content) -> 'CoverageDescription':
+        '''
+        Parses the first coverage of a DescribeCoverage response
+
+        Args:
+            content (bytes): XML document
+        Returns:
+            CoverageDescription
+        '''
+        root = ET.fromstring(content)
+        description = _find(root, 'CoverageDescription')
+        if description is None:
+            raise ValueError("No CoverageDescription in the response")
+        envelope = _find(description, 'Envelope')
+        axis_labels = envelope.get('axisLabels').split()
+        lower = [_parse_value(v) for v in _find(envelope, 'lowerCorner').text.split()]
+        upper = [_parse_value(v) for v in _find(envelope, 'upperCorner').text.split()]
+        crs = envelope.get('srsName')
+
+        domain = _find(description, 'domainSet')
+        grid_size = None
+        resolution = [None] * len(axis_labels)
+        coefficients = {}
+        if domain is not None:
+            low = _find(domain, 'low')
+            high = _find(domain, 'high')
+            if low is not None and high is not None:
+                grid_size = [int(h) - int(l) + 1
+                             for l, h in zip(low.text.split(), high.text.split())]
+            grid_axes = _find_all(domain, 'GeneralGridAxis')
+            if grid_axes:
+                # referenceable grid: one offset vector and optional coefficients per axis
+                for grid_axis in grid_axes:
+                    spanned = _find(grid_axis, 'gridAxesSpanned').text.strip()
+                    vector = [float(v) for v in _find(grid_axis, 'offsetVector').text.split()]
+                    values = _find(grid_axis, 'coefficients')
+                    if values is not None and values.text and values.text.strip():
+                        coefficients[spanned] = [_parse_value(v) for v in values.text.split()]
+                    else:
+                        resolution[axis_labels.index(spanned)] = max(abs(v) for v in vector)
+            else:
+                for i, vector in enumerate(_find_all(domain, 'offsetVector')):
+                    values = [abs(float(v)) for v in vector.text.split()]
+                    resolution[i] = max(values)
+
+        bands = []
+        for field in _find_all(description, 'field'):
+            quantity = _find(field, 'Quantity')
+            definition = quantity.get('definition', '') if quantity is not None else ''
+            bands.append((field.get('name'), definition.rsplit('/', 1)[-1] or None))
+        coverage_id = _find(description, 'CoverageId')
+        subtype = _find(description, 'CoverageSubtype')
+        return cls(coverage_id.text.strip() if coverage_id is not None else description.get(
+                       '{http://www.opengis.net/gml/3.2}id'),
+                   axis_labels, lower, upper, resolution=resolution, grid_size=grid_size,
+                   crs=crs, bands=bands, coefficients=coefficients,
+                   subtype=subtype.text.strip() if subtype is not None else None)
+
+    def to_dict(self) -> dict:
+        return {'coverage_id': self.coverage_id, 'axis_labels': self.axis_labels,
+                'lower_bounds': self.lower_bounds, 'upper_bounds': self.upper_bounds,
+                'resolution': self.resolution, 'grid_size': self.grid_size, 'crs': self.crs,
+                'bands': self.bands, 'coefficients': self.coefficients, 'subtype': self.subtype}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CoverageDescription':
+        return cls(**data)
+
+
+def parse_capabilities(content) -> dict:
+    '''
+    Parses the coverage summaries of a GetCapabilities response
+
+    Args:
+        content (bytes): XML document
+    Returns:
+        dict: coverage id -> coverage subtype
+    '''
+    return _summaries(ET.fromstring(content))
+
+
+def _summaries(root) -> dict:
+    '''Coverage id -> coverage subtype of a parsed GetCapabilities document'''
+    summaries = {}
+    for summary in _find_all(root, 'CoverageSummary'):
+        coverage_id = _find(summary, 'CoverageId')
+        subtype = _find(summary, 'CoverageSubtype')
+        summaries[coverage_id.text.strip()] = subtype.text.strip() if subtype is not None else None
+    return summaries
+
+
+def parse_formats(content) -> list:
+    '''
+    Parses the encode formats supported by the server from a GetCapabilities response
+
+    Args:
+        content (bytes): XML document
+    Returns:
+        list: formats, e.g. "image/png"
+    '''
+    return _formats(ET.fromstring(content))
+
+
+def _formats(root) -> list:
+    '''Encode formats of a parsed GetCapabilities document'''
+    return [element.text.strip() for element in _find_all(root, 'formatSupported')
+            if element.text and element.text.strip()]
+
+
+def _parse_capabilities_document(content) -> dict:
+    '''Coverage summaries and encode formats of a GetCapabilities response, parsed once'''
+    root = ET.fromstring(content)
+    return {'summaries': _summaries(root), 'formats': _formats(root)}
+
+
+class _Entry:
+    '''Parsed document together with the validators needed to revalidate it'''
+
+    def __init__(self, value, fetched_at, etag=None, last_modified=None):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class CoverageCatalog:
+    '''
+    Catalog of the coverages of a server, built from GetCapabilities and DescribeCoverage
+
+    Every document is downloaded and parsed once. After ttl seconds it is revalidated with
+    a conditional request (ETag/Last-Modified), so an unchanged document is not sent again.
+    The catalog can be saved to a file and loaded back for a warm start without the network.
+    '''
+
+    _CAPABILITIES = '__capabilities__'
+
+    def __init__(self, requester: ClientRequest = None, ttl: float = 3600.0):
+        '''
+        Args:
+            requester (ClientRequest): requester used to contact the server
+            ttl (float): seconds a parsed document is used without revalidation
+        '''
+        self.requester = requester if requester is not None else ClientRequest()
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, request, parse):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            return entry.value
+        headers = {}
+        if entry is not None:
+            if entry.etag is not None:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified is not None:
+                headers['If-Modified-Since'] = entry.last_modified
+        response = request(headers or None)
+        if entry is not None and response.status_code == 304:
+            entry.fetched_at = time.time()
+            return entry.value
+        response.raise_for_status()
+        entry = _Entry(parse(response.content), time.time(),
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        with self._lock:
+            self._entries[key] = entry
+        return entry.value
+
+    def _capabilities(self) -> dict:
+        '''Summaries and formats, both from the single cached GetCapabilities entry'''
+        return self._get(self._CAPABILITIES, self.requester.get_capabilities,
+                         _parse_capabilities_document)
+
+    def summaries(self) -> dict:
+        '''
+        Returns dict of coverage id -> coverage subtype from GetCapabilities
+        '''
+        return self._capabilities()['summaries']
+
+    def coverage_ids(self, prefix=None) -> list:
+        '''
+        Returns the ids of all coverages of the server
+
+        Args:
+            prefix (str or tuple): (optional) only return ids that start with the prefix
+        '''
+        ids = sorted(self.summaries())
+        if prefix is not None:
+            ids = [cov_id for cov_id in ids if cov_id.startswith(prefix)]
+        return ids
+
+    def formats(self) -> list:
+        '''
+        Returns the encode formats supported by the server from GetCapabilities
+        '''
+        return self._capabilities()['formats']
+
+    def describe(self, cov_id: str) -> CoverageDescription:
+        '''
+        Returns the parsed description of a coverage
+
+        Args:
+            cov_id (str): coverage id (e.g. "S2_L2A_32631_TCI_60m")
+        '''
+        return self._get(cov_id,
+                         lambda headers: self.requester.describe_coverage(cov_id, headers=headers),
+                         CoverageDescription.from_xml)
+
+    def cached(self, cov_id: str):
+        '''
+        Returns the description of a coverage if it is in the catalog, without any request
+        '''
+        with self._lock:
+            entry = self._entries.get(cov_id)
+        return entry.value if entry is not None else None
+
+    def save(self, path):
+        '''
+        Writes a snapshot of the catalog to a JSON file, atomically
+
+        Args:
+            path (str): file of the snapshot
+        '''
+        with self._lock:
+            entries = dict(self._entries)
+        snapshot = {}
+        for key, entry in entries.items():
+            value = entry.value if key == self._CAPABILITIES \
+                else entry.value.to_dict()
+            snapshot[key] = {'value': value, 'fetched_at': entry.fetched_at,
+                             'etag': entry.etag, 'last_modified': entry.last_modified}
+        path = os.fspath(path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, requester: ClientRequest = None, ttl: float = 3600.0) -> 'CoverageCatalog':
+        '''
+        Creates a catalog from a snapshot written by save
+
+        Args:
+            path (str): file of the snapshot
+            requester (ClientRequest): requester used for revalidation
+            ttl (float): seconds a parsed document is used without revalidation
+        Returns:
+            CoverageCatalog
+        '''
+        catalog = cls(requester=requester, ttl=ttl)
+        with open(path) as file:
+            snapshot = json.load(file)
+        for key, data in snapshot.items():
+            value = data['value'] if key == cls._CAPABILITIES \
+                else CoverageDescription.from_dict(data['value'])
+            catalog._entries[key] = _Entry(value, data['fetched_at'],
+                                           data['etag'], data['last_modified'])
+        return catalog
@@ -1,3 +1,4 @@
+import math
 import numpy as np
 import random
 import os
@@ -6,6 +7,9 @@ import sys
 current_directory = os.path.dirname(os.path.abspath(__file__))
 sprint_1_directory = os.path.abspath(os.path.join(current_directory, '..'))
 sys.path.append(sprint_1_directory)
+
+from wdc.helpers.subset import Subset
+
 class Coverage:
     '''
     Class containing coverages
@@ -26,4 +30,83 @@ class Coverage:
             return False
         self.index[index] = slice
         return True
-    
+
+    @staticmethod
+    def axis_bounds(cov_id: str, axis: str, default: tuple, catalog=None) -> tuple:
+        '''
+        Integer bounds of an axis of a coverage, taken from the catalog if one is given
+
+        Args:
+            cov_id (str): coverage id
+            axis (str): axis label (e.g. "Lat")
+            default (tuple): (lower, upper) bounds used without a catalog
+            catalog (CoverageCatalog): (optional) catalog of the server
+        Returns:
+            tuple: (lower, upper) bounds
+        '''
+        if catalog is None:
+            return default
+        low, high = catalog.describe(cov_id).bounds(axis)
+        return math.ceil(low), math.floor(high)
+
+    @staticmethod
+    def bounds_of(IDs: list, drawn: np.ndarray, axis: str, default: tuple, catalog=None) -> tuple:
+        '''
+        Integer bounds of an axis for every drawn coverage (see axis_bounds)
+
+        Args:
+            IDs (list): coverage ids
+            drawn (np.ndarray): positions in IDs of the drawn coverages
+            axis (str): axis label (e.g. "Lat")
+            default (tuple): (lower, upper) bounds used without a catalog
+            catalog (CoverageCatalog): (optional) catalog of the server
+        Returns:
+            tuple: arrays of the lower and the upper bounds
+        '''
+        bounds = np.array([Coverage.axis_bounds(cov_id, axis, default, catalog) for cov_id in IDs],
+                          dtype=np.int64).reshape(len(IDs), 2)
+        return bounds[drawn, 0], bounds[drawn, 1]
+
+    @staticmethod
+    def random_ranges(rng: np.random.Generator, low, high) -> tuple:
+        '''
+        Random ordered pairs low <= first <= second <= high, drawn at once for arrays of bounds
+
+        The first value is uniform between the bounds and the second is uniform between the
+        first value and the upper bound, as in randomize_coverage.
+
+        Args:
+            rng (np.random.Generator): random generator
+            low (np.ndarray): lower bounds
+            high (np.ndarray): upper bounds
+        Returns:
+            tuple: arrays of the first and the second values
+        '''
+        first = rng.integers(low, high, endpoint=True)
+        second = rng.integers(first, high, endpoint=True)
+        return first, second
+
+    @staticmethod
+    def axis_subsets(axis: str, first, second, as_subsets: bool = False) -> list:
+        '''
+        Subsets of one axis for arrays of bounds, a slice where both bounds are equal
+
+        Args:
+            axis (str): axis label (e.g. "E")
+            first (np.ndarray or list): lower bounds, numbers or dates
+            second (np.ndarray or list): upper bounds
+            as_subsets (bool): True for Subset objects, False for formatted strings like "E(1,2)"
+                or 'ansi("2021-04-08","2021-04-09")'
+        Returns:
+            list
+        '''
+        first = first.tolist() if isinstance(first, np.ndarray) else first
+        second = second.tolist() if isinstance(second, np.ndarray) else second
+        if as_subsets:
+            return [Subset(axis, low) if low == high else Subset(axis, low, high)
+                    for low, high in zip(first, second)]
+        if first and isinstance(first[0], str):
+            return [f'{axis}("{low}")' if low == high else f'{axis}("{low}","{high}")'
+                    for low, high in zip(first, second)]
+        return [f"{axis}({low})" if low == high else f"{axis}({low},{high})"
+                for low, high in zip(first, second)]
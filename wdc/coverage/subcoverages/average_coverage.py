@@ -1,3 +1,4 @@
+import datetime
 import numpy as np
 import random
 import os
@@ -11,6 +12,27 @@ from wdc.coverage.args_formatter import Formatting
 from wdc.coverage.coverage import Coverage
 
 class AverageCoverage(Coverage):
+    # all IDs of coverages of subtype Average
+    IDs = [ "AverageChloroColor",
+            "AverageChloroColorScaled",	
+            "AverageChloroColor_16",
+            "AverageChloroColor_2",
+            "AverageChloroColor_32",	
+            "AverageChloroColor_4",
+            "AverageChloroColor_64",
+            "AverageChloroColor_8",
+            "AvgLandTemp",
+            "AvgTemperatureColor",
+            "AvgTemperatureColorScaled",
+            "AvgTemperatureColor_16",
+            "AvgTemperatureColor_32",
+            "AvgTemperatureColor_4",
+            "AvgTemperatureColor_64",
+            "AvgTemperatureColor_8"]
+    ID_prefix = ("Average", "Avg")
+    Lat_bounds = (-90, 90)
+    Lon_bounds = (-180, 180)
+
     # initial values to use for coverages
     basic_subset = ["ansi(\"2015-01-01\",\"2015-05-01\")", 
                     "Lat(-90,90)",
@@ -59,31 +81,22 @@ class AverageCoverage(Coverage):
         return subsets
     
     @staticmethod
-    def randomize_coverage():
+    def randomize_coverage(catalog=None):
         '''
         Static method for taking a random ID of an Average coverage and random subsets of descriptive coverage values
         
+        Args:
+            catalog (CoverageCatalog): (optional) catalog to take the IDs and Lat, Lon bounds from
+        
         Return:
             name (str): coverage ID from the list of possible IDs
             subsets (list): list of formatted subsets of the ansi, Lat, Lon axis
         '''
         # all IDs of coverages of subtype Average
-        IDs = [ "AverageChloroColor",
-                "AverageChloroColorScaled",	
-                "AverageChloroColor_16",
-                "AverageChloroColor_2",
-                "AverageChloroColor_32",	
-                "AverageChloroColor_4",
-                "AverageChloroColor_64",
-                "AverageChloroColor_8",
-                "AvgLandTemp",
-                "AvgTemperatureColor",
-                "AvgTemperatureColorScaled",
-                "AvgTemperatureColor_16",
-                "AvgTemperatureColor_32",
-                "AvgTemperatureColor_4",
-                "AvgTemperatureColor_64",
-                "AvgTemperatureColor_8"]
+        if catalog is None:
+            IDs = AverageCoverage.IDs
+        else:
+            IDs = catalog.coverage_ids(prefix=AverageCoverage.ID_prefix)
     
         ["ansi(\"2015-01-01\",\"2015-05-01\")", 
                     "Lat(-90,90)",
@@ -95,25 +108,22 @@ class AverageCoverage(Coverage):
         days = ["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", 
                 "11", "12", "13", "14", "15", "16", "17", "18", "19", "20", 
                 "21", "22", "23", "24", "25", "26", "27", "28", "29", "30"]
-        Lats = np.arange(-90, 91)
-        Lons = np.arange(-180, 181)
         
         # pick random id
         name = random.choice(IDs)
+        lat_low, lat_high = Coverage.axis_bounds(name, "Lat", AverageCoverage.Lat_bounds, catalog)
+        lon_low, lon_high = Coverage.axis_bounds(name, "Lon", AverageCoverage.Lon_bounds, catalog)
 
         # pick random ansi
-        # the dates need to make sense chronologically
+        # the dates need to make sense chronologically, the second is not before the first
         year1 = year
         year2 = year
         month1 = random.choice(months)
-        month2 = random.choice(months)
-        while  months.index(month2) < months.index(month1)  :
-            month2 = random.choice(months)
+        month2 = months[random.randint(months.index(month1), len(months) - 1)]
         day1 = random.choice(days)
         day2 = random.choice(days)
         if month1 == month2:
-            while  days.index(day2) < days.index(day1)  :
-                day2 = random.choice(days)
+            day2 = days[random.randint(days.index(day1), len(days) - 1)]
             # check if values are the same
                 # then slice instead of trim
             if day1 == day2:
@@ -122,16 +132,16 @@ class AverageCoverage(Coverage):
                 month2 = None
         
         # pick random Lat
-        la1 = random.choice(Lats)
-        la2 = random.randint(la1, 90)
+        la1 = random.randint(lat_low, lat_high)
+        la2 = random.randint(la1, lat_high)
         # check if values are the same
             # then slice instead of trim
         if la1 == la2:
             la2 = None
         
         # pick random Lon
-        lo1 = random.choice(Lons)
-        lo2 = random.randint(lo1, 180)
+        lo1 = random.randint(lon_low, lon_high)
+        lo2 = random.randint(lo1, lon_high)
         # check if values are the same
             # then slice instead of trim
         if lo1 == lo2:
@@ -145,5 +155,47 @@ class AverageCoverage(Coverage):
         return name, subsets
         # example returns 
         # name = "AvgTemperatureColor_32"
-        # subsets = ['ansi("2015-01-26","2015-04-06")', 'Lat(21,25)', 'Lon(-44,126)']  
-    
+        # subsets = ['ansi("2015-01-26","2015-04-06")', 'Lat(21,25)', 'Lon(-44,126)']
+
+    @staticmethod
+    def randomize_coverages(n: int, seed=None, catalog=None, as_subsets: bool = False) -> list:
+        '''
+        Static method for drawing many random Average coverages and subsets at once, e.g. for load tests
+
+        The values are drawn with one numpy Generator call per axis for all n coverages. The dates
+        are valid days of the first four months of 2015 (up to the 30th, as in randomize_coverage),
+        the second date and the upper bounds are never before the first ones, equal bounds become
+        a slice.
+
+        Args:
+            n (int): number of coverages
+            seed: (optional) seed of np.random.default_rng, the same seed gives the same coverages
+            catalog (CoverageCatalog): (optional) catalog to take the IDs and Lat, Lon bounds from
+            as_subsets (bool): True for lists of Subset objects (e.g. for the index of a Datacube),
+                False for formatted subsets as returned by randomize_coverage
+
+        Return:
+            list: pairs (name, subsets) of the ansi, Lat, Lon axis
+        '''
+        if catalog is None:
+            IDs = AverageCoverage.IDs
+        else:
+            IDs = catalog.coverage_ids(prefix=AverageCoverage.ID_prefix)
+        first_day = datetime.date(2015, 1, 1)
+        dates = [(first_day + datetime.timedelta(days=i)).isoformat() for i in range(120)]
+        dates = [date for date in dates if int(date[-2:]) <= 30]
+        rng = np.random.default_rng(seed)
+
+        drawn = rng.integers(len(IDs), size=n)
+        day1, day2 = Coverage.random_ranges(rng, np.zeros(n, dtype=np.int64),
+                                            np.full(n, len(dates) - 1))
+        lat_low, lat_high = Coverage.bounds_of(IDs, drawn, "Lat", AverageCoverage.Lat_bounds, catalog)
+        la1, la2 = Coverage.random_ranges(rng, lat_low, lat_high)
+        lon_low, lon_high = Coverage.bounds_of(IDs, drawn, "Lon", AverageCoverage.Lon_bounds, catalog)
+        lo1, lo2 = Coverage.random_ranges(rng, lon_low, lon_high)
+
+        ansi = Coverage.axis_subsets("ansi", [dates[day] for day in day1.tolist()],
+                                     [dates[day] for day in day2.tolist()], as_subsets)
+        Lat = Coverage.axis_subsets("Lat", la1, la2, as_subsets)
+        Lon = Coverage.axis_subsets("Lon", lo1, lo2, as_subsets)
+        return [(IDs[i], [a, la, lo]) for i, a, la, lo in zip(drawn.tolist(), ansi, Lat, Lon)]
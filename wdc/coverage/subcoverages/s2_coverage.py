@@ -11,6 +11,16 @@ from wdc.coverage.args_formatter import Formatting
 from wdc.coverage.coverage import Coverage
 
 class S2Coverage(Coverage):
+    # all IDs of coverages of subtype S2
+    IDs = [ "S2_L2A_32631_B01_60m",
+            "S2_L2A_32631_B03_10m",	
+            "S2_L2A_32631_B04_10m",
+            "S2_L2A_32631_B08_10m",
+            "S2_L2A_32631_B12_20m",	
+            "S2_L2A_32631_TCI_60m"]
+    ID_prefix = "S2_L2A_32631_"
+    E_bounds = (669960, 729960)
+    N_bounds = (4990200, 5015220)
 
     # initial values to use for coverages
     basic_subset = ["ansi(\"2021-04-08\",\"2021-04-10\")", 
@@ -60,42 +70,41 @@ class S2Coverage(Coverage):
         return subsets
     
     @staticmethod
-    def randomize_coverage():
+    def randomize_coverage(catalog=None):
         '''
         Static method for taking a random ID of an S2 coverage and random subsets of descriptive coverage values
         
+        Args:
+            catalog (CoverageCatalog): (optional) catalog to take the IDs and E, N bounds from
+        
         Return:
             name (str): coverage ID from the list of possible IDs
             subsets (list): list of formatted subsets of the ansi, E, N axis
         '''
         # all IDs of coverages of subtype S2
-        IDs = [ "S2_L2A_32631_B01_60m",
-                "S2_L2A_32631_B03_10m",	
-                "S2_L2A_32631_B04_10m",
-                "S2_L2A_32631_B08_10m",
-                "S2_L2A_32631_B12_20m",	
-                "S2_L2A_32631_TCI_60m"]
+        if catalog is None:
+            IDs = S2Coverage.IDs
+        else:
+            IDs = catalog.coverage_ids(prefix=S2Coverage.ID_prefix)
     
         # values for ansi, E, N
         year = "2021"
         month = "04"
         days = ["08", "09", "10"]
-        Es = np.arange(669960, 729961)
-        Ns = np.arange(4990200, 5015221)
         
         # pick random id
         name = random.choice(IDs)
+        e_low, e_high = Coverage.axis_bounds(name, "E", S2Coverage.E_bounds, catalog)
+        n_low, n_high = Coverage.axis_bounds(name, "N", S2Coverage.N_bounds, catalog)
 
         # pick random ansi
-        # the dates need to make sense chronologically
+        # the dates need to make sense chronologically, the second is not before the first
         year1 = year
         month1 = month
         year2 = year
         month2 = month
         day1 = random.choice(days)
-        day2 = random.choice(days)
-        while  days.index(day2) < days.index(day1)  :
-            day2 = random.choice(days)
+        day2 = days[random.randint(days.index(day1), len(days) - 1)]
         # check if values are the same
             # then slice instead of trim
         if day1 == day2:
@@ -104,16 +113,16 @@ class S2Coverage(Coverage):
             month2 = None
         
         # pick random E
-        e1 = random.choice(Es)
-        e2 = random.randint(e1, 729960)
+        e1 = random.randint(e_low, e_high)
+        e2 = random.randint(e1, e_high)
         # check if values are the same
             # then slice instead of trim
         if e1 == e2:
             e2 = None
         
         # pick random N
-        n1 = random.choice(Ns)
-        n2 = random.randint(n1, 5015220)
+        n1 = random.randint(n_low, n_high)
+        n2 = random.randint(n1, n_high)
         # check if values are the same
             # then slice instead of trim
         if n1 == n2:
@@ -128,3 +137,43 @@ class S2Coverage(Coverage):
         # example returns 
         # name = "S2_L2A_32631_B04_10m"
         # subsets = ['ansi("2021-04-10")', 'E(719222,725355)', 'N(4997150,4999144)'] 
+
+    @staticmethod
+    def randomize_coverages(n: int, seed=None, catalog=None, as_subsets: bool = False) -> list:
+        '''
+        Static method for drawing many random S2 coverages and subsets at once, e.g. for load tests
+
+        The values are drawn with one numpy Generator call per axis for all n coverages, with
+        the same distribution as randomize_coverage: the second date and the upper bounds are
+        never before the first ones, equal bounds become a slice.
+
+        Args:
+            n (int): number of coverages
+            seed: (optional) seed of np.random.default_rng, the same seed gives the same coverages
+            catalog (CoverageCatalog): (optional) catalog to take the IDs and E, N bounds from
+            as_subsets (bool): True for lists of Subset objects (e.g. for the index of a Datacube),
+                False for formatted subsets as returned by randomize_coverage
+
+        Return:
+            list: pairs (name, subsets) of the ansi, E, N axis
+        '''
+        if catalog is None:
+            IDs = S2Coverage.IDs
+        else:
+            IDs = catalog.coverage_ids(prefix=S2Coverage.ID_prefix)
+        dates = ["2021-04-08", "2021-04-09", "2021-04-10"]
+        rng = np.random.default_rng(seed)
+
+        drawn = rng.integers(len(IDs), size=n)
+        last = np.full(n, len(dates) - 1)
+        day1, day2 = Coverage.random_ranges(rng, np.zeros(n, dtype=np.int64), last)
+        e_low, e_high = Coverage.bounds_of(IDs, drawn, "E", S2Coverage.E_bounds, catalog)
+        e1, e2 = Coverage.random_ranges(rng, e_low, e_high)
+        n_low, n_high = Coverage.bounds_of(IDs, drawn, "N", S2Coverage.N_bounds, catalog)
+        n1, n2 = Coverage.random_ranges(rng, n_low, n_high)
+
+        ansi = Coverage.axis_subsets("ansi", [dates[day] for day in day1.tolist()],
+                                     [dates[day] for day in day2.tolist()], as_subsets)
+        E = Coverage.axis_subsets("E", e1, e2, as_subsets)
+        N = Coverage.axis_subsets("N", n1, n2, as_subsets)
+        return [(IDs[i], [a, e, n]) for i, a, e, n in zip(drawn.tolist(), ansi, E, N)]
@@ -1,22 +1,40 @@
+import os
+import tempfile
+import time
 from numbers import Number
 
 from wdc.coverage.args_formatter import Formatting
 from wdc.helpers.subset import Subset
+from wdc.helpers import decoders
+from wdc.helpers import tiling
 from .tree.query_tree import QueryTree
 from .action import Action
 from .connection.requester import ClientRequest
+from .connection.batch import fetch_batch
+from .connection.transfer import TransferReport
+from .connection import instrumentation
+from .connection.singleflight import tree_key
 from .tree.tree_parser import make_process_query_from_tree
+from .tree.optimizer import optimize_tree, make_constant
+from .tree.query_tree import Node
+from .tree import numpy_engine
+from .tree import cost
 from typing import List
 
+DEFAULT_LINK = 'https://ows.rasdaman.org/rasdaman/ows'
+DEFAULT_COVERAGE = "S2_L2A_32631_TCI_60m"
+
 class Datacube:
     """
     Datacube python object based on rasdaman datacubes
     Uses tree-like data structure to store operations like +, avg, ...
     """
     counter = 0  # Class attribute to enumerate new datacubes
+    # Requester shared by all datacubes, it reuses the pooled connections of the default transport
+    requester = ClientRequest()
 
-    def __init__(self, link='https://ows.rasdaman.org/rasdaman/ows',
-                 index:List[Subset]=None, coverage_name="S2_L2A_32631_TCI_60m") -> None:
+    def __init__(self, link=DEFAULT_LINK,
+                 index:List[Subset]=None, coverage_name=DEFAULT_COVERAGE) -> None:
         
         if index == None:
             self.index = index
@@ -26,7 +44,6 @@ class Datacube:
 
         self.__tree = QueryTree(self)
         self.coverage_name = coverage_name
-        self.requester = ClientRequest()
         self.name = f'c{Datacube.counter}'
         Datacube.counter += 1
         self.link = link
@@ -54,8 +71,14 @@ class Datacube:
 
     @classmethod
     def __from_tree(cls, tree: QueryTree):
-        cube = Datacube()
-        cube.set_tree(tree)
+        # same as Datacube() followed by set_tree, without building a leaf node that is thrown away
+        cube = Datacube.__new__(Datacube)
+        cube.index = None
+        cube.__tree = tree
+        cube.coverage_name = DEFAULT_COVERAGE
+        cube.name = f'c{Datacube.counter}'
+        Datacube.counter += 1
+        cube.link = DEFAULT_LINK
         return cube
 
     @classmethod
@@ -176,12 +199,29 @@ class Datacube:
             params={"slice": Formatting.subsets_format(index)})
         return self.__from_tree(new_tree)
 
+    def sum(self, index: List[Subset] = []) -> 'Datacube':
+        """
+        Return a datacube that has aggregate query (the sum of all values) as the last operation
+
+        Args:
+            index (str, optional): index for aggregate query. Defaults to empty List.
+        Returns:
+            _type_: datacube
+        """
+        if index == []:
+            return Datacube.__from_tree(self.__tree.append_action(action=Action.SUM))
+        new_tree = self.__tree.append_action(action=Action.SUM,
+            params={"slice": Formatting.subsets_format(index)})
+        return self.__from_tree(new_tree)
+
     def encode(self, encode_format: str) -> 'Datacube':
         """
         Encode the final result to the desired format
 
         Args:
-            encode_format (str): encode format (img/png, text/csv, ...)
+            encode_format (str): encode format (img/png, text/csv, ...), or "auto" for the most
+                compact lossless format for the data type and shape of the result,
+                chosen when the datacube is fetched
         Returns:
             Datacube: the datacube after applying encode
         """
@@ -219,12 +259,526 @@ class Datacube:
                                                           action=Action.REFACTOR, params=params))
 
 
-    def fetch(self):
+    def optimize(self, push_down: bool = False) -> 'Datacube':
+        """
+        Return an equivalent datacube with a simplified tree (folded constants, removed identities, ...)
+        that produces a smaller query
+
+        Args:
+            push_down (bool): also move subindexes through arithmetic down to the leaves,
+                so the server only computes the requested window
+        Returns:
+            Datacube: the optimized datacube
+        """
+        return Datacube.__from_tree(optimize_tree(self.__tree, push_down=push_down))
+
+    def evaluate_local(self, bindings: dict, coordinates: dict = None,
+                       chunk_size: int = numpy_engine.CHUNK_SIZE) -> decoders.DecodedResult:
+        """
+        Evaluating the datacube locally on numpy arrays, without a request to the server
+
+        Args:
+            bindings (dict): leaf datacube (or its name) -> np.ndarray or DecodedResult
+                with its data, e.g. fetched earlier with fetch_array
+            coordinates (dict): (optional) axis -> coordinates of the cells, shared by all leaves
+            chunk_size (int): number of elements processed at once by elementwise expressions
+        Returns:
+            DecodedResult: the result with its axis labels
+        """
+        bindings = {(key.name if isinstance(key, Datacube) else key): value
+                    for key, value in bindings.items()}
+        return numpy_engine.evaluate_tree(self.__tree, bindings, coordinates, chunk_size)
+
+    def explain(self, catalog=None, max_bytes: int = None,
+                warn_bytes: int = cost.WARN_BYTES) -> cost.QueryEstimate:
+        """
+        Compiling the query without sending it and estimating its result and cost
+
+        The estimate uses the descriptions of the coverages (extent, resolution, dates, bands)
+        and the subsets and actions of the tree. Descriptions that are already in the catalog
+        are used without a request.
+
+        Args:
+            catalog (CoverageCatalog): (optional) catalog that describes the coverages
+            max_bytes (int): (optional) largest allowed result, a larger or unknown one is refused
+            warn_bytes (int): size of the result above which a LargeQueryWarning is issued
+        Raises:
+            QueryTooLarge: if the estimated result is larger than max_bytes
+        Returns:
+            QueryEstimate: the query with its estimated shape, data type, size and server work
+        """
+        return cost.check_estimate(cost.estimate_tree(self.__tree, catalog), max_bytes, warn_bytes)
+
+    def fetch(self, deadline=None, max_bytes: int = None, catalog=None):
         """
         Fetching and loading data from a server according to the qurrent request 
 
+        Args:
+            deadline (Deadline or float): (optional) deadline or seconds for the whole fetch,
+                including retries
+            max_bytes (int): (optional) the query is not sent if its estimated result is larger
+                (see explain)
+            catalog (CoverageCatalog): (optional) catalog used for the estimate of max_bytes
+        Raises:
+            QueryTooLarge: if the estimated result is larger than max_bytes
+        Returns:
+            data: the context of a request
+        """
+        if max_bytes is not None:
+            self.explain(catalog, max_bytes=max_bytes)
+        content, _, record = instrumentation.send_tree(self.requester,
+                                                       self.resolved_tree(catalog), deadline)
+        if record is not None:
+            instrumentation.emit(record)
+        return content
+
+    def fetch_array(self, dtype=None, shape: tuple = None, catalog=None) -> decoders.DecodedResult:
+        """
+        Fetching data from a server and decoding it into a numpy array
+
+        The decoder is chosen by the encode format of the datacube (see decoders.register_decoder).
+        Raw results (application/octet-stream) are read-only views of the received bytes without
+        a copy, their data type and shape are taken from the catalog and the index if not given.
+        With the encode format "auto" the most compact lossless format is used.
+
+        Args:
+            dtype: (optional) data type of raw results
+            shape (tuple): (optional) shape of raw results
+            catalog (CoverageCatalog): (optional) catalog that gives the axes and the bands
+        Returns:
+            DecodedResult: the array with its shape, data type and axis labels, and the sizes
+                of the transfer
+        """
+        tree = self.resolved_tree(catalog)
+        root = tree.root
+        encode_format = root.params['encode format'] if root.action == Action.ENCODE else None
+        body = root.children[0] if encode_format is not None else root
+        labels, sizes, band_dtype = Datacube.__result_layout(body, catalog)
+        if decoders.is_raw(encode_format):
+            dtype = dtype if dtype is not None else band_dtype
+            if shape is None and labels is not None and None not in sizes:
+                shape = tuple(sizes)
+        content, transfer, record = instrumentation.send_tree(self.requester, tree)
+        start = time.perf_counter()
+        data = decoders.decode(content, encode_format, dtype=dtype, shape=shape)
+        if record is not None:
+            record.phases['decode'] = time.perf_counter() - start
+            record.encode_format = encode_format
+            instrumentation.emit(record)
+        if labels is not None and decoders.is_image(encode_format):
+            labels = tiling.image_axes(labels)
+            if data.ndim == 3:
+                labels = labels + ['band']
+        if labels is not None and len(labels) != data.ndim:
+            labels = None
+        if transfer is not None:
+            transfer = TransferReport(transfer.wire_bytes, transfer.content_bytes,
+                                      transfer.content_encoding, encode_format,
+                                      data.nbytes, transfer.cached)
+        return decoders.DecodedResult(data, labels, encode_format, transfer=transfer)
+
+    def resolved_tree(self, catalog=None) -> QueryTree:
+        """
+        The tree that is sent to the server: the encode format "auto" is replaced by the most
+        compact lossless format (or dropped for a single number), other trees are unchanged
+
+        Args:
+            catalog (CoverageCatalog): (optional) catalog that gives the data type, the shape
+                and the formats of the server, the default formats are used without it
+        Returns:
+            QueryTree
+        """
+        root = self.__tree.root
+        if root.action != Action.ENCODE or root.params['encode format'] != decoders.AUTO_FORMAT:
+            return self.__tree
+        body = QueryTree.from_root(root.children[0])
+        encode_format = Datacube.__auto_format(body, catalog)
+        if encode_format is None:
+            return body
+        return body.append_action(action=Action.ENCODE, params={"encode format": encode_format})
+
+    @staticmethod
+    def __auto_format(body: QueryTree, catalog=None, shape: tuple = None, raw: bool = True):
+        estimate = cost.estimate_tree(body, catalog)
+        supported = catalog.formats() if catalog is not None and hasattr(catalog, 'formats') \
+            else list(decoders.DEFAULT_FORMATS)
+        if not raw:
+            supported = [encode_format for encode_format in supported
+                         if not decoders.is_raw(encode_format)]
+        return decoders.compact_format(estimate.dtype, shape if shape is not None else estimate.shape,
+                                       supported)
+
+    @staticmethod
+    def __result_layout(body, catalog):
+        # axes (without slices) and their number of cells and the data type of the bands
+        if body.action in (Action.MIN, Action.MAX, Action.AVG, Action.SUM):
+            return [], [], None
+        try:
+            index = Datacube.__own_index(body)
+        except ValueError:
+            index = None
+        subsets = Subset.parse(index) if index else []
+        description = None
+        if catalog is not None:
+            try:
+                description = catalog.describe(Datacube.__coverage_name(body))
+            except ValueError:
+                pass
+        if description is None and not subsets:
+            return None, None, None
+        axes = description.axis_labels if description is not None \
+            else [subset.operation for subset in subsets]
+        trims = {subset.operation: subset for subset in subsets}
+        labels = []
+        sizes = []
+        for i, axis in enumerate(axes):
+            subset = trims.get(axis)
+            if subset is not None and subset.is_slice():
+                continue
+            size = None
+            if subset is None and description is not None:
+                size = description.grid_size[i]
+            elif subset is not None and description is not None \
+                    and description.resolution[i] is not None \
+                    and not isinstance(subset.values[0], str):
+                low, high = sorted(subset.values)
+                size = tiling.split_axis(low, high, description.resolution[i], 1 << 62,
+                                         description.lower_bounds[i])[0][1]
+            labels.append(axis)
+            sizes.append(size)
+        band_dtype = decoders.band_dtype(description.bands) if description is not None else None
+        return labels, sizes, band_dtype
+
+    def fetch_stream(self, chunk_size: int = 65536, catalog=None, deadline=None):
+        """
+        Fetching data from a server as an iterator of chunks, without loading the whole result
+
+        Failed requests are retried until the answer starts, an error while reading
+        the chunks is not (see ClientRequest.stream_query).
+
+        Args:
+            chunk_size (int): maximum number of bytes per chunk
+            catalog (CoverageCatalog): (optional) catalog used to resolve the encode format "auto"
+            deadline (Deadline or float): (optional) deadline or seconds until the answer starts,
+                including retries
+        Returns:
+            iterator over chunks of bytes
+        """
+        return self.requester.stream_query(make_process_query_from_tree(self.resolved_tree(catalog)),
+                                           chunk_size=chunk_size, deadline=deadline)
+
+    def fetch_to(self, path_or_file, chunk_size: int = 65536, catalog=None, deadline=None) -> int:
+        """
+        Fetching data from a server straight into a file
+
+        A path is written atomically: data goes to a temporary file that replaces
+        the target only after the whole response has been received.
+
+        Args:
+            path_or_file: path of the output file or a binary file object
+            chunk_size (int): maximum number of bytes per chunk
+            catalog (CoverageCatalog): (optional) catalog used to resolve the encode format "auto"
+            deadline (Deadline or float): (optional) deadline or seconds until the answer starts,
+                including retries
+        Returns:
+            int: number of bytes written
+        """
+        chunks = self.fetch_stream(chunk_size=chunk_size, catalog=catalog, deadline=deadline)
+        if hasattr(path_or_file, 'write'):
+            return Datacube.__write_chunks(chunks, path_or_file)
+        path = os.fspath(path_or_file)
+        # every fetch has a temporary file of its own, also if several write to the same path
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                written = Datacube.__write_chunks(chunks, file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    @staticmethod
+    def __write_chunks(chunks, file) -> int:
+        written = 0
+        for chunk in chunks:
+            file.write(chunk)
+            written += len(chunk)
+        return written
+
+    @classmethod
+    def fetch_many(cls, cubes: List['Datacube'], max_workers: int = 8, ordered: bool = True,
+                   deadline=None, catalog=None):
+        """
+        Fetching several datacubes in parallel instead of one after another
+
+        Args:
+            cubes (list): datacubes to be fetched
+            max_workers (int): maximum number of requests running at the same time
+            ordered (bool): if True, a list in the order of cubes is returned,
+                otherwise an iterator that yields results as they are completed
+            deadline (Deadline or float): (optional) deadline or seconds for the whole batch
+            catalog (CoverageCatalog): (optional) catalog used to resolve the encode format "auto"
+        Returns:
+            list or iterator of FetchResult, each with the data or the error of one datacube
+        """
+        return fetch_batch(cubes, max_workers=max_workers, ordered=ordered, deadline=deadline,
+                           catalog=catalog)
+
+    def fetch_tiled(self, tile_size=512, window: dict = None, catalog=None, resolution: dict = None,
+                    max_workers: int = 8, retries: int = 1, decode=None):
+        """
+        Fetching a large spatial window as a grid of small tiles that are downloaded in parallel
+        and stitched into one array
+
+        Every tile is a subindex of the same tree (one query per tile), aligned to the grid of
+        the coverage, so tiles neither overlap nor leave gaps. Failed tiles are fetched again.
+
+        Args:
+            tile_size (int or tuple): maximum tile size in grid cells, (width, height) or one number
+            window (dict): (optional) axis -> (lower, upper) trims to be split, by default the
+                trims of the index of the datacube (or of its last subindex)
+            catalog (CoverageCatalog): (optional) catalog that gives the resolution and the grid origin
+            resolution (dict): (optional) axis -> size of a grid cell, used instead of the catalog
+            max_workers (int): maximum number of tiles downloaded at the same time
+            retries (int): number of times failed tiles are fetched again
+            decode (callable): (optional) function that turns the bytes of a tile into an array,
+                by default the decoder registered for the encode format
+        Raises:
+            ValueError: if the datacube is not encoded or the window or resolution are unknown
+        Returns:
+            np.ndarray: rows along the y axis (north up), columns along the x axis
+        """
+        root = self.__tree.root
+        if root.action != Action.ENCODE:
+            raise ValueError("Tiled fetch needs an encoded datacube, use encode() first")
+        body = root.children[0]
+        if window is None:
+            window = tiling.trimmed_window(Datacube.__own_index(body))
+        axes = tiling.spatial_axes(window)
+        origin = {}
+        if resolution is None:
+            if catalog is None:
+                raise ValueError("Tiled fetch needs a catalog or the resolution of the axes")
+            description = catalog.describe(Datacube.__coverage_name(body))
+            resolution = {axis: description.axis_resolution(axis) for axis in axes}
+            origin = {axis: description.bounds(axis)[0] for axis in axes}
+        shape, tiles = tiling.make_tiles(window, axes, resolution, tile_size, origin)
+
+        body_tree = QueryTree.from_root(body)
+        params = root.params
+        if params['encode format'] == decoders.AUTO_FORMAT:
+            # every tile is an image, raw tiles would need their shape to be decoded
+            params = {"encode format": Datacube.__auto_format(body_tree, catalog, (1, 1), raw=False)}
+        cubes = []
+        for tile in tiles:
+            tree = body_tree.append_action(action=Action.SUBINDEX,
+                                           params={"index": Formatting.subsets_format(tile.subsets)})
+            cube = Datacube.__from_tree(tree.append_action(action=Action.ENCODE, params=params))
+            cube.requester = self.requester
+            cubes.append(cube)
+
+        results = fetch_batch(cubes, max_workers=max_workers)
+        for _ in range(retries):
+            failed = [result.index for result in results if not result.ok]
+            if not failed:
+                break
+            for result in fetch_batch([cubes[i] for i in failed], max_workers=max_workers):
+                results[failed[result.index]] = result
+        if decode is None:
+            encode_format = params['encode format']
+            decode = lambda data: decoders.decode(data, encode_format)
+        return tiling.stitch(shape, tiles, [decode(result.result()) for result in results])
+
+    def fetch_split(self, axis: str, parts: int = 4, catalog=None, max_workers: int = 8):
+        """
+        Computing an aggregate (min, max, avg, sum) as several smaller aggregates in parallel
+
+        The domain of the aggregate is split along one axis into parts, e.g. groups of dates of
+        the ansi axis or stripes of E. Every part is an own query, the results are combined
+        exactly on the client: the minimum of minimums, the maximum of maximums and for the
+        average the sum of sums divided by the sum of counts.
+
+        Args:
+            axis (str): axis along which the domain is split (e.g. "ansi" or "E")
+            parts (int): maximum number of parts
+            catalog (CoverageCatalog): catalog that gives the dates or the grid of the axis
+            max_workers (int): maximum number of parts computed at the same time
+        Raises:
+            ValueError: if the last operation is not an aggregate or the axis can not be split
+        Returns:
+            int or float: the aggregate
+        """
+        root = self.__tree.root
+        if root.action == Action.ENCODE:
+            root = root.children[0]
+        if root.action not in (Action.MIN, Action.MAX, Action.AVG, Action.SUM):
+            raise ValueError("Split execution needs an aggregate (min, max, avg, sum) "
+                             "as the last operation")
+        child = root.children[0]
+        index = root.params.get('slice') if root.params is not None else None
+        trims = {subset.operation: subset for subset in Subset.parse(index)} if index else {}
+        if axis not in trims:
+            try:
+                own_index = Datacube.__own_index(child)
+            except ValueError:
+                own_index = None
+            if own_index:
+                trims.update({subset.operation: subset for subset in Subset.parse(own_index)
+                              if subset.operation == axis})
+        description = catalog.describe(Datacube.__coverage_name(child)) \
+            if catalog is not None else None
+        if axis in trims:
+            if trims[axis].is_slice():
+                raise ValueError(f"The axis {axis} is sliced, it can not be split")
+            low, high = trims[axis].values
+        elif description is not None:
+            low, high = description.bounds(axis)
+        else:
+            raise ValueError(f"The bounds of {axis} are unknown, a catalog is needed")
+        resolution = origin = coefficients = None
+        if description is not None:
+            coefficients = description.coefficients.get(axis)
+            resolution = description.axis_resolution(axis)
+            origin = description.bounds(axis)[0]
+        windows = tiling.split_domain(axis, low, high, parts, resolution, origin, coefficients)
+
+        # (kind of partial aggregate, node) for every part, the average needs sums and counts
+        others = [subset for subset in Subset.parse(index) if subset.operation != axis] \
+            if index else []
+        partials = []
+        for window in windows:
+            # the part replaces the trim of the axis, the other subsets of the slice stay
+            params = {"slice": Formatting.subsets_format(others + [window])}
+            if root.action == Action.AVG:
+                ones = Node(action=Action.ADD, children=(
+                    Node(action=Action.MULT, children=(child, make_constant(0))), make_constant(1)))
+                partials.append(('sum', Node(action=Action.SUM, params=params, children=(child,))))
+                partials.append(('count', Node(action=Action.SUM, params=params, children=(ones,))))
+            else:
+                partials.append((root.action, Node(action=root.action, params=params,
+                                                   children=(child,))))
+        cubes = []
+        for _, node in partials:
+            cube = Datacube.__from_tree(QueryTree.from_root(node))
+            cube.requester = self.requester
+            cubes.append(cube)
+        values = [decoders.decode(result.result(), None).item()
+                  for result in fetch_batch(cubes, max_workers=max_workers)]
+        if root.action == Action.AVG:
+            sums = sum(value for (kind, _), value in zip(partials, values) if kind == 'sum')
+            counts = sum(value for (kind, _), value in zip(partials, values) if kind == 'count')
+            return sums / counts
+        if root.action == Action.MIN:
+            return min(values)
+        if root.action == Action.MAX:
+            return max(values)
+        return sum(values)
+
+    def timeseries(self, dates: list, window: List[Subset] = None, catalog=None,
+                   encode_format: str = "application/json") -> decoders.DecodedResult:
+        """
+        Fetching the values of a pixel or a small window for many dates with one query
+
+        Instead of one query per date, the ansi axis is trimmed from the first to the last date
+        and the result is split on the client: the dates of the trim are taken from the catalog
+        and only the requested ones are kept.
+
+        Args:
+            dates (list): dates as "YYYY-MM-DD" strings (or full ansi coordinates)
+                or (year, month, day) tuples
+            window (list): (optional) subsets of the other axes, e.g. slices of E and N for a pixel
+            catalog (CoverageCatalog): (optional) catalog that gives the dates of the ansi axis,
+                without it the trim must contain exactly the requested dates
+            encode_format (str): format of the single query, it must keep all dimensions
+        Raises:
+            ValueError: if a date is invalid or is not a date of the coverage
+        Returns:
+            DecodedResult: array with the dates along the first axis, in the order of dates,
+                the dates are in coordinates['ansi']
+        """
+        if not dates:
+            raise ValueError("At least one date is needed")
+        if self.__tree.root.action == Action.ENCODE:
+            raise ValueError("The time series is encoded by timeseries(), do not use encode() first")
+        dates = [Datacube.__ansi_date(date) for date in dates]
+        trim = Subset("ansi", min(dates), max(dates))
+        subsets = [subset for subset in (window or []) if subset.operation != "ansi"] + [trim]
+        tree = self.__tree.append_action(action=Action.SUBINDEX,
+                                         params={"index": Formatting.subsets_format(subsets)})
+        cube = Datacube.__from_tree(tree.append_action(action=Action.ENCODE,
+                                                       params={"encode format": encode_format}))
+        cube.requester = self.requester
+        data = decoders.decode(cube.fetch(), encode_format)
+        if data.ndim == 0:
+            data = data.reshape(1)
+
+        cells = None
+        if catalog is not None:
+            description = catalog.describe(Datacube.__coverage_name(tree.root))
+            coefficients = description.coefficients.get("ansi")
+            if coefficients:
+                cells = tiling.axis_cells(coefficients, trim.values[0], trim.values[1])
+        if cells is None:
+            if data.shape[0] != len(set(dates)):
+                raise ValueError("The dates of the ansi axis are unknown, a catalog is needed")
+            cells = sorted(set(dates))
+        if len(cells) != data.shape[0]:
+            raise ValueError(f"The result has {data.shape[0]} dates, the catalog {len(cells)}")
+        positions = tiling.cell_positions(cells, dates)
+        labels = Datacube.__result_layout(tree.root, catalog)[0]
+        if labels is None or len(labels) != data.ndim:
+            labels = None
+        return decoders.DecodedResult(data[positions], labels, encode_format,
+                                      coordinates={"ansi": [cells[i] for i in positions]})
+
+    @staticmethod
+    def __ansi_date(date) -> str:
+        # validated with the ansi helpers, a full coordinate keeps its time of day
+        if isinstance(date, (tuple, list)):
+            # parts are numbers or strings, e.g. (2021, 4, 9) or ("2021", "04", "09")
+            try:
+                year, month, day = (int(part) for part in date)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid date: {date}") from None
+            text = f"{year:04d}-{month:02d}-{day:02d}"
+        else:
+            text = str(date)
+        parts = text[:10].split("-")
+        if len(parts) != 3 or Formatting.ansi_sliceformat(*parts) == "Invalid date format":
+            raise ValueError(f"Invalid date: {date}")
+        return text
+
+    @staticmethod
+    def __own_index(node):
+        # index of the last subindex or of a leaf, that is the window of the whole result
+        if node.action is Action.SUBINDEX:
+            return node.params['index']
+        if node.action is None:
+            return node.cube.index
+        raise ValueError("The window of the datacube is unknown, pass it explicitly")
+
+    @staticmethod
+    def __coverage_name(node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.action is None and not node.is_constant():
+                return node.cube.coverage_name
+            stack.extend(node.children)
+        raise ValueError("The datacube does not refer to any coverage")
+
+    async def afetch(self):
+        """
+        Asynchronous version of fetch, many datacubes can be fetched concurrently on one event loop
+
+        The encode format "auto" is resolved with the default formats (see resolved_tree),
+        so no description is requested on the event loop.
+
         Returns:
             data: the context of a request
         """
-        return self.requester.evaluate_query(make_process_query_from_tree(self.get_tree()))
-    
+        tree = self.resolved_tree()
+        return await self.requester.aevaluate_query(make_process_query_from_tree(tree),
+                                                    key=tree_key(tree))
@@ -0,0 +1,242 @@
+import io
+import json
+
+import numpy as np
+
+# data types of the bands of a coverage (OGC names) and their numpy types,
+# raw results of rasdaman are little endian
+BAND_TYPES = {
+    'char': '<i1', 'signedChar': '<i1', 'unsignedChar': '<u1', 'boolean': '<u1',
+    'short': '<i2', 'unsignedShort': '<u2', 'int': '<i4', 'unsignedInt': '<u4',
+    'long': '<i8', 'unsignedLong': '<u8', 'float': '<f4', 'float32': '<f4',
+    'double': '<f8', 'float64': '<f8',
+}
+
+# encode formats of uncompressed values, decoded without a copy
+RAW_FORMATS = ('application/octet-stream', 'application/x-octet-stream', 'raw', 'octet-stream')
+
+# encode formats whose result is an image with rows and columns
+IMAGE_FORMATS = ('image/png', 'png', 'image/jpeg', 'jpeg', 'image/jpg', 'jpg',
+                 'image/tiff', 'tiff', 'gtiff', 'image/gif', 'gif', 'image/bmp', 'bmp')
+
+# encode format that lets the client choose the most compact format (see compact_format)
+AUTO_FORMAT = 'auto'
+
+# encode formats of rasdaman, used by compact_format if the formats of the server are not known
+DEFAULT_FORMATS = ('image/png', 'image/tiff', 'image/jpeg', 'application/netcdf',
+                   'text/csv', 'application/json')
+
+# single bands that are stored without loss in PNG and TIFF images and read back by Pillow
+PNG_TYPES = ('|u1', '<u2', '|b1')
+TIFF_TYPES = ('|u1', '<u2', '<i2', '<i4', '<f4')
+
+_decoders = {}
+
+
+class DecodedResult:
+    '''
+    Result of a query as an array, together with the names of its axes
+
+    It is also the input of the local engine (see tree.numpy_engine), where the axis labels and
+    coordinates are needed to evaluate subindexes.
+    '''
+
+    def __init__(self, data: np.ndarray, axis_labels: list = None, encode_format: str = None,
+                 coordinates: dict = None, transfer=None):
+        '''
+        Args:
+            data (np.ndarray): decoded values
+            axis_labels (list): name of every dimension of data, None if not known
+            encode_format (str): format the result was encoded with
+            coordinates (dict): (optional) axis -> coordinates of the cells along the axis
+            transfer (TransferReport): (optional) sizes of the result on the wire and decoded
+        '''
+        self.data = data
+        self.axis_labels = axis_labels
+        self.encode_format = encode_format
+        self.coordinates = coordinates if coordinates is not None else {}
+        self.transfer = transfer
+
+    @property
+    def shape(self) -> tuple:
+        return self.data.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.data.dtype
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.data
+        return self.data.astype(dtype)
+
+    def __repr__(self):
+        return (f"DecodedResult(shape={self.shape}, dtype={self.dtype}, "
+                f"axis_labels={self.axis_labels})")
+
+
+def is_raw(encode_format: str) -> bool:
+    '''True if the format holds uncompressed values, whose data type and shape must be known'''
+    return encode_format is not None and encode_format.lower() in RAW_FORMATS
+
+
+def is_image(encode_format: str) -> bool:
+    '''True if the format is an image, whose rows and columns are the y and x axes'''
+    return encode_format is not None and encode_format.lower() in IMAGE_FORMATS
+
+
+def band_dtype(bands: list):
+    '''
+    Numpy data type of the bands of a coverage, a structured type if there are several bands
+
+    Args:
+        bands (list): pairs (band name, data type) as in CoverageDescription.bands
+    Returns:
+        np.dtype or None if a data type is not known
+    '''
+    types = [BAND_TYPES.get(band_type) for _, band_type in bands]
+    if not types or None in types:
+        return None
+    if len(types) == 1:
+        return np.dtype(types[0])
+    return np.dtype([(name, band_type) for (name, _), band_type in zip(bands, types)])
+
+
+def compact_format(dtype, shape: tuple, supported=None):
+    '''
+    Most compact lossless encode format for a result that can be decoded by this module
+
+    Raw values are preferred if the server supports them (their size is known exactly and
+    HTTP compression shrinks them further), then PNG and TIFF for 2D results whose bands
+    fit into an image without loss, then CSV and JSON. JPEG is never chosen, it is lossy.
+
+    Args:
+        dtype: data type of the result, None if it is not known
+        shape (tuple): number of cells along every axis, None where it is not known
+        supported (list): (optional) encode formats of the server, DEFAULT_FORMATS if not known
+    Returns:
+        str or None: the encode format, None for a number that is better not encoded
+    '''
+    if shape is not None and len(shape) == 0:
+        return None
+    supported = {encode_format.lower() for encode_format in
+                 (supported if supported is not None else DEFAULT_FORMATS)}
+    dtype = np.dtype(dtype) if dtype is not None else None
+    if dtype is not None and shape is not None and None not in shape:
+        for encode_format in RAW_FORMATS:
+            if encode_format in supported:
+                return encode_format
+    if dtype is not None and shape is not None and len(shape) == 2:
+        if dtype.names is None:
+            single = dtype.str
+        else:
+            fields = [dtype.fields[name][0].str for name in dtype.names]
+            single = fields[0] if len(set(fields)) == 1 and len(fields) in (1, 3, 4) else None
+        if 'image/png' in supported and single in PNG_TYPES \
+                and (dtype.names is None or single == '|u1' or len(dtype.names) == 1):
+            return 'image/png'
+        if 'image/tiff' in supported and dtype.names is None and single in TIFF_TYPES:
+            return 'image/tiff'
+    for encode_format in ('text/csv', 'application/json'):
+        if encode_format in supported:
+            return encode_format
+    return 'text/csv'
+
+
+def register_decoder(formats, decoder):
+    '''
+    Registers a decoder for one or more encode formats
+
+    Args:
+        formats (str or tuple): encode formats, e.g. "image/png"
+        decoder (callable): function (data, dtype, shape) -> np.ndarray
+    '''
+    if isinstance(formats, str):
+        formats = (formats,)
+    for encode_format in formats:
+        _decoders[encode_format.lower()] = decoder
+
+
+def get_decoder(encode_format: str):
+    '''
+    Decoder of an encode format, None is the format of results that are not encoded
+
+    Raises:
+        ValueError: if no decoder is registered for the format
+    '''
+    key = encode_format.lower() if encode_format is not None else None
+    if key not in _decoders:
+        raise ValueError(f"No decoder for the encode format {encode_format}")
+    return _decoders[key]
+
+
+def decode(data: bytes, encode_format: str, dtype=None, shape: tuple = None) -> np.ndarray:
+    '''
+    Decodes the result of a query
+
+    Args:
+        data (bytes): the result as it was received
+        encode_format (str): format passed to Datacube.encode, None if the result is not encoded
+        dtype: (optional) data type of raw results
+        shape (tuple): (optional) shape of raw results
+    Returns:
+        np.ndarray
+    '''
+    return get_decoder(encode_format)(data, dtype, shape)
+
+
+def decode_raw(data: bytes, dtype=None, shape: tuple = None) -> np.ndarray:
+    '''
+    Uncompressed values, the array is a read-only view of data without a copy
+    '''
+    array = np.frombuffer(data, dtype=np.dtype(dtype if dtype is not None else np.uint8))
+    if shape is not None:
+        array = array.reshape(shape)
+    return array
+
+
+def decode_image(data: bytes, dtype=None, shape: tuple = None) -> np.ndarray:
+    '''
+    Image formats, rows x columns (x bands)
+    '''
+    # imported here, Pillow is only needed for images
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        array = np.asarray(image)
+    if dtype is not None:
+        array = array.astype(dtype, copy=False)
+    return array
+
+
+def decode_text(data: bytes, dtype=None, shape: tuple = None) -> np.ndarray:
+    '''
+    CSV of rasdaman ({1,2},{3,4}) and plain numbers of results that are not encoded
+    '''
+    text = data.decode('utf-8').strip()
+    array = np.array(json.loads(f"[{text.replace('{', '[').replace('}', ']')}]"), dtype=dtype)
+    if '{' not in text and array.size == 1:
+        # a scalar, e.g. the result of an aggregate
+        array = array.reshape(())
+    elif array.ndim > 1 and array.shape[0] == 1:
+        # an outer pair of braces adds a dimension of size one
+        array = array[0]
+    if shape is not None:
+        array = array.reshape(shape)
+    return array
+
+
+def decode_json(data: bytes, dtype=None, shape: tuple = None) -> np.ndarray:
+    '''
+    JSON arrays
+    '''
+    array = np.asarray(json.loads(data), dtype=dtype)
+    if shape is not None:
+        array = array.reshape(shape)
+    return array
+
+
+register_decoder(RAW_FORMATS, decode_raw)
+register_decoder(IMAGE_FORMATS, decode_image)
+register_decoder(('text/csv', 'csv'), decode_text)
+register_decoder(('application/json', 'json'), decode_json)
+_decoders[None] = decode_text
@@ -13,6 +13,8 @@ class Subset:
 
         count = len(formatted_values)
 
+        self.operation = operation
+        self.values = values
         self.query = ""
 
         if count == 1:
@@ -21,4 +23,80 @@ class Subset:
             self.query = f'{operation}({':'.join(formatted_values)})'
         else:
             raise ValueError("No values were provided")
-            
\ No newline at end of file
+
+    def is_slice(self) -> bool:
+        '''True if the subset takes a single value (slicing), False for a range (trimming)'''
+        return len(self.values) == 1
+
+    @staticmethod
+    def split(index: str) -> list:
+        '''
+        Splits a formatted index like 'ansi("2021-04-09"), E(669960,729960)' into its subsets
+
+        Args:
+            index (str): subsets separated by commas
+        Returns:
+            list: subsets as strings
+        '''
+        parts = []
+        depth = 0
+        quoted = False
+        start = 0
+        for i, char in enumerate(index):
+            if char == '"':
+                quoted = not quoted
+            elif quoted:
+                continue
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char == ',' and depth == 0:
+                parts.append(index[start:i].strip())
+                start = i + 1
+        parts.append(index[start:].strip())
+        return [part for part in parts if part]
+
+    @classmethod
+    def parse(cls, index: str) -> list:
+        '''
+        Parses a formatted index back into Subset objects
+
+        Both ':' and ',' are accepted between the bounds of a trim (e.g. E(1:2) and E(1,2)).
+
+        Args:
+            index (str): subsets separated by commas
+        Raises:
+            ValueError: if a subset is not of the form axis(value) or axis(low:high)
+        Returns:
+            list[Subset]
+        '''
+        subsets = []
+        for part in cls.split(index):
+            if '(' not in part or not part.endswith(')'):
+                raise ValueError(f"Unsupported subset: {part}")
+            operation, arguments = part[:-1].split('(', 1)
+            values = []
+            quoted = False
+            start = 0
+            for i, char in enumerate(arguments):
+                if char == '"':
+                    quoted = not quoted
+                elif char in ':,' and not quoted:
+                    values.append(cls._parse_value(arguments[start:i]))
+                    start = i + 1
+            values.append(cls._parse_value(arguments[start:]))
+            if not 1 <= len(values) <= 2:
+                raise ValueError(f"Unsupported subset: {part}")
+            subsets.append(cls(operation.strip(), *values))
+        return subsets
+
+    @staticmethod
+    def _parse_value(value: str):
+        value = value.strip()
+        if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+            return value[1:-1]
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
@@ -0,0 +1,274 @@
+import math
+
+import numpy as np
+
+from wdc.helpers.subset import Subset
+
+# axes that are the columns (x) and the rows (y) of an encoded 2D result
+X_AXES = ('E', 'Lon', 'Long')
+Y_AXES = ('N', 'Lat')
+
+
+class Tile:
+    '''
+    One sub-window of a tiled fetch and its place in the stitched result
+    '''
+
+    def __init__(self, row: int, column: int, height: int, width: int, subsets: list):
+        '''
+        Args:
+            row (int): first row of the tile in the result
+            column (int): first column of the tile in the result
+            height (int): number of rows of the tile
+            width (int): number of columns of the tile
+            subsets (list): trims of the tile as Subset objects
+        '''
+        self.row = row
+        self.column = column
+        self.height = height
+        self.width = width
+        self.subsets = subsets
+
+
+def _number(value: float):
+    '''Integer if the value has no fractional part, so the query stays short'''
+    return int(value) if float(value).is_integer() else value
+
+
+def split_axis(low: float, high: float, resolution: float, tile_pixels: int, origin: float = None) -> list:
+    '''
+    Splits a trim of one axis into parts of at most tile_pixels grid cells
+
+    The parts are aligned to the grid of the coverage: every cell that intersects [low, high]
+    belongs to exactly one part. The bounds of a part are the centres of its first and last
+    cells, so neighbouring parts never select the same cell.
+
+    Args:
+        low (float): lower bound of the trim
+        high (float): upper bound of the trim
+        resolution (float): size of a grid cell
+        tile_pixels (int): maximum number of cells of a part
+        origin (float): (optional) coordinate of the edge of the first cell of the coverage,
+            the lower bound of the trim is used if it is not known
+    Raises:
+        ValueError: if the resolution or the tile size is not positive
+    Returns:
+        list: tuples (offset of the first cell, number of cells, lower bound, upper bound)
+    '''
+    if resolution is None or resolution <= 0:
+        raise ValueError("A positive resolution is needed to split an axis")
+    if tile_pixels < 1:
+        raise ValueError("A tile must contain at least one grid cell")
+    if origin is None:
+        origin = low
+    # a small tolerance, so bounds that lie on a cell edge do not add an empty cell
+    eps = 1e-9
+    first = math.floor((low - origin) / resolution + eps)
+    last = max(math.ceil((high - origin) / resolution - eps) - 1, first)
+    parts = []
+    for start in range(first, last + 1, tile_pixels):
+        end = min(start + tile_pixels, last + 1)
+        parts.append((start - first, end - start,
+                      origin + (start + 0.5) * resolution, origin + (end - 0.5) * resolution))
+    return parts
+
+
+def axis_cells(coefficients: list, low, high) -> list:
+    '''
+    Coefficients of an irregular axis between two bounds (inclusive)
+
+    Dates are compared with the precision of the bounds, e.g. "2021-04-09" matches
+    "2021-04-09T00:00:00.000Z".
+
+    Args:
+        coefficients (list): coordinates of the cells of the axis
+        low: lower bound, a number or a date
+        high: upper bound
+    Returns:
+        list
+    '''
+    if isinstance(low, str) or isinstance(high, str):
+        low, high = str(low), str(high)
+        return [value for value in coefficients
+                if str(value)[:len(low)] >= low and str(value)[:len(high)] <= high]
+    return [value for value in coefficients if low <= value <= high]
+
+
+def cell_positions(cells: list, values: list) -> list:
+    '''
+    Position of every value among the cells of an irregular axis
+
+    Args:
+        cells (list): coordinates of the cells, e.g. the ansi dates of a trim
+        values (list): coordinates to be found, dates with any precision (see axis_cells)
+    Raises:
+        ValueError: if a value is not the coordinate of any cell
+    Returns:
+        list[int]
+    '''
+    # one lookup table per precision of the values, the first cell wins
+    lookups = {}
+    positions = []
+    for value in values:
+        precision = len(value) if isinstance(value, str) else None
+        lookup = lookups.get(precision)
+        if lookup is None:
+            lookup = {}
+            for i, cell in enumerate(cells):
+                key = str(cell)[:precision] if precision is not None else cell
+                lookup.setdefault(key, i)
+            lookups[precision] = lookup
+        if value not in lookup:
+            raise ValueError(f"There is no cell at {value}")
+        positions.append(lookup[value])
+    return positions
+
+
+def split_domain(axis: str, low, high, parts: int, resolution: float = None, origin: float = None,
+                 coefficients: list = None) -> list:
+    '''
+    Splits the trim of an axis into at most parts trims that select every cell exactly once
+
+    Irregular axes (e.g. ansi dates) are split by their coefficients, regular axes by
+    their grid (see split_axis).
+
+    Args:
+        axis (str): axis label
+        low: lower bound of the trim, a number or a date
+        high: upper bound of the trim
+        parts (int): maximum number of trims
+        resolution (float): (optional) size of a grid cell of a regular axis
+        origin (float): (optional) coordinate of the edge of the first cell of a regular axis
+        coefficients (list): (optional) coordinates of the cells of an irregular axis
+    Raises:
+        ValueError: if the axis can not be split (no coefficients or resolution, no cells)
+    Returns:
+        list[Subset]
+    '''
+    if parts < 1:
+        raise ValueError("The domain must be split into at least one part")
+    if coefficients:
+        cells = axis_cells(coefficients, low, high)
+        if not cells:
+            raise ValueError(f"No cells of {axis} between {low} and {high}")
+        size = math.ceil(len(cells) / parts)
+        return [Subset(axis, cells[start], cells[min(start + size, len(cells)) - 1])
+                for start in range(0, len(cells), size)]
+    if resolution is None:
+        raise ValueError(f"The axis {axis} needs a resolution or coefficients to be split")
+    cells = split_axis(low, high, resolution, 1 << 62, origin)[0][1]
+    return [Subset(axis, _number(part_low), _number(part_high)) for _, _, part_low, part_high
+            in split_axis(low, high, resolution, math.ceil(cells / parts), origin)]
+
+
+def trimmed_window(index: str) -> dict:
+    '''
+    Numeric trims of a formatted index
+
+    Args:
+        index (str): formatted index, e.g. 'ansi("2021-04-09"), E(669960,729960)'
+    Returns:
+        dict: axis -> (lower bound, upper bound), slices and date trims are skipped
+    '''
+    window = {}
+    if not index:
+        return window
+    for subset in Subset.parse(index):
+        if subset.is_slice():
+            continue
+        low, high = subset.values
+        if isinstance(low, str) or isinstance(high, str):
+            continue
+        window[subset.operation] = (min(low, high), max(low, high))
+    return window
+
+
+def spatial_axes(window: dict) -> tuple:
+    '''
+    Returns (x axis, y axis) of a window, e.g. ("E", "N")
+
+    Raises:
+        ValueError: if the window has no pair of horizontal axes
+    '''
+    x_axis = next((axis for axis in X_AXES if axis in window), None)
+    y_axis = next((axis for axis in Y_AXES if axis in window), None)
+    if x_axis is None or y_axis is None:
+        raise ValueError(f"Tiling needs trims of both spatial axes, got {sorted(window)}")
+    return x_axis, y_axis
+
+
+def image_axes(labels: list) -> list:
+    '''
+    Axes of an encoded image: the y axis are the rows and the x axis the columns
+
+    Args:
+        labels (list): axes of the result in the order of the coverage
+    Returns:
+        list: the same axes with the spatial ones in (y, x) order
+    '''
+    x_axis = next((axis for axis in X_AXES if axis in labels), None)
+    y_axis = next((axis for axis in Y_AXES if axis in labels), None)
+    if x_axis is None or y_axis is None:
+        return list(labels)
+    others = [axis for axis in labels if axis not in (x_axis, y_axis)]
+    return others + [y_axis, x_axis]
+
+
+def make_tiles(window: dict, axes: tuple, resolution: dict, tile_size, origin: dict = None) -> tuple:
+    '''
+    Splits a window into a grid of tiles
+
+    The result is laid out like an encoded image: columns go along the x axis from the
+    lower bound, rows go along the y axis from the upper bound (north up).
+
+    Args:
+        window (dict): axis -> (lower bound, upper bound)
+        axes (tuple): (x axis, y axis)
+        resolution (dict): axis -> size of a grid cell
+        tile_size (int or tuple): maximum tile size in cells, (width, height) or one number for both
+        origin (dict): (optional) axis -> coordinate of the edge of the first cell of the coverage
+    Returns:
+        tuple: (height, width) of the whole result and a list of Tile objects
+    '''
+    if isinstance(tile_size, int):
+        tile_size = (tile_size, tile_size)
+    origin = origin or {}
+    x_axis, y_axis = axes
+    columns = split_axis(*window[x_axis], resolution[x_axis], tile_size[0], origin.get(x_axis))
+    rows = split_axis(*window[y_axis], resolution[y_axis], tile_size[1], origin.get(y_axis))
+    width = sum(part[1] for part in columns)
+    height = sum(part[1] for part in rows)
+    tiles = []
+    for y_offset, tile_height, y_low, y_high in rows:
+        # rows are counted from the upper bound of the y axis
+        row = height - y_offset - tile_height
+        for column, tile_width, x_low, x_high in columns:
+            subsets = [Subset(x_axis, _number(x_low), _number(x_high)),
+                       Subset(y_axis, _number(y_low), _number(y_high))]
+            tiles.append(Tile(row, column, tile_height, tile_width, subsets))
+    return (height, width), tiles
+
+
+def stitch(shape: tuple, tiles: list, arrays: list) -> np.ndarray:
+    '''
+    Places decoded tiles into one array
+
+    Args:
+        shape (tuple): (height, width) of the result
+        tiles (list): Tile objects
+        arrays (list): decoded array of every tile, bands (if any) are the last dimension
+    Raises:
+        ValueError: if the size of a decoded tile is not the size of its window
+    Returns:
+        np.ndarray
+    '''
+    result = None
+    for tile, array in zip(tiles, arrays):
+        array = np.asarray(array)
+        if array.shape[:2] != (tile.height, tile.width):
+            raise ValueError(f"Tile at ({tile.row}, {tile.column}) has shape {array.shape[:2]}, "
+                             f"expected {(tile.height, tile.width)}")
+        if result is None:
+            result = np.empty(tuple(shape) + array.shape[2:], dtype=array.dtype)
+        result[tile.row:tile.row + tile.height, tile.column:tile.column + tile.width] = array
+    return result
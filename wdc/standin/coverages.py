@@ -0,0 +1,289 @@
+import datetime
+import math
+import zlib
+
+import numpy as np
+
+from ..helpers import decoders
+from ..helpers import tiling
+
+# a small tolerance, so bounds that lie on a cell edge do not add an empty cell (as in tiling.split_axis)
+_EPS = 1e-9
+
+S2_CRS = "http://www.opengis.net/def/crs-compound?1=http://www.opengis.net/def/crs/OGC/0/AnsiDate" \
+         "&2=http://www.opengis.net/def/crs/EPSG/0/32631"
+AVERAGE_CRS = "http://www.opengis.net/def/crs-compound?1=http://www.opengis.net/def/crs/OGC/0/AnsiDate" \
+              "&2=http://www.opengis.net/def/crs/EPSG/0/4326"
+
+RGB_BANDS = [('red', 'unsignedChar'), ('green', 'unsignedChar'), ('blue', 'unsignedChar')]
+
+
+class SyntheticAxis:
+    '''
+    One axis of a synthetic coverage, either a regular grid or an irregular axis with
+    one coordinate per cell (e.g. ansi dates)
+
+    Cells are counted in the storage order of the coverage. Like the y axes of rasdaman,
+    a descending axis stores its cells from the upper bound down (north up).
+    '''
+
+    def __init__(self, label: str, low=None, high=None, resolution: float = None,
+                 coefficients: list = None, descending: bool = False):
+        '''
+        Args:
+            label (str): axis label, e.g. "E"
+            low (float): lower bound of a regular axis
+            high (float): upper bound of a regular axis
+            resolution (float): size of a grid cell of a regular axis
+            coefficients (list): coordinates of the cells of an irregular axis, in order
+            descending (bool): True if the cells are stored from the upper bound down
+        '''
+        self.label = label
+        self.coefficients = list(coefficients) if coefficients is not None else None
+        self.descending = descending
+        if self.coefficients is not None:
+            self.low, self.high = self.coefficients[0], self.coefficients[-1]
+            self.resolution = None
+            self.size = len(self.coefficients)
+        else:
+            self.low, self.high = low, high
+            self.resolution = resolution
+            self.size = int(round((high - low) / resolution))
+
+    def _stored(self, first: int, last: int) -> tuple:
+        '''Storage range of the ascending cells first..last'''
+        if self.descending:
+            return self.size - 1 - last, self.size - first
+        return first, last + 1
+
+    def cells(self, low, high) -> tuple:
+        '''
+        Cells of a trim, every cell that intersects [low, high]
+
+        Raises:
+            ValueError: if no cell of the axis is in the trim
+        Returns:
+            tuple: (start, stop) in storage order
+        '''
+        if self.coefficients is not None:
+            low, high = str(low), str(high)
+            positions = [i for i, value in enumerate(self.coefficients)
+                         if value[:len(low)] >= low and value[:len(high)] <= high]
+            if not positions:
+                raise ValueError(f"No cells of {self.label} between {low} and {high}")
+            return positions[0], positions[-1] + 1
+        if isinstance(low, str) or isinstance(high, str):
+            raise ValueError(f"The axis {self.label} has numeric coordinates, got {low}:{high}")
+        if low > high:
+            raise ValueError(f"The lower bound of {self.label} is above the upper bound: {low}:{high}")
+        first = math.floor((low - self.low) / self.resolution + _EPS)
+        last = max(math.ceil((high - self.low) / self.resolution - _EPS) - 1, first)
+        first, last = max(first, 0), min(last, self.size - 1)
+        if first > last:
+            raise ValueError(f"The subset {self.label}({low}:{high}) is outside of the extent "
+                             f"{self.low}:{self.high}")
+        return self._stored(first, last)
+
+    def cell(self, value) -> int:
+        '''
+        Cell of a slice
+
+        Raises:
+            ValueError: if the value is not inside the axis
+        Returns:
+            int: position in storage order
+        '''
+        if self.coefficients is not None:
+            return tiling.cell_positions(self.coefficients, [str(value)])[0]
+        if isinstance(value, str) or not self.low <= value <= self.high:
+            raise ValueError(f"The slice {self.label}({value}) is outside of the extent "
+                             f"{self.low}:{self.high}")
+        # the upper bound belongs to the last cell
+        first = min(math.floor((value - self.low) / self.resolution + _EPS), self.size - 1)
+        return self._stored(first, first)[0]
+
+
+class SyntheticCoverage:
+    '''
+    Coverage of the stand-in server whose values are computed from the grid position,
+    so any window can be read without storing the coverage
+    '''
+
+    def __init__(self, coverage_id: str, axes: list, bands: list, crs: str = None,
+                 subtype: str = "ReferenceableGridCoverage"):
+        '''
+        Args:
+            coverage_id (str): coverage id, e.g. "S2_L2A_32631_B01_60m"
+            axes (list): SyntheticAxis objects in the order of the coverage
+            bands (list): pairs (band name, OGC data type), e.g. ("B01", "unsignedShort")
+            crs (str): (optional) name of the compound coordinate reference system
+            subtype (str): coverage subtype of the capabilities
+        '''
+        self.coverage_id = coverage_id
+        self.axes = axes
+        self.bands = [tuple(band) for band in bands]
+        self.crs = crs
+        self.subtype = subtype
+        self.dtype = decoders.band_dtype(self.bands)
+        # varies the values between coverages, stable between runs
+        self._seed = zlib.crc32(coverage_id.encode()) % 9973
+
+    @property
+    def axis_labels(self) -> list:
+        return [axis.label for axis in self.axes]
+
+    def axis(self, label: str) -> SyntheticAxis:
+        '''
+        Raises:
+            ValueError: if the coverage has no such axis
+        '''
+        for axis in self.axes:
+            if axis.label == label:
+                return axis
+        raise ValueError(f"The coverage {self.coverage_id} has no axis {label}, "
+                         f"its axes are {self.axis_labels}")
+
+    def _band(self, number: int, dtype: np.dtype, grids: list) -> np.ndarray:
+        '''Values of one band at the grid positions, a pattern that differs along every axis'''
+        weights = (7, 31, 17, 13)
+        total = self._seed + 101 * number
+        for weight, grid in zip(weights, grids):
+            total = total + weight * grid
+        if dtype.kind == 'f':
+            return (50 * np.sin(np.asarray(total, dtype=np.float64) * 0.001)).astype(dtype)
+        modulus = min(int(np.iinfo(dtype).max) + 1, 10007)
+        return (np.asarray(total, dtype=np.int64) % modulus).astype(dtype)
+
+    def read(self, window: list) -> np.ndarray:
+        '''
+        Values of a window of the coverage
+
+        Args:
+            window (list): for every axis (start, stop) of a trim in storage order, or the
+                position of a slice, whose axis is dropped
+        Returns:
+            np.ndarray: values with the axes of the coverage that are not sliced, a structured
+                array if the coverage has several bands
+        '''
+        trimmed = [np.arange(*part, dtype=np.int64) for part in window if isinstance(part, tuple)]
+        open_grids = iter(np.ix_(*trimmed)) if trimmed else iter(())
+        grids = [next(open_grids) if isinstance(part, tuple) else np.int64(part) for part in window]
+        shape = tuple(part[1] - part[0] for part in window if isinstance(part, tuple))
+        if self.dtype.names is None:
+            return np.broadcast_to(self._band(0, self.dtype, grids), shape).copy()
+        data = np.empty(shape, dtype=self.dtype)
+        for number, name in enumerate(self.dtype.names):
+            data[name] = self._band(number, self.dtype.fields[name][0], grids)
+        return data
+
+    def describe_xml(self) -> bytes:
+        '''DescribeCoverage response of the coverage, in the layout of rasdaman'''
+        lower, upper, vectors = [], [], []
+        for i, axis in enumerate(self.axes):
+            vector = ["0"] * len(self.axes)
+            if axis.coefficients is not None:
+                lower.append(f'"{axis.low}"')
+                upper.append(f'"{axis.high}"')
+                vector[i] = "1"
+                coefficients = " ".join(f'"{value}"' for value in axis.coefficients)
+            else:
+                lower.append(_number(axis.low))
+                upper.append(_number(axis.high))
+                vector[i] = _number(-axis.resolution if axis.descending else axis.resolution)
+                coefficients = ""
+            vectors.append(
+                f"        <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis>\n"
+                f"          <gmlrgrid:offsetVector>{' '.join(vector)}</gmlrgrid:offsetVector>\n"
+                f"          <gmlrgrid:coefficients>{coefficients}</gmlrgrid:coefficients>\n"
+                f"          <gmlrgrid:gridAxesSpanned>{axis.label}</gmlrgrid:gridAxesSpanned>\n"
+                f"        </gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>\n")
+        labels = " ".join(self.axis_labels)
+        fields = "".join(
+            f'      <swe:field name="{name}"><swe:Quantity '
+            f'definition="http://www.opengis.net/def/dataType/OGC/0/{band_type}"/></swe:field>\n'
+            for name, band_type in self.bands)
+        crs = (self.crs or "").replace("&", "&amp;")
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<wcs:CoverageDescriptions xmlns:wcs="http://www.opengis.net/wcs/2.0"\n'
+            f'    xmlns:gml="http://www.opengis.net/gml/3.2" '
+            f'xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0"\n'
+            f'    xmlns:gmlrgrid="http://www.opengis.net/gml/3.3/rgrid" '
+            f'xmlns:swe="http://www.opengis.net/swe/2.0">\n'
+            f'  <wcs:CoverageDescription gml:id="{self.coverage_id}">\n'
+            f'    <gml:boundedBy>\n'
+            f'      <gml:Envelope srsName="{crs}" axisLabels="{labels}" '
+            f'srsDimension="{len(self.axes)}">\n'
+            f'        <gml:lowerCorner>{" ".join(lower)}</gml:lowerCorner>\n'
+            f'        <gml:upperCorner>{" ".join(upper)}</gml:upperCorner>\n'
+            f'      </gml:Envelope>\n'
+            f'    </gml:boundedBy>\n'
+            f'    <wcs:CoverageId>{self.coverage_id}</wcs:CoverageId>\n'
+            f'    <gml:domainSet>\n'
+            f'      <gmlrgrid:ReferenceableGridByVectors dimension="{len(self.axes)}">\n'
+            f'        <gml:limits><gml:GridEnvelope><gml:low>{" ".join("0" for _ in self.axes)}'
+            f'</gml:low><gml:high>{" ".join(str(axis.size - 1) for axis in self.axes)}</gml:high>'
+            f'</gml:GridEnvelope></gml:limits>\n'
+            f'        <gml:axisLabels>{labels}</gml:axisLabels>\n'
+            f'{"".join(vectors)}'
+            f'      </gmlrgrid:ReferenceableGridByVectors>\n'
+            f'    </gml:domainSet>\n'
+            f'    <gmlcov:rangeType><swe:DataRecord>\n'
+            f'{fields}'
+            f'    </swe:DataRecord></gmlcov:rangeType>\n'
+            f'    <wcs:ServiceParameters><wcs:CoverageSubtype>{self.subtype}</wcs:CoverageSubtype>'
+            f'</wcs:ServiceParameters>\n'
+            f'  </wcs:CoverageDescription>\n'
+            f'</wcs:CoverageDescriptions>\n').encode()
+
+
+def _number(value) -> str:
+    '''Number without a fractional part if it has none, as rasdaman writes the bounds'''
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def _dates(first: datetime.date, last: datetime.date, step_days: int = 1) -> list:
+    '''ansi coordinates of rasdaman from first to last (inclusive)'''
+    dates = []
+    day = first
+    while day <= last:
+        dates.append(f"{day.isoformat()}T00:00:00.000Z")
+        day += datetime.timedelta(days=step_days)
+    return dates
+
+
+def s2_coverage(coverage_id: str) -> SyntheticCoverage:
+    '''
+    Synthetic Sentinel-2 coverage (ansi/E/N) with the extent of the S2_L2A_32631 coverages,
+    the resolution and the bands are taken from the id, e.g. "S2_L2A_32631_B12_20m"
+    '''
+    band, resolution = coverage_id.rsplit('_', 2)[-2:]
+    resolution = int(resolution.rstrip('m'))
+    bands = RGB_BANDS if band == 'TCI' else [(band, 'unsignedShort')]
+    axes = [SyntheticAxis('ansi', coefficients=_dates(datetime.date(2021, 4, 8),
+                                                      datetime.date(2021, 4, 10))),
+            SyntheticAxis('E', 669960, 729960, resolution),
+            SyntheticAxis('N', 4990200, 5015220, resolution, descending=True)]
+    return SyntheticCoverage(coverage_id, axes, bands, S2_CRS)
+
+
+def average_coverage(coverage_id: str) -> SyntheticCoverage:
+    '''
+    Synthetic global coverage (ansi/Lat/Lon) with daily dates of the first months of 2015
+    and a resolution of one degree, AvgLandTemp has one float band, the others are colors
+    '''
+    bands = [('Gray', 'float')] if coverage_id == 'AvgLandTemp' else RGB_BANDS
+    axes = [SyntheticAxis('ansi', coefficients=_dates(datetime.date(2015, 1, 1),
+                                                      datetime.date(2015, 5, 1))),
+            SyntheticAxis('Lat', -90, 90, 1, descending=True),
+            SyntheticAxis('Lon', -180, 180, 1)]
+    return SyntheticCoverage(coverage_id, axes, bands, AVERAGE_CRS)
+
+
+def default_coverages() -> list:
+    '''Synthetic versions of all S2 and Average coverages known to the library'''
+    # imported here, the coverage modules add their own directory to the path
+    from ..coverage.subcoverages.average_coverage import AverageCoverage
+    from ..coverage.subcoverages.s2_coverage import S2Coverage
+    return [s2_coverage(coverage_id) for coverage_id in S2Coverage.IDs] + \
+        [average_coverage(coverage_id) for coverage_id in AverageCoverage.IDs]
@@ -0,0 +1,291 @@
+import gzip
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import wcps
+from .coverages import default_coverages
+from ..connection.requester import ClientRequest
+from ..helpers.subset import Subset
+
+PATH = "/rasdaman/ows"
+
+
+def _exception_report(code: str, text: str) -> bytes:
+    '''OWS exception report, the error document of rasdaman'''
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<ows:ExceptionReport version="2.0.0" xmlns:ows="http://www.opengis.net/ows/2.0">\n'
+            f'  <ows:Exception exceptionCode="{code}">\n'
+            f'    <ows:ExceptionText>{text}</ows:ExceptionText>\n'
+            f'  </ows:Exception>\n'
+            f'</ows:ExceptionReport>\n').encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so the pooled connections of the transport are reused as with rasdaman
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, without Nagle small answers are not delayed
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.standin._handle(self)
+
+    def do_POST(self):
+        self.server.standin._handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    '''
+    Local HTTP server that answers the requests of ClientRequest like rasdaman, for tests and
+    benchmarks without network access
+
+    GetCapabilities, DescribeCoverage and GetCoverage (WCS 2.0.1) and WCPS queries (POST or GET
+    with query=) are served from synthetic coverages with the axes of the real ones (see
+    standin.coverages). The delay before an answer, the bandwidth, the rate of failed requests
+    and the number of requests processed at once can be set, so client features like pooling,
+    coalescing, retries and compression can be measured deterministically.
+
+    Example:
+        with StandInServer(latency=0.05) as server:
+            Datacube.requester = server.requester()
+            ...
+    '''
+
+    def __init__(self, coverages: list = None, latency: float = 0.0, jitter: float = 0.0,
+                 bandwidth: float = None, error_rate: float = 0.0, max_concurrency: int = None,
+                 reject_when_busy: bool = False, compress: bool = True, seed: int = 0,
+                 max_cells: int = wcps.MAX_CELLS, host: str = '127.0.0.1', port: int = 0):
+        '''
+        Args:
+            coverages (list): (optional) SyntheticCoverage objects, default_coverages() if not given
+            latency (float): seconds before every answer, the time the server needs
+            jitter (float): (optional) up to this many seconds are added to the latency at random
+            bandwidth (float): (optional) bytes per second the answers are sent with, no limit if None
+            error_rate (float): share of requests that fail with 503 Service Unavailable
+            max_concurrency (int): (optional) number of requests processed at once, no limit if None
+            reject_when_busy (bool): True to answer 503 when all slots are busy, otherwise
+                requests wait for a free slot
+            compress (bool): True to compress answers with gzip if the client accepts it
+            seed (int): seed of the jitter and of the failed requests, so runs can be repeated
+            max_cells (int): largest number of cells a query may read from a coverage at once
+            host (str): address the server listens on
+            port (int): port of the server, a free port if 0
+        '''
+        coverages = coverages if coverages is not None else default_coverages()
+        self.coverages = {coverage.coverage_id: coverage for coverage in coverages}
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.reject_when_busy = reject_when_busy
+        self.compress = compress
+        self.max_cells = max_cells
+        self._random = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self._active = 0
+        self.stats = {}
+        self.reset_stats()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        '''Service endpoint of the server, in place of https://ows.rasdaman.org/rasdaman/ows'''
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{PATH}"
+
+    @property
+    def base_wcs_url(self) -> str:
+        return self.endpoint + "?service=WCS&version=2.0.1"
+
+    def requester(self, **kwargs) -> ClientRequest:
+        '''
+        Requester that sends its requests to this server
+
+        Args:
+            kwargs: further arguments of ClientRequest, e.g. transport or cache
+        Returns:
+            ClientRequest
+        '''
+        requester = ClientRequest(base_wcs_url=self.base_wcs_url, **kwargs)
+        requester.service_endpoint = self.endpoint
+        return requester
+
+    def start(self) -> 'StandInServer':
+        '''Starts to serve in a background thread'''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,),
+                                            name="standin-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stops the server and closes its socket'''
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def reset_stats(self):
+        '''
+        Sets the counters of stats to zero: requests, queries (WCPS), failed (injected errors),
+        rejected (busy), bytes_sent (on the wire) and peak_concurrency
+        '''
+        with self._lock:
+            self.stats = {'requests': 0, 'queries': 0, 'failed': 0, 'rejected': 0,
+                          'bytes_sent': 0, 'peak_concurrency': 0}
+
+    def _count(self, counter: str, value: int = 1):
+        with self._lock:
+            self.stats[counter] += value
+
+    def _handle(self, handler):
+        self._count('requests')
+        url = urlsplit(handler.path)
+        if url.path != PATH:
+            self._send(handler, 404, 'text/plain', b'Not found')
+            return
+        params = parse_qs(url.query, keep_blank_values=True)
+        if handler.command == 'POST':
+            length = int(handler.headers.get('Content-Length') or 0)
+            form = handler.rfile.read(length).decode('utf-8')
+            for key, values in parse_qs(form, keep_blank_values=True).items():
+                params.setdefault(key, []).extend(values)
+        params = {key.lower(): values for key, values in params.items()}
+
+        if self._slots is not None and not self._slots.acquire(blocking=not self.reject_when_busy):
+            self._count('rejected')
+            self._send(handler, 503, 'application/xml',
+                       _exception_report('ServiceUnavailable', "All slots of the server are busy"))
+            return
+        with self._lock:
+            self._active += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._active)
+        try:
+            with self._lock:
+                delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+                failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if delay > 0:
+                time.sleep(delay)
+            if failed:
+                self._count('failed')
+                self._send(handler, 503, 'application/xml',
+                           _exception_report('ServiceUnavailable', "Injected failure"))
+                return
+            status, content_type, body = self._dispatch(params)
+            etag = None
+            if status == 200 and 'query' not in params and content_type == 'application/xml':
+                etag = f'"{zlib.crc32(body):08x}"'
+                if handler.headers.get('If-None-Match') == etag:
+                    self._send(handler, 304, None, b'', {'ETag': etag})
+                    return
+            self._send(handler, status, content_type, body, {'ETag': etag} if etag else None)
+        finally:
+            with self._lock:
+                self._active -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def _dispatch(self, params: dict) -> tuple:
+        '''Status, content type and body of the answer to a request'''
+        def param(name):
+            values = params.get(name.lower())
+            return values[0] if values else None
+
+        try:
+            if param('query') is not None:
+                self._count('queries')
+                body, content_type = wcps.evaluate(param('query'), self.coverages, self.max_cells)
+                return 200, content_type, body
+            request = (param('request') or '').lower()
+            if request == 'getcapabilities':
+                return 200, 'application/xml', self._capabilities()
+            if request == 'describecoverage':
+                coverage = self._coverage(param('coverageId'))
+                return 200, 'application/xml', coverage.describe_xml()
+            if request == 'getcoverage':
+                coverage = self._coverage(param('coverageId'))
+                subsets = [subset for value in params.get('subset', [])
+                           for subset in Subset.parse(value)]
+                body, content_type = wcps.get_coverage(coverage, subsets, param('format') or 'text/csv',
+                                                       self.max_cells)
+                return 200, content_type, body
+        except LookupError as error:
+            return 404, 'application/xml', _exception_report('NoSuchCoverage', str(error))
+        except ValueError as error:
+            return 400, 'application/xml', _exception_report('InvalidRequest', str(error))
+        return 400, 'application/xml', _exception_report(
+            'OperationNotSupported', f"Unsupported request {param('request')}")
+
+    def _coverage(self, coverage_id: str):
+        if coverage_id not in self.coverages:
+            raise LookupError(f"Coverage {coverage_id} not found")
+        return self.coverages[coverage_id]
+
+    def _capabilities(self) -> bytes:
+        summaries = "".join(
+            f"      <wcs:CoverageSummary>\n"
+            f"        <wcs:CoverageId>{coverage.coverage_id}</wcs:CoverageId>\n"
+            f"        <wcs:CoverageSubtype>{coverage.subtype}</wcs:CoverageSubtype>\n"
+            f"      </wcs:CoverageSummary>\n" for coverage in self.coverages.values())
+        formats = "".join(f"      <wcs:formatSupported>{encode_format}</wcs:formatSupported>\n"
+                          for encode_format in wcps.SUPPORTED_FORMATS)
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<wcs:Capabilities version="2.0.1" xmlns:wcs="http://www.opengis.net/wcs/2.0">\n'
+                f'  <wcs:ServiceMetadata>\n{formats}  </wcs:ServiceMetadata>\n'
+                f'  <wcs:Contents>\n{summaries}  </wcs:Contents>\n'
+                f'</wcs:Capabilities>\n').encode()
+
+    def _send(self, handler, status: int, content_type: str, body: bytes, headers: dict = None):
+        '''Sends an answer, compressed if the client accepts it and limited to the bandwidth'''
+        try:
+            handler.send_response(status)
+            if content_type is not None:
+                handler.send_header('Content-Type', content_type)
+            for name, value in (headers or {}).items():
+                handler.send_header(name, value)
+            if self.compress and body and 'gzip' in (handler.headers.get('Accept-Encoding') or ''):
+                body = gzip.compress(body, compresslevel=6)
+                handler.send_header('Content-Encoding', 'gzip')
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            self._write(handler.wfile, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up, e.g. after its timeout
+            handler.close_connection = True
+
+    def _write(self, stream, body: bytes):
+        if not self.bandwidth:
+            stream.write(body)
+            self._count('bytes_sent', len(body))
+            return
+        # pieces of about 10 ms, each sent when the bandwidth allows it
+        chunk = max(1024, int(self.bandwidth / 100))
+        start = time.perf_counter()
+        for offset in range(0, len(body), chunk):
+            piece = body[offset:offset + chunk]
+            stream.write(piece)
+            stream.flush()
+            self._count('bytes_sent', len(piece))
+            delay = start + (offset + len(piece)) / self.bandwidth - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
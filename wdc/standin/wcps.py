@@ -0,0 +1,551 @@
+import io
+import json
+import re
+
+import numpy as np
+
+from ..helpers import decoders
+from ..helpers import tiling
+from ..helpers.subset import Subset
+
+_TOKEN = re.compile(r'\s*(?:(?P<number>\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)'
+                    r'|(?P<string>"[^"]*")|(?P<variable>\$\w+)|(?P<name>[A-Za-z_]\w*)'
+                    r'|(?P<symbol>:=|[-+*/()\[\]{},:;]))')
+
+AGGREGATES = {'min': 'min', 'min_cells': 'min', 'max': 'max', 'max_cells': 'max',
+              'avg': 'avg', 'avg_cells': 'avg', 'add': 'add', 'add_cells': 'add',
+              'sum': 'add', 'count': 'count', 'count_cells': 'count'}
+OPERATORS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide}
+
+# encode formats of the stand-in server and the content types of their answers
+FORMATS = {'text/csv': 'text/csv', 'csv': 'text/csv',
+           'application/json': 'application/json', 'json': 'application/json',
+           'image/png': 'image/png', 'png': 'image/png',
+           'image/tiff': 'image/tiff', 'tiff': 'image/tiff', 'gtiff': 'image/tiff',
+           'image/jpeg': 'image/jpeg', 'jpeg': 'image/jpeg', 'image/jpg': 'image/jpeg',
+           'jpg': 'image/jpeg'}
+FORMATS.update({encode_format: 'application/octet-stream' for encode_format in decoders.RAW_FORMATS})
+SUPPORTED_FORMATS = ('image/png', 'image/tiff', 'image/jpeg', 'text/csv', 'application/json',
+                     'application/octet-stream')
+
+# largest number of cells a query may read from a coverage at once
+MAX_CELLS = 1 << 26
+
+
+class WCPSError(ValueError):
+    '''Error of a query that the stand-in server answers with an exception report'''
+
+
+class _Axis:
+    '''Axis of an intermediate result: the cells start:stop (storage order) of a coverage axis'''
+    __slots__ = ('axis', 'start', 'stop')
+
+    def __init__(self, axis, start: int, stop: int):
+        self.axis = axis
+        self.start = start
+        self.stop = stop
+
+    @property
+    def label(self) -> str:
+        return self.axis.label
+
+
+class _Array:
+    '''Intermediate result with axes, numbers are plain numpy scalars'''
+    __slots__ = ('data', 'axes')
+
+    def __init__(self, data: np.ndarray, axes: list):
+        self.data = data
+        self.axes = axes
+
+
+class _Reference:
+    '''A coverage bound in the for clause, only the subset that is used is read'''
+    __slots__ = ('coverage',)
+
+    def __init__(self, coverage):
+        self.coverage = coverage
+
+
+def _number(text: str):
+    return float(text) if any(char in text for char in '.eE') else int(text)
+
+
+def _tokenize(query: str) -> list:
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            raise WCPSError(f"Unexpected character at {position}: {query[position:position + 20]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _read(coverage, subsets: list, max_cells: int) -> _Array:
+    '''Reads the cells of a coverage selected by subsets'''
+    by_axis = {}
+    for subset in subsets:
+        coverage.axis(subset.operation)
+        by_axis[subset.operation] = subset
+    window = []
+    axes = []
+    cells = 1
+    for axis in coverage.axes:
+        subset = by_axis.get(axis.label)
+        if subset is not None and subset.is_slice():
+            window.append(axis.cell(subset.values[0]))
+            continue
+        start, stop = axis.cells(*subset.values) if subset is not None else (0, axis.size)
+        window.append((start, stop))
+        axes.append(_Axis(axis, start, stop))
+        cells *= stop - start
+    if cells > max_cells:
+        raise WCPSError(f"The query reads {cells} cells of {coverage.coverage_id}, "
+                        f"the limit is {max_cells}")
+    return _Array(coverage.read(window), axes)
+
+
+def _subset(value, subsets: list, max_cells: int) -> _Array:
+    '''Trims and slices of a coverage or of an intermediate result, by coordinates'''
+    if isinstance(value, _Reference):
+        return _read(value.coverage, subsets, max_cells)
+    if not isinstance(value, _Array):
+        raise WCPSError("Only coverages can be subset")
+    key = [slice(None)] * len(value.axes)
+    axes = list(value.axes)
+    for subset in subsets:
+        i = next((i for i, axis in enumerate(value.axes) if axis.label == subset.operation), None)
+        if i is None:
+            raise WCPSError(f"The result has no axis {subset.operation}, "
+                            f"its axes are {[axis.label for axis in value.axes]}")
+        current = value.axes[i]
+        if subset.is_slice():
+            cell = current.axis.cell(subset.values[0])
+            if not current.start <= cell < current.stop:
+                raise WCPSError(f"The slice {subset.query} is outside of the result")
+            key[i] = cell - current.start
+            axes[i] = None
+            continue
+        start, stop = current.axis.cells(*subset.values)
+        start, stop = max(start, current.start), min(stop, current.stop)
+        if start >= stop:
+            raise WCPSError(f"The trim {subset.query} is outside of the result")
+        key[i] = slice(start - current.start, stop - current.start)
+        axes[i] = _Axis(current.axis, start, stop)
+    return _Array(value.data[tuple(key)], [axis for axis in axes if axis is not None])
+
+
+def _materialize(value, max_cells: int):
+    return _read(value.coverage, [], max_cells) if isinstance(value, _Reference) else value
+
+
+def _result_dtype(operator: str, dtypes: list) -> np.dtype:
+    '''Data type of an elementwise operation, the same rule as the estimates of tree.cost'''
+    dtype = np.result_type(*dtypes)
+    if operator == '/':
+        return np.result_type(dtype, np.float32)
+    return dtype
+
+
+def _operand_dtype(value) -> np.dtype:
+    '''Data type of an operand, the smallest type that holds it for numbers of the query'''
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.dtype
+    if isinstance(value, float) and not value.is_integer():
+        return np.dtype(np.float64)
+    return np.min_scalar_type(value)
+
+
+def _elementwise(operator: str, left, right):
+    '''Elementwise operation on arrays (band by band) and numbers'''
+    names = next((operand.dtype.names for operand in (left, right)
+                  if isinstance(operand, np.ndarray) and operand.dtype.names), None)
+    if names is not None:
+        fields = {}
+        for name in names:
+            fields[name] = _elementwise(
+                operator, *(operand[name] if isinstance(operand, np.ndarray) and operand.dtype.names
+                            else operand for operand in (left, right)))
+        shape = np.broadcast_shapes(*(np.shape(field) for field in fields.values()))
+        data = np.empty(shape, dtype=[(name, field.dtype) for name, field in fields.items()])
+        for name, field in fields.items():
+            data[name] = field
+        return data
+    dtype = _result_dtype(operator, [_operand_dtype(left), _operand_dtype(right)])
+    with np.errstate(all='ignore'):
+        result = OPERATORS[operator](np.asarray(left).astype(dtype, copy=False),
+                                     np.asarray(right).astype(dtype, copy=False))
+    return np.asarray(result).astype(dtype, copy=False)
+
+
+def _aggregate(function: str, data: np.ndarray):
+    if data.dtype.names is not None:
+        values = [_aggregate(function, data[name]) for name in data.dtype.names]
+        record = np.empty((), dtype=[(name, np.asarray(value).dtype)
+                                     for name, value in zip(data.dtype.names, values)])
+        for name, value in zip(data.dtype.names, values):
+            record[name] = value
+        return record
+    if data.size == 0:
+        raise WCPSError(f"{function} of an empty result")
+    if function == 'min':
+        return data.min()
+    if function == 'max':
+        return data.max()
+    if function == 'avg':
+        return np.float64(data.mean(dtype=np.float64))
+    if function == 'count':
+        return np.uint64(np.count_nonzero(data))
+    dtype = np.float64 if data.dtype.kind == 'f' else \
+        (np.uint64 if data.dtype.kind in 'ub' else np.int64)
+    return data.sum(dtype=dtype)
+
+
+class _Evaluator:
+    '''Recursive descent evaluation of the queries generated by tree.tree_parser'''
+
+    def __init__(self, query: str, coverages: dict, max_cells: int):
+        self.tokens = _tokenize(query)
+        self.position = 0
+        self.coverages = coverages
+        self.max_cells = max_cells
+        self.variables = {}
+
+    def _peek(self, offset: int = 0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise WCPSError("Unexpected end of the query")
+        self.position += 1
+        return token
+
+    def _expect(self, text: str):
+        kind, value = self._next()
+        if value != text:
+            raise WCPSError(f"Expected {text!r}, got {value!r}")
+
+    def _accept(self, text: str) -> bool:
+        if self._peek()[1] == text:
+            self.position += 1
+            return True
+        return False
+
+    def _keyword(self, word: str) -> bool:
+        kind, value = self._peek()
+        if kind == 'name' and value.lower() == word:
+            self.position += 1
+            return True
+        return False
+
+    def evaluate(self):
+        '''
+        Returns:
+            tuple: the value of the return clause and its encode format (None if not encoded)
+        '''
+        if not self._keyword('for'):
+            raise WCPSError("A query starts with for")
+        while True:
+            kind, variable = self._next()
+            if kind != 'variable' or not self._keyword('in'):
+                raise WCPSError(f"Expected $variable in (coverage), got {variable!r}")
+            self._expect('(')
+            kind, coverage_id = self._next()
+            if coverage_id not in self.coverages:
+                raise WCPSError(f"Coverage {coverage_id} not found")
+            self._expect(')')
+            self.variables[variable] = _Reference(self.coverages[coverage_id])
+            if not self._accept(','):
+                break
+        if self._keyword('let'):
+            while True:
+                kind, variable = self._next()
+                if kind != 'variable':
+                    raise WCPSError(f"Expected a $variable, got {variable!r}")
+                self._expect(':=')
+                if self._peek()[1] == '[':
+                    self.variables[variable] = self._subset_list()
+                else:
+                    self.variables[variable] = self._expression()
+                if not self._accept(','):
+                    break
+        if not self._keyword('return'):
+            raise WCPSError(f"Expected return, got {self._peek()[1]!r}")
+        encode_format = None
+        if self._peek() == ('name', 'encode') and self._peek(1)[1] == '(':
+            self.position += 2
+            value = self._expression()
+            self._expect(',')
+            kind, encode_format = self._next()
+            if kind != 'string':
+                raise WCPSError("The encode format must be a string")
+            encode_format = encode_format[1:-1]
+            if self._accept(','):
+                # format parameters are accepted and ignored
+                self._next()
+            self._expect(')')
+        else:
+            value = self._expression()
+        if self._peek()[0] is not None:
+            raise WCPSError(f"Unexpected {self._peek()[1]!r} after the return clause")
+        return _materialize(value, self.max_cells), encode_format
+
+    def _subset_list(self) -> list:
+        self._expect('[')
+        subsets = []
+        while True:
+            kind, axis = self._next()
+            if kind != 'name':
+                raise WCPSError(f"Expected an axis name, got {axis!r}")
+            self._expect('(')
+            values = [self._coordinate()]
+            if self._accept(':') or self._accept(','):
+                values.append(self._coordinate())
+            self._expect(')')
+            subsets.append(Subset(axis, *values))
+            if not self._accept(','):
+                break
+        self._expect(']')
+        return subsets
+
+    def _coordinate(self):
+        negative = self._accept('-')
+        kind, value = self._next()
+        if kind == 'string' and not negative:
+            return value[1:-1]
+        if kind != 'number':
+            raise WCPSError(f"Expected a coordinate, got {value!r}")
+        number = _number(value)
+        return -number if negative else number
+
+    def _expression(self):
+        value = self._term()
+        while self._peek()[1] in ('+', '-'):
+            operator = self._next()[1]
+            value = self._binary(operator, value, self._term())
+        return value
+
+    def _term(self):
+        value = self._factor()
+        while self._peek()[1] in ('*', '/'):
+            operator = self._next()[1]
+            value = self._binary(operator, value, self._factor())
+        return value
+
+    def _binary(self, operator: str, left, right):
+        left = _materialize(left, self.max_cells)
+        right = _materialize(right, self.max_cells)
+        arrays = [operand for operand in (left, right) if isinstance(operand, _Array)]
+        if len(arrays) == 2 and arrays[0].data.shape != arrays[1].data.shape:
+            raise WCPSError(f"The domains of the operands differ: "
+                            f"{arrays[0].data.shape} and {arrays[1].data.shape}")
+        data = _elementwise(operator, *(operand.data if isinstance(operand, _Array) else operand
+                                        for operand in (left, right)))
+        return _Array(data, arrays[0].axes) if arrays else data[()]
+
+    def _factor(self):
+        if self._accept('-'):
+            if self._peek()[0] == 'number':
+                return -_number(self._next()[1])
+            return self._binary('-', 0, self._factor())
+        value = self._primary()
+        while self._peek()[1] == '[':
+            if self._peek(1)[0] == 'variable' and self._peek(2)[1] == ']':
+                self.position += 1
+                subsets = self._lookup(self._next()[1])
+                self._expect(']')
+                if not isinstance(subsets, list):
+                    raise WCPSError("Only subsets can be used as an index")
+            else:
+                subsets = self._subset_list()
+            value = _subset(value, subsets, self.max_cells)
+        return value
+
+    def _lookup(self, variable: str):
+        if variable not in self.variables:
+            raise WCPSError(f"Unknown variable {variable}")
+        return self.variables[variable]
+
+    def _primary(self):
+        kind, value = self._next()
+        if kind == 'number':
+            return _number(value)
+        if kind == 'variable':
+            return self._lookup(value)
+        if value == '(':
+            result = self._expression()
+            self._expect(')')
+            return result
+        if value == '{':
+            return self._refactor()
+        if kind == 'name' and value.lower() in AGGREGATES and self._accept('('):
+            argument = _materialize(self._expression(), self.max_cells)
+            self._expect(')')
+            data = argument.data if isinstance(argument, _Array) else np.asarray(argument)
+            return _aggregate(AGGREGATES[value.lower()], data)
+        raise WCPSError(f"Unexpected {value!r}")
+
+    def _refactor(self):
+        fields = []
+        while True:
+            kind, name = self._next()
+            if kind != 'name':
+                raise WCPSError(f"Expected a band name, got {name!r}")
+            self._expect(':')
+            fields.append((name, _materialize(self._expression(), self.max_cells)))
+            if not self._accept(';'):
+                break
+        self._expect('}')
+        arrays = [value for _, value in fields if isinstance(value, _Array)]
+        shape = arrays[0].data.shape if arrays else ()
+        data = np.empty(shape, dtype=[(name, value.data.dtype if isinstance(value, _Array)
+                                       else np.asarray(value).dtype) for name, value in fields])
+        for name, value in fields:
+            data[name] = value.data if isinstance(value, _Array) else value
+        return _Array(data, arrays[0].axes) if arrays else data[()]
+
+
+def _text(value) -> str:
+    '''A number as rasdaman writes it'''
+    value = np.asarray(value)
+    if value.dtype.names is not None:
+        return "{" + " ".join(_text(value[name]) for name in value.dtype.names) + "}"
+    return repr(value.item()) if value.dtype.kind == 'f' else str(value.item())
+
+
+def _csv(data: np.ndarray) -> str:
+    '''Nested braces of rasdaman, e.g. {{1,2},{3,4}}'''
+    if data.ndim == 0:
+        return _text(data)
+    if data.ndim == 1:
+        if data.dtype.names is None:
+            return "{" + ",".join(map(_text_item, data.tolist())) + "}"
+        return "{" + ",".join(f'"{_text(cell)[1:-1]}"' for cell in data) + "}"
+    return "{" + ",".join(_csv(part) for part in data) + "}"
+
+
+def _text_item(value) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _image(value: _Array, content_type: str) -> bytes:
+    # imported here, Pillow is only needed for images
+    from PIL import Image
+    labels = [axis.label for axis in value.axes]
+    if len(labels) != 2:
+        raise WCPSError(f"Encoding to {content_type} needs a 2D result, its axes are {labels}")
+    order = [labels.index(label) for label in tiling.image_axes(labels)]
+    data = np.transpose(value.data, order)
+    if data.dtype.names is not None:
+        data = np.stack([data[name] for name in data.dtype.names], axis=-1)
+        if data.shape[-1] == 1:
+            data = data[..., 0]
+    if data.ndim == 3 and (data.dtype != np.uint8 or data.shape[-1] not in (3, 4)):
+        raise WCPSError(f"{content_type} images have 3 or 4 bands of unsigned char")
+    if content_type == 'image/jpeg':
+        if data.dtype != np.uint8:
+            raise WCPSError("JPEG images need unsigned char values")
+        pil_format = 'JPEG'
+    elif content_type == 'image/png':
+        if data.dtype.str not in decoders.PNG_TYPES:
+            raise WCPSError(f"PNG images can not store {data.dtype} values, use TIFF")
+        pil_format = 'PNG'
+    else:
+        if data.ndim == 2 and data.dtype.str not in decoders.TIFF_TYPES:
+            raise WCPSError(f"TIFF images can not store {data.dtype} values")
+        pil_format = 'TIFF'
+    if data.dtype == np.bool_:
+        data = data.astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(data)).save(buffer, format=pil_format)
+    return buffer.getvalue()
+
+
+def encode(value, encode_format: str = None) -> tuple:
+    '''
+    Encodes the result of a query
+
+    Args:
+        value: an intermediate result or a number
+        encode_format (str): format of the encode function, None if the result is not encoded
+    Raises:
+        WCPSError: if the format is not supported or does not fit the result
+    Returns:
+        tuple: the body and its content type
+    '''
+    if encode_format is None:
+        if isinstance(value, _Array):
+            return _csv(value.data).encode(), 'text/plain'
+        return _text(value).encode(), 'text/plain'
+    content_type = FORMATS.get(encode_format.lower())
+    if content_type is None:
+        raise WCPSError(f"The encode format {encode_format} is not supported")
+    if not isinstance(value, _Array):
+        return _text(value).encode(), 'text/plain'
+    data = value.data
+    if content_type == 'text/csv':
+        return _csv(data).encode(), content_type
+    if content_type == 'application/json':
+        return json.dumps(data.tolist()).encode(), content_type
+    if content_type == 'application/octet-stream':
+        # raw results of rasdaman are little endian
+        if data.dtype.names is None:
+            data = data.astype(data.dtype.newbyteorder('<'), copy=False)
+        return np.ascontiguousarray(data).tobytes(), content_type
+    return _image(value, content_type), content_type
+
+
+def get_coverage(coverage, subsets: list, encode_format: str = 'text/csv',
+                 max_cells: int = MAX_CELLS) -> tuple:
+    '''
+    Encoded subset of a coverage, the answer to a WCS GetCoverage request
+
+    Args:
+        coverage (SyntheticCoverage): the coverage
+        subsets (list): trims and slices as Subset objects
+        encode_format (str): format of the answer
+        max_cells (int): largest number of cells that may be read
+    Raises:
+        WCPSError: if the subsets or the format do not fit the coverage
+    Returns:
+        tuple: the encoded subset and its content type
+    '''
+    try:
+        value = _read(coverage, subsets, max_cells)
+    except WCPSError:
+        raise
+    except ValueError as error:
+        raise WCPSError(str(error)) from error
+    return encode(value, encode_format)
+
+
+def evaluate(query: str, coverages: dict, max_cells: int = MAX_CELLS) -> tuple:
+    '''
+    Evaluates a WCPS query on synthetic coverages
+
+    The queries of tree.tree_parser are supported: for clauses, let clauses with indexes and
+    expressions (+ - * /, subsets, min/max/avg/add, refactor {a: ...; b: ...}) and a return
+    clause with an optional encode.
+
+    Args:
+        query (str): WCPS query
+        coverages (dict): coverage id -> SyntheticCoverage
+        max_cells (int): largest number of cells the query may read from a coverage at once
+    Raises:
+        WCPSError: if the query can not be evaluated
+    Returns:
+        tuple: the encoded result and its content type
+    '''
+    try:
+        value, encode_format = _Evaluator(query, coverages, max_cells).evaluate()
+    except WCPSError:
+        raise
+    except (ValueError, TypeError, KeyError) as error:
+        raise WCPSError(str(error)) from error
+    return encode(value, encode_format)
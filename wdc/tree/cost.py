@@ -0,0 +1,305 @@
+import warnings
+
+import numpy as np
+
+from .query_tree import Node
+from .query_tree import QueryTree
+from .optimizer import constant_value
+from .tree_parser import make_process_query_from_tree
+from ..action import Action
+from ..helpers import decoders
+from ..helpers import tiling
+from ..helpers.subset import Subset
+
+AGGREGATES = (Action.MIN, Action.MAX, Action.AVG, Action.SUM)
+# results above this size make explain warn
+WARN_BYTES = 1 << 30
+# average size of a value in a text encoding (digits and a separator)
+TEXT_VALUE_BYTES = 8
+# size of the answer of a query without encode, e.g. a number
+SCALAR_BYTES = 16
+
+
+class QueryTooLarge(ValueError):
+    """Raised when the estimated result of a query is larger than the allowed size"""
+
+
+class LargeQueryWarning(UserWarning):
+    """Warning about a query whose estimated result is very large"""
+
+
+class _Axis:
+    """Extent of one axis of an intermediate result and how to count its grid cells"""
+    __slots__ = ('label', 'low', 'high', 'count', 'resolution', 'origin', 'coefficients', 'full')
+
+    def __init__(self, label, low=None, high=None, count=None, resolution=None, origin=None,
+                 coefficients=None, full=False) -> None:
+        self.label = label
+        self.low = low
+        self.high = high
+        self.count = count
+        self.resolution = resolution
+        self.origin = origin
+        self.coefficients = coefficients
+        # True while the axis still covers the whole extent of the coverage
+        self.full = full
+
+    def trim(self, low, high) -> '_Axis':
+        """The axis restricted to [low, high], with its number of cells if it can be counted"""
+        if self.low is not None and self.high is not None \
+                and isinstance(low, str) == isinstance(self.low, str):
+            low, high = max(low, self.low), min(high, self.high)
+        count = None
+        if self.coefficients:
+            count = len(tiling.axis_cells(self.coefficients, low, high))
+        elif self.resolution and not isinstance(low, str) and not isinstance(high, str):
+            count = tiling.split_axis(low, high, self.resolution, 1 << 62, self.origin)[0][1] \
+                if high >= low else 0
+        return _Axis(self.label, low, high, count, self.resolution, self.origin, self.coefficients)
+
+
+class _Domain:
+    """Axes and data type of an intermediate result, no axes for a number"""
+    __slots__ = ('axes', 'dtype')
+
+    def __init__(self, axes: list, dtype) -> None:
+        self.axes = axes
+        self.dtype = dtype
+
+    @property
+    def cells(self):
+        """Number of values, None if the size of an axis is not known"""
+        cells = 1
+        for axis in self.axes:
+            if axis.count is None:
+                return None
+            cells *= axis.count
+        return cells
+
+    def subindex(self, index: str) -> '_Domain':
+        subsets = {subset.operation: subset for subset in Subset.parse(index)} if index else {}
+        axes = []
+        for axis in self.axes:
+            subset = subsets.pop(axis.label, None)
+            if subset is None:
+                axes.append(axis)
+            elif not subset.is_slice():
+                axes.append(axis.trim(*subset.values))
+        # subsets of axes that are not known, e.g. without a coverage description
+        for subset in subsets.values():
+            if not subset.is_slice():
+                axes.append(_Axis(subset.operation).trim(*subset.values))
+        return _Domain(axes, self.dtype)
+
+
+class QueryEstimate:
+    """
+    Estimated cost of a query, computed from the tree and the coverage descriptions
+    without sending the query
+    """
+
+    def __init__(self, query: str, axis_labels: list, shape: tuple, dtype, nbytes,
+                 cells_read, operations, coverages: list, warnings: list) -> None:
+        """
+        Args:
+            query (str): the compiled WCPS query
+            axis_labels (list): names of the axes of the result
+            shape (tuple): number of cells along every axis, None where it is not known
+            dtype: numpy data type of the values, None if it is not known
+            nbytes (int): estimated size of the answer in bytes, None if it is not known
+            cells_read (int): number of cells the server reads from coverages, None if not known
+            operations (int): number of values the server computes, None if not known
+            coverages (list): names of the coverages used by the query
+            warnings (list): messages about expensive parts of the query
+        """
+        self.query = query
+        self.axis_labels = axis_labels
+        self.shape = shape
+        self.dtype = dtype
+        self.nbytes = nbytes
+        self.cells_read = cells_read
+        self.operations = operations
+        self.coverages = coverages
+        self.warnings = warnings
+
+    def __repr__(self):
+        return (f"QueryEstimate(shape={self.shape}, dtype={self.dtype}, nbytes={self.nbytes}, "
+                f"cells_read={self.cells_read}, operations={self.operations})")
+
+    def __str__(self):
+        lines = [self.query, "",
+                 f"result: {dict(zip(self.axis_labels, self.shape))} of {self.dtype}",
+                 f"size: {_format_bytes(self.nbytes)}",
+                 f"cells read: {self.cells_read}, values computed: {self.operations}"]
+        lines.extend(f"warning: {message}" for message in self.warnings)
+        return "\n".join(lines)
+
+
+def _format_bytes(nbytes) -> str:
+    if nbytes is None:
+        return "unknown"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if nbytes < 1024 or unit == "GiB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def _describe(catalog, coverage_name: str):
+    """Cached description if there is one, so no request is sent for known coverages"""
+    if catalog is None:
+        return None
+    description = catalog.cached(coverage_name) if hasattr(catalog, 'cached') else None
+    if description is None:
+        try:
+            description = catalog.describe(coverage_name)
+        except ValueError:
+            return None
+    return description
+
+
+def _leaf_domain(node: Node, catalog) -> _Domain:
+    if node.is_constant():
+        value = constant_value(node)
+        return _Domain([], np.min_scalar_type(value) if float(value).is_integer() else np.dtype(float))
+    description = _describe(catalog, node.cube.coverage_name)
+    if description is None:
+        return _Domain([], None).subindex(node.cube.index)
+    axes = []
+    for i, label in enumerate(description.axis_labels):
+        axes.append(_Axis(label, description.lower_bounds[i], description.upper_bounds[i],
+                          description.grid_size[i], description.resolution[i],
+                          description.lower_bounds[i], description.coefficients.get(label), True))
+    return _Domain(axes, decoders.band_dtype(description.bands)).subindex(node.cube.index)
+
+
+def _result_dtype(action: Action, dtypes: list):
+    if None in dtypes:
+        return None
+    structured = [dtype for dtype in dtypes if dtype.names is not None]
+    if structured:
+        # several bands, every band is computed separately
+        return max(structured, key=lambda dtype: dtype.itemsize)
+    dtype = np.result_type(*dtypes)
+    if action == Action.DIV:
+        return np.result_type(dtype, np.float32)
+    if action == Action.AVG:
+        return np.dtype(np.float64)
+    if action == Action.SUM:
+        return np.dtype(np.float64) if dtype.kind == 'f' else \
+            np.dtype(np.uint64 if dtype.kind in 'ub' else np.int64)
+    return dtype
+
+
+def _encoded_bytes(domain: _Domain, encode_format):
+    cells = domain.cells
+    if cells is None:
+        return None
+    if encode_format is None and not domain.axes:
+        return SCALAR_BYTES
+    if decoders.is_raw(encode_format) or decoders.is_image(encode_format) \
+            or encode_format == 'application/netcdf':
+        # images are compressed, the uncompressed size is an upper bound
+        return cells * domain.dtype.itemsize if domain.dtype is not None else None
+    fields = len(domain.dtype.names) if domain.dtype is not None and domain.dtype.names else 1
+    return cells * fields * TEXT_VALUE_BYTES
+
+
+def estimate_tree(tree: QueryTree, catalog=None) -> QueryEstimate:
+    """
+    Estimates the shape, data type and size of the result of a tree and the work of the server
+
+    The axes of every coverage come from its description (extent, resolution, grid size and
+    ansi dates), the subsets of leaves, subindexes and aggregates restrict them. Descriptions
+    that are already in the catalog are used without a request. Without a description only
+    the subsets are known, so sizes may be None.
+
+    Args:
+        tree (QueryTree): the tree of a datacube
+        catalog (CoverageCatalog): (optional) catalog that describes the coverages
+    Returns:
+        QueryEstimate
+    """
+    domains = {}
+    coverages = []
+    cells_read = 0
+    operations = 0
+    stack = [(tree.root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in domains and not expanded:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children)
+                         if id(child) not in domains)
+            continue
+        children = [domains[id(child)] for child in node.children]
+        if node.action is None:
+            domain = _leaf_domain(node, catalog)
+            if not node.is_constant():
+                coverages.append(node.cube.coverage_name)
+                cells_read = None if cells_read is None or domain.cells is None \
+                    else cells_read + domain.cells
+        elif node.action == Action.SUBINDEX:
+            domain = children[0].subindex(node.params['index'])
+        elif node.action == Action.ENCODE:
+            domain = children[0]
+        elif node.action in AGGREGATES:
+            index = node.params.get('slice') if node.params is not None else None
+            reduced = children[0].subindex(index) if index else children[0]
+            operations = None if operations is None or reduced.cells is None \
+                else operations + reduced.cells
+            domain = _Domain([], _result_dtype(node.action, [reduced.dtype]))
+        elif node.action == Action.REFACTOR:
+            axes = max((child.axes for child in children), key=len)
+            dtypes = [child.dtype for child in children]
+            dtype = None if None in dtypes else np.dtype(
+                [(axis[0], child_dtype) for axis, child_dtype in zip(node.params, dtypes)])
+            domain = _Domain(axes, dtype)
+        else:
+            # elementwise, numbers are broadcast to the axes of the coverage
+            axes = max((child.axes for child in children), key=len)
+            domain = _Domain(axes, _result_dtype(node.action, [child.dtype for child in children]))
+            operations = None if operations is None or domain.cells is None \
+                else operations + domain.cells
+        domains[id(node)] = domain
+
+    root = tree.root
+    domain = domains[id(root)]
+    encode_format = root.params['encode format'] if root.action == Action.ENCODE else None
+    nbytes = _encoded_bytes(domain, encode_format)
+    messages = []
+    full_axes = [axis.label for axis in domain.axes if axis.full]
+    if full_axes:
+        messages.append(f"the axes {', '.join(full_axes)} are not subset, "
+                        f"the whole extent of the coverage is fetched")
+    if nbytes is None:
+        messages.append("the size of the result is unknown, describe the coverages in a catalog")
+    elif nbytes >= WARN_BYTES:
+        messages.append(f"the result is about {_format_bytes(nbytes)}")
+    return QueryEstimate(make_process_query_from_tree(tree), [axis.label for axis in domain.axes],
+                         tuple(axis.count for axis in domain.axes), domain.dtype, nbytes,
+                         cells_read, operations, list(dict.fromkeys(coverages)), messages)
+
+
+def check_estimate(estimate: QueryEstimate, max_bytes: int = None,
+                   warn_bytes: int = WARN_BYTES) -> QueryEstimate:
+    """
+    Warns about or refuses an expensive query
+
+    Args:
+        estimate (QueryEstimate): estimate of the query
+        max_bytes (int): (optional) largest allowed result, None for no limit
+        warn_bytes (int): size above which a LargeQueryWarning is issued
+    Raises:
+        QueryTooLarge: if the result is larger than max_bytes, or its size is not known
+    Returns:
+        QueryEstimate: the same estimate
+    """
+    if max_bytes is not None and (estimate.nbytes is None or estimate.nbytes > max_bytes):
+        raise QueryTooLarge(f"The result of the query is estimated at "
+                            f"{_format_bytes(estimate.nbytes)}, the limit is "
+                            f"{_format_bytes(max_bytes)}: " + "; ".join(estimate.warnings))
+    if warn_bytes is not None and estimate.nbytes is not None and estimate.nbytes >= warn_bytes:
+        warnings.warn("; ".join(estimate.warnings), LargeQueryWarning, stacklevel=3)
+    return estimate
@@ -0,0 +1,352 @@
+import numpy as np
+
+from .query_tree import Node
+from .query_tree import QueryTree
+from .optimizer import constant_value
+from ..action import Action
+from ..helpers.decoders import DecodedResult
+from ..helpers.subset import Subset
+
+ELEMENTWISE = {Action.ADD: np.add, Action.SUB: np.subtract,
+               Action.MULT: np.multiply, Action.DIV: np.true_divide}
+AGGREGATES = (Action.MIN, Action.MAX, Action.AVG, Action.SUM)
+# number of elements processed at once by a fused elementwise expression
+CHUNK_SIZE = 1 << 16
+
+
+class _Value:
+    """Intermediate result: an array (or a number) with its axis labels and coordinates"""
+    __slots__ = ('data', 'labels', 'coords')
+
+    def __init__(self, data, labels=None, coords=None) -> None:
+        self.data = data
+        self.labels = labels
+        self.coords = coords if coords is not None else {}
+
+
+def _aggregate_slice(node: Node):
+    if node.params is None:
+        return None
+    return node.params.get('slice') or None
+
+
+def _plan(root: Node):
+    """
+    Distinct nodes in postorder and the ids of elementwise nodes that are fused into their parent.
+    A node is fused if it is used once, by an elementwise action or an aggregate without a slice
+    """
+    order = []
+    refs = {}
+    fusable_parents = {}
+    seen = set()
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        fusable = node.action in ELEMENTWISE or \
+            (node.action in AGGREGATES and _aggregate_slice(node) is None)
+        for child in reversed(node.children):
+            refs[id(child)] = refs.get(id(child), 0) + 1
+            fusable_parents[id(child)] = fusable_parents.get(id(child), True) and fusable
+            stack.append((child, False))
+    inline = {id(node) for node in order
+              if node.action in ELEMENTWISE and node is not root
+              and refs[id(node)] == 1 and fusable_parents[id(node)]}
+    return order, inline
+
+
+def _leaf_value(node: Node, bindings: dict, coordinates: dict) -> _Value:
+    value = constant_value(node)
+    if value is not None:
+        return _Value(value)
+    cube = node.cube
+    if cube.name not in bindings:
+        raise KeyError(f"No array is bound to the datacube {cube.name} ({cube.coverage_name})")
+    bound = bindings[cube.name]
+    coords = dict(coordinates) if coordinates is not None else {}
+    if isinstance(bound, DecodedResult):
+        coords.update(bound.coordinates)
+        return _Value(np.asarray(bound.data), bound.axis_labels, coords)
+    return _Value(np.asarray(bound), None, coords)
+
+
+class _Region:
+    """
+    Maximal chain of elementwise actions compiled into a small register program,
+    so it is evaluated with a few chunk-sized buffers instead of one temporary per action
+    """
+
+    def __init__(self, root: Node, values: dict, inline: set) -> None:
+        self.inputs = []
+        self.program = []  # (ufunc, destination register, operand, operand)
+        slots = {}
+        free = []
+        registers = 0
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children)
+                             if id(child) in inline)
+                continue
+            operands = []
+            for child in node.children:
+                if id(child) in inline:
+                    operands.append(('register', slots.pop(id(child))))
+                else:
+                    self.inputs.append(values[id(child)])
+                    operands.append(('input', len(self.inputs) - 1))
+            used = [number for kind, number in operands if kind == 'register']
+            if used:
+                # the result overwrites the buffer of an operand
+                destination = used[0]
+                free.extend(used[1:])
+            elif free:
+                destination = free.pop()
+            else:
+                destination = registers
+                registers += 1
+            self.program.append((ELEMENTWISE[node.action], destination, operands[0], operands[1]))
+            slots[id(node)] = destination
+        self.registers = registers
+        self.shape = np.broadcast_shapes(*(np.shape(value.data) for value in self.inputs))
+        self.dtype = self.__result_dtype()
+
+    def __result_dtype(self) -> np.dtype:
+        # the program runs once on one element of every input, numpy decides the type
+        samples = [np.ones(1, dtype=value.data.dtype) if isinstance(value.data, np.ndarray)
+                   else value.data for value in self.inputs]
+        registers = {}
+        with np.errstate(all='ignore'):
+            for ufunc, destination, left, right in self.program:
+                operands = [registers[number] if kind == 'register' else samples[number]
+                            for kind, number in (left, right)]
+                registers[destination] = ufunc(*operands)
+        return np.asarray(registers[self.program[-1][1]]).dtype
+
+    def labels(self):
+        """Axis labels and coordinates of the result, taken from the inputs"""
+        labels = None
+        coords = {}
+        for value in self.inputs:
+            if labels is None and value.labels is not None and len(value.labels) == len(self.shape):
+                labels = value.labels
+            for axis, axis_coords in value.coords.items():
+                coords.setdefault(axis, axis_coords)
+        return labels, coords
+
+    def chunks(self, chunk_size: int, out: np.ndarray = None):
+        """
+        Evaluates the program chunk by chunk along the first axis
+
+        Args:
+            chunk_size (int): number of elements per chunk
+            out (np.ndarray): (optional) the result is written into it,
+                otherwise every chunk is yielded (the buffer is reused by the next chunk)
+        """
+        shape = self.shape
+        if len(shape) == 0:
+            bounds = [None]
+            rows = 0
+        else:
+            row_size = int(np.prod(shape[1:], dtype=np.int64))
+            rows = max(1, chunk_size // max(row_size, 1))
+            bounds = [slice(start, min(start + rows, shape[0])) for start in range(0, shape[0], rows)]
+        buffer_shape = shape if len(shape) == 0 else (min(rows, shape[0]),) + tuple(shape[1:])
+        buffers = [np.empty(buffer_shape, dtype=self.dtype) for _ in range(self.registers)]
+        last = len(self.program) - 1
+        for bound in bounds:
+            operands = []
+            for value in self.inputs:
+                data = value.data
+                if bound is not None and isinstance(data, np.ndarray) and \
+                        data.ndim == len(shape) and data.shape[0] == shape[0]:
+                    data = data[bound]
+                operands.append(data)
+            count = None if bound is None else bound.stop - bound.start
+            registers = [buffer if count is None else buffer[:count] for buffer in buffers]
+            for i, (ufunc, destination, left, right) in enumerate(self.program):
+                target = registers[destination]
+                if i == last and out is not None:
+                    target = out if bound is None else out[bound]
+                ufunc(*[registers[number] if kind == 'register' else operands[number]
+                        for kind, number in (left, right)], out=target)
+            if out is None:
+                yield registers[self.program[last][1]]
+        if out is not None:
+            yield out
+
+
+def _fused(node: Node, values: dict, inline: set, chunk_size: int) -> _Value:
+    region = _Region(node, values, inline)
+    out = np.empty(region.shape, dtype=region.dtype)
+    for _ in region.chunks(chunk_size, out=out):
+        pass
+    labels, coords = region.labels()
+    return _Value(out, labels, coords)
+
+
+def _reduce(action, chunks):
+    """Aggregate of all values of a sequence of arrays"""
+    result = None
+    total = 0
+    count = 0
+    for chunk in chunks:
+        if chunk.size == 0:
+            continue
+        if action in (Action.AVG, Action.SUM):
+            dtype = np.float64 if action == Action.AVG and chunk.dtype.kind in 'biu' else None
+            total = total + np.sum(chunk, dtype=dtype)
+            count += chunk.size
+        else:
+            value = np.min(chunk) if action == Action.MIN else np.max(chunk)
+            result = value if result is None else \
+                (min(result, value) if action == Action.MIN else max(result, value))
+    if action == Action.SUM:
+        return total
+    if action == Action.AVG:
+        if count == 0:
+            raise ValueError("The average of an empty array is not defined")
+        return total / count
+    if result is None:
+        raise ValueError(f"The {action} of an empty array is not defined")
+    return result
+
+
+def _aggregate(node: Node, values: dict, inline: set, chunk_size: int) -> _Value:
+    child = node.children[0]
+    if id(child) in inline:
+        # the elementwise expression is reduced chunk by chunk without being stored
+        result = _reduce(node.action, _Region(child, values, inline).chunks(chunk_size))
+    else:
+        value = values[id(child)]
+        index = _aggregate_slice(node)
+        if index is not None:
+            value = _subindex(value, index)
+        result = _reduce(node.action, [np.asarray(value.data)])
+    return _Value(result, [], {})
+
+
+def _position(grid: np.ndarray, value) -> int:
+    """Index of the cell of a slice: the equal coordinate or the nearest one of numeric axes"""
+    if isinstance(value, str) or grid.dtype.kind in 'US':
+        matches = np.nonzero(grid.astype(f'U{len(str(value))}') == str(value))[0]
+        if len(matches) == 0:
+            raise ValueError(f"No cell at {value}")
+        return int(matches[0])
+    return int(np.argmin(np.abs(grid - value)))
+
+
+def _trim(grid: np.ndarray, low, high) -> slice:
+    """Cells of a trim, the coordinates between low and high"""
+    if isinstance(low, str) or grid.dtype.kind in 'US':
+        # dates are compared with the precision of the bounds, e.g. "2021-04-09"
+        mask = (grid.astype(f'U{len(str(low))}') >= str(low)) & \
+            (grid.astype(f'U{len(str(high))}') <= str(high))
+    else:
+        low, high = min(low, high), max(low, high)
+        mask = (grid >= low) & (grid <= high)
+    positions = np.nonzero(mask)[0]
+    if len(positions) == 0:
+        raise ValueError(f"No cells between {low} and {high}")
+    return slice(int(positions[0]), int(positions[-1]) + 1)
+
+
+def _subindex(value: _Value, index: str) -> _Value:
+    """
+    Trims and slices of a formatted index. Coordinates of an axis are used if they are known,
+    otherwise the subsets are grid positions
+    """
+    data = np.asarray(value.data)
+    labels = value.labels
+    if labels is None or len(labels) != data.ndim:
+        raise ValueError("A subindex needs the axis labels of the array (see DecodedResult)")
+    key = [slice(None)] * data.ndim
+    coords = dict(value.coords)
+    for subset in Subset.parse(index):
+        axis = subset.operation
+        if axis not in labels:
+            raise ValueError(f"The array has no axis {axis}, its axes are {labels}")
+        i = labels.index(axis)
+        grid = np.asarray(coords[axis]) if axis in coords else np.arange(data.shape[i])
+        if subset.is_slice():
+            key[i] = _position(grid, subset.values[0])
+            coords.pop(axis, None)
+        else:
+            key[i] = _trim(grid, *subset.values)
+            if axis in coords:
+                coords[axis] = grid[key[i]]
+    new_labels = [label for label, k in zip(labels, key) if isinstance(k, slice)]
+    return _Value(data[tuple(key)], new_labels, coords)
+
+
+def _refactor(node: Node, values: dict) -> _Value:
+    children = [values[id(child)] for child in node.children]
+    arrays = np.broadcast_arrays(*(np.asarray(child.data) for child in children))
+    dtype = np.dtype([(axis[0], array.dtype) for axis, array in zip(node.params, arrays)])
+    out = np.empty(arrays[0].shape, dtype=dtype)
+    for axis, array in zip(node.params, arrays):
+        out[axis[0]] = array
+    labels = next((child.labels for child in children
+                   if child.labels is not None and len(child.labels) == out.ndim), None)
+    coords = {}
+    for child in children:
+        for axis, axis_coords in child.coords.items():
+            coords.setdefault(axis, axis_coords)
+    return _Value(out, labels, coords)
+
+
+def evaluate_tree(tree: QueryTree, bindings: dict, coordinates: dict = None,
+                  chunk_size: int = CHUNK_SIZE) -> DecodedResult:
+    """
+    Evaluates a tree locally on numpy arrays instead of sending a query to the server
+
+    Every leaf datacube is bound to an array that holds its data with its index already applied,
+    e.g. the result of fetch_array. Chains of elementwise actions are fused: they are computed
+    chunk by chunk into one output array, and an aggregate of such a chain does not store it at
+    all. Shared subtrees are evaluated once. Subindexes need axis labels, so arrays bound as
+    DecodedResult objects; the coordinates of an axis are used if they are known, otherwise
+    the subsets are grid positions. Refactor makes a structured array with a field per axis
+    and encode does nothing.
+
+    Args:
+        tree (QueryTree): a tree to be evaluated
+        bindings (dict): name of a leaf datacube -> np.ndarray or DecodedResult
+        coordinates (dict): (optional) axis -> coordinates of the cells, shared by all leaves
+        chunk_size (int): number of elements processed at once by fused expressions
+    Raises:
+        KeyError: if a leaf datacube has no array
+        ValueError: if a subindex does not match the axes of an array
+    Returns:
+        DecodedResult: the result with its axis labels and coordinates
+    """
+    order, inline = _plan(tree.root)
+    values = {}
+    for node in order:
+        if id(node) in inline:
+            continue
+        if node.action is None:
+            value = _leaf_value(node, bindings, coordinates)
+        elif node.action in ELEMENTWISE:
+            value = _fused(node, values, inline, chunk_size)
+        elif node.action in AGGREGATES:
+            value = _aggregate(node, values, inline, chunk_size)
+        elif node.action is Action.SUBINDEX:
+            value = _subindex(values[id(node.children[0])], node.params['index'])
+        elif node.action is Action.REFACTOR:
+            value = _refactor(node, values)
+        elif node.action == Action.ENCODE:
+            value = values[id(node.children[0])]
+        else:
+            raise AttributeError("This action is not implemented yet")
+        values[id(node)] = value
+    result = values[id(tree.root)]
+    encode_format = tree.root.params['encode format'] if tree.root.action == Action.ENCODE else None
+    return DecodedResult(np.asarray(result.data), result.labels, encode_format, result.coords)
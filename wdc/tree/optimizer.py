@@ -0,0 +1,374 @@
+import math
+from numbers import Number
+
+from .query_tree import Node
+from .query_tree import QueryTree
+from ..action import Action
+from ..helpers.subset import Subset
+
+BINARY = (Action.ADD, Action.SUB, Action.MULT, Action.DIV)
+AGGREGATES = (Action.MIN, Action.MAX, Action.AVG, Action.SUM)
+
+
+def constant_value(node: Node):
+    """
+    Value of a constant leaf, None for every other node
+
+    Args:
+        node (Node): node of a tree
+    Returns:
+        int, float or None
+    """
+    if not node.is_constant():
+        return None
+    name = node.cube.name
+    try:
+        return int(name)
+    except ValueError:
+        return float(name)
+
+
+def make_constant(value: Number) -> Node:
+    """
+    Creates a leaf for a number, in the same way as Datacube.cast_to_datacube does
+
+    Args:
+        value (Number): the number
+    Returns:
+        Node: leaf of the number
+    """
+    # imported here, the datacube module depends on this package
+    from ..datacube import Datacube
+    return Datacube.cast_to_datacube(value).get_tree().root
+
+
+def make_leaf(node: Node, index: str) -> Node:
+    """
+    Creates a leaf for the coverage of a leaf with another index
+
+    Args:
+        node (Node): leaf of a datacube
+        index (str): formatted index of the new leaf
+    Returns:
+        Node: leaf of a new datacube
+    """
+    from ..datacube import Datacube
+    cube = Datacube(link=node.cube.link, coverage_name=node.cube.coverage_name)
+    cube.index = index
+    return cube.get_tree().root
+
+
+def _apply(action, left: Number, right: Number):
+    if action == Action.ADD:
+        return left + right
+    if action == Action.SUB:
+        return left - right
+    if action == Action.MULT:
+        return left * right
+    return left / right
+
+
+def _finite_constant(value: Number):
+    """
+    Leaf of a folded value, None if it can not be written in a query (inf, nan, overflow)
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return make_constant(value)
+
+
+def _reassociate(inner, outer):
+    """
+    Action and sign of c for (x inner c1) outer c2 == x action (c1 sign c2), None if not possible
+    """
+    if inner == Action.MULT and outer == Action.MULT:
+        return Action.MULT, 1
+    if inner == Action.ADD and outer == Action.ADD:
+        return Action.ADD, 1
+    if inner == Action.ADD and outer == Action.SUB:
+        return Action.ADD, -1
+    if inner == Action.SUB and outer == Action.ADD:
+        return Action.SUB, -1
+    if inner == Action.SUB and outer == Action.SUB:
+        return Action.SUB, 1
+    return None
+
+
+def _simplify_binary(action, left: Node, right: Node):
+    """
+    Simplified replacement of the node (left action right), None if nothing can be simplified
+    """
+    changed = False
+    while True:
+        left_value = constant_value(left)
+        right_value = constant_value(right)
+        # constant folding
+        if left_value is not None and right_value is not None:
+            if action == Action.DIV and right_value == 0:
+                break
+            try:
+                folded = _finite_constant(_apply(action, left_value, right_value))
+            except OverflowError:
+                folded = None
+            if folded is None:
+                break
+            return folded
+        # constants go to the right side of commutative actions
+        if left_value is not None and action in (Action.ADD, Action.MULT):
+            left, right = right, left
+            left_value, right_value = right_value, left_value
+            changed = True
+        if right_value is None:
+            break
+        # identities, only with integer constants: x*1.0 or x+0.0 turn integers into floats
+        if type(right_value) is int and \
+                ((right_value == 0 and action in (Action.ADD, Action.SUB)) or
+                 (right_value == 1 and action == Action.MULT)):
+            return left
+        # division by a constant is a multiplication by its inverse
+        # (a division is always a float, so x/1 becomes x*1.0)
+        if action == Action.DIV:
+            if right_value == 0:
+                break
+            try:
+                inverse = _finite_constant(1 / right_value)
+            except OverflowError:
+                inverse = None
+            if inverse is None:
+                break
+            action = Action.MULT
+            right = inverse
+            changed = True
+            continue
+        # (x op c1) op c2 -> x op c
+        if left.action in BINARY:
+            inner_value = constant_value(left.children[1])
+            rule = _reassociate(left.action, action)
+            if inner_value is not None and rule is not None:
+                new_action, sign = rule
+                if new_action == Action.MULT:
+                    value = inner_value * right_value
+                else:
+                    value = inner_value + sign * right_value
+                constant = _finite_constant(value)
+                if constant is not None:
+                    action = new_action
+                    right = constant
+                    left = left.children[0]
+                    changed = True
+                    continue
+        break
+    if not changed:
+        return None
+    return Node(action=action, children=(left, right))
+
+
+def _simplify(node: Node, children: list) -> Node:
+    """
+    Simplified version of a node, whose children are already simplified
+
+    Args:
+        node (Node): original node
+        children (list): simplified children
+    Returns:
+        Node: the original node if nothing was changed
+    """
+    same_children = all(new is old for new, old in zip(children, node.children))
+    if node.action in BINARY:
+        simplified = _simplify_binary(node.action, children[0], children[1])
+        if simplified is not None:
+            return simplified
+    elif node.action in AGGREGATES:
+        child = children[0]
+        # an aggregate of an aggregate is an aggregate of a scalar, so the outer one does nothing
+        if child.action in AGGREGATES and not node.params and not child.params:
+            return child
+    elif node.action is Action.SUBINDEX:
+        child = children[0]
+        if child.action is Action.SUBINDEX:
+            merged = _merge_indexes(child.params['index'], node.params['index'])
+            if merged is not None:
+                return Node(action=Action.SUBINDEX, params={'index': merged},
+                            children=child.children)
+    if same_children:
+        return node
+    return Node(action=node.action, params=node.params, children=children)
+
+
+def _merge_indexes(inner: str, outer: str):
+    """
+    One index equivalent to x[inner][outer], None if the axes of both are not disjoint
+    """
+    try:
+        inner_axes = {subset.operation for subset in Subset.parse(inner)}
+        outer_axes = {subset.operation for subset in Subset.parse(outer)}
+    except ValueError:
+        return None
+    if inner_axes & outer_axes:
+        return None
+    return f"{inner}, {outer}"
+
+
+def _intersect_indexes(inner: str, outer: str):
+    """
+    One index equivalent to x[inner][outer], trims of the same axis are intersected.
+    None if it can not be expressed as one index (an axis sliced twice, dates of other precision)
+    """
+    try:
+        inner_subsets = Subset.parse(inner) if inner else []
+        outer_subsets = Subset.parse(outer)
+    except ValueError:
+        return None
+    merged = {subset.operation: subset for subset in inner_subsets}
+    for subset in outer_subsets:
+        axis = subset.operation
+        previous = merged.get(axis)
+        if previous is None or subset.is_slice() and not previous.is_slice():
+            merged[axis] = subset
+            continue
+        if previous.is_slice():
+            return None
+        values = previous.values + subset.values
+        if any(isinstance(value, str) for value in values) and \
+                not (all(isinstance(value, str) for value in values)
+                     and len({len(value) for value in values}) == 1):
+            return None
+        low = max(min(previous.values), min(subset.values))
+        high = min(max(previous.values), max(subset.values))
+        if low > high:
+            return None
+        merged[axis] = Subset(axis, low, high)
+    return ', '.join(subset.query for subset in merged.values())
+
+
+def _push(root: Node, index: str, leaves: dict) -> Node:
+    """
+    Subtree equivalent to root[index] with the subindex moved down to the leaves
+    through elementwise actions and refactor. Scalar operands (constants, aggregates and
+    arithmetic of them) are not indexed, only coverages can be subset.
+
+    Args:
+        root (Node): child of the subindex
+        index (str): formatted index of the subindex
+        leaves (dict): (id of a leaf, index) -> new leaf, shared by the whole pass
+    """
+    pushed = {}  # id(node) -> node[index]
+    scalars = set()  # ids of the nodes with a scalar value
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in pushed:
+            continue
+        through = node.action in BINARY or node.action is Action.REFACTOR
+        if through and not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children
+                         if id(child) not in pushed and not child.is_constant())
+            continue
+        if through:
+            if node.action in BINARY and all(child.is_constant() or id(child) in scalars
+                                             for child in node.children):
+                scalars.add(id(node))
+                result = node
+            else:
+                children = tuple(child if child.is_constant() or id(child) in scalars
+                                 else pushed[id(child)] for child in node.children)
+                result = Node(action=node.action, params=node.params, children=children)
+        elif node.action in AGGREGATES:
+            scalars.add(id(node))
+            result = node
+        elif node.action is Action.SUBINDEX and \
+                _intersect_indexes(node.params['index'], index) is not None:
+            result = Node(action=Action.SUBINDEX,
+                          params={'index': _intersect_indexes(node.params['index'], index)},
+                          children=node.children)
+        elif node.action is None and not node.is_constant():
+            key = (id(node), index)
+            result = leaves.get(key)
+            if result is None:
+                merged = _intersect_indexes(node.cube.index, index)
+                if merged is None:
+                    result = Node(action=Action.SUBINDEX, params={'index': index},
+                                  children=(node,))
+                else:
+                    result = make_leaf(node, merged)
+                leaves[key] = result
+        else:
+            result = Node(action=Action.SUBINDEX, params={'index': index}, children=(node,))
+        pushed[id(node)] = result
+    if id(root) in scalars:
+        # nothing to push into, the subindex stays where it was
+        return Node(action=Action.SUBINDEX, params={'index': index}, children=(root,))
+    return pushed[id(root)]
+
+
+def push_down_subsets(tree: QueryTree) -> QueryTree:
+    """
+    Moves subindexes through elementwise actions (+, -, *, /) and refactor down to the leaves
+
+    (a + b)[E(...)] becomes a[E(...)] + b[E(...)], so the server only combines the window
+    instead of whole coverages. The subindex is merged into the index of a leaf where it
+    exists, trims of the same axis are intersected. Constants and aggregates are not indexed.
+    The given tree is not changed, shared subtrees stay shared in the result.
+
+    Args:
+        tree (QueryTree): a tree to be rewritten
+    Returns:
+        QueryTree: the rewritten tree
+    """
+    rewritten = {}  # id(original node) -> rewritten node
+    leaves = {}
+    stack = [(tree.root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in rewritten:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children
+                         if id(child) not in rewritten)
+            continue
+        children = tuple(rewritten[id(child)] for child in node.children)
+        if node.action is Action.SUBINDEX:
+            result = _push(children[0], node.params['index'], leaves)
+        elif all(new is old for new, old in zip(children, node.children)):
+            result = node
+        else:
+            result = Node(action=node.action, params=node.params, children=children)
+        rewritten[id(node)] = result
+    return QueryTree.from_root(rewritten[id(tree.root)])
+
+
+def optimize_tree(tree: QueryTree, push_down: bool = False) -> QueryTree:
+    """
+    Algebraic simplification of a tree before the query is generated
+
+    Constant subtrees are folded (unless the result is not finite), identities with integer
+    constants (x*1, x+0, x-0) are removed, division by a constant becomes a multiplication,
+    chains like (x*c1)*c2 are folded into x*c, aggregates of aggregates and repeated
+    subindexes on disjoint axes are collapsed. Identities with float constants (x*1.0) are
+    kept, they change the type of the result.
+    The given tree is not changed, shared subtrees stay shared in the result.
+
+    Args:
+        tree (QueryTree): a tree to be optimized
+        push_down (bool): move subindexes down to the leaves first (see push_down_subsets)
+    Returns:
+        QueryTree: the optimized tree
+    """
+    if push_down:
+        tree = push_down_subsets(tree)
+    simplified = {}  # id(original node) -> simplified node
+    stack = [(tree.root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in simplified:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children
+                         if id(child) not in simplified)
+            continue
+        children = [simplified[id(child)] for child in node.children]
+        simplified[id(node)] = _simplify(node, children)
+    return QueryTree.from_root(simplified[id(tree.root)])
@@ -1,13 +1,35 @@
+import hashlib
+from types import MappingProxyType
+
+# first characters of the strings float() accepts (digits, sign, point, inf, nan)
+_NUMBER_STARTS = frozenset("0123456789+-.iInN \t\n\r\f\v")
+
+
 class QueryTree:
     """Class for saving operations under datacubes as a tree of actions
     This class uses Node class for nodes, every leaf denotes a valid datacube.
     This QueryTree is optimised for duplication, as each node might store duplicates in children.
     For example, c.merge_to(c) will not copy a tree.
     """
+    __slots__ = ('root',)
 
     def __init__(self, cube=None) -> None:
         self.root = Node(cube)
 
+    @classmethod
+    def from_root(cls, root: 'Node') -> 'QueryTree':
+        """
+        Make a tree with an existing node as its root
+
+        Args:
+            root (Node): root of the new tree
+        Returns:
+            QueryTree: tree that shares all nodes with the root
+        """
+        tree = cls.__new__(cls)
+        tree.root = root
+        return tree
+
     def merge_to(self, other: 'QueryTree', action: str, params=None) -> 'QueryTree':
         """
         Merge current tree to other tree by making one new root, that refers to previous trees
@@ -19,12 +41,8 @@ class QueryTree:
         Returns:
             QueryTree: The result of a merge 
         """
-        new_root = Node(action=action, params=params)
-        new_root.children = [self.root, other.root]
-        result = QueryTree()
-        result.root = new_root
-        result.root.size = self.root.size + other.root.size + 1
-        return result
+        return QueryTree.from_root(Node(action=action, params=params,
+                                        children=(self.root, other.root)))
 
     def append_action(self, action: str, params=None) -> 'QueryTree':
         """
@@ -36,13 +54,7 @@ class QueryTree:
         Returns:
             QueryTree: The result of append
         """
-        old_root = self.root
-        new_root = Node(action=action, params=params)
-        new_root.children = [old_root]
-        result = QueryTree()
-        result.root = new_root
-        result.root.size = self.root.size + 1
-        return result
+        return QueryTree.from_root(Node(action=action, params=params, children=(self.root,)))
 
     @classmethod
     def unite_trees(cls, trees: list, action: str, params=None) -> 'QueryTree':
@@ -56,27 +68,59 @@ class QueryTree:
         Returns:
             QueryTree: The result of append
         """
-        new_root = Node(action=action, params=params)
-        new_root.children = trees
-        result = QueryTree()
-        result.root = new_root
-        result.root.size = 1
-        for child in new_root.children:
-            result.root.size += child.root.size
-        return result
+        return QueryTree.from_root(Node(action=action, params=params,
+                                        children=tuple(tree.root for tree in trees)))
     
     @classmethod
     def recursive_string(cls, node: 'Node'):
         """
-        Making a string with the help of dfs of a tree
+        Making a string with the help of dfs of a tree.
+        The dfs uses an explicit stack, so deep trees do not exceed the recursion limit
         """
-        if node.action is not None and node.action in '+-*/':
-            return ('(' + cls.recursive_string(node.children[0]) + ')' + node.action + '('
-                    + cls.recursive_string(node.children[1]) + ')')
-        elif node.action is None:
-            return node.cube.name
-        else:
-            return f"{node.action}"
+        parts = []
+        # the stack holds nodes that are still to be printed and already formed pieces of text
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif node.action is not None and node.action in '+-*/':
+                stack.extend((')', node.children[1], ')' + node.action + '(',
+                              node.children[0], '('))
+            elif node.action is None:
+                parts.append(node.cube.name)
+            else:
+                parts.append(f"{node.action}")
+        return ''.join(parts)
+
+    def dag_size(self) -> int:
+        """
+        Number of distinct nodes of the tree, a subtree that is referenced several times
+        is counted once (unlike Node.size, that counts every reference)
+        """
+        seen = set()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            stack.extend(node.children)
+        return len(seen)
+
+    def structural_hash(self) -> bytes:
+        """
+        Structural hash of the root, see Node.structural_hash
+        """
+        return self.root.structural_hash()
+
+    def __eq__(self, other):
+        if not isinstance(other, QueryTree):
+            return NotImplemented
+        return self.root == other.root
+
+    def __hash__(self):
+        return hash(self.root)
 
     def __str__(self):
         return QueryTree.recursive_string(self.root)
@@ -85,28 +129,145 @@ class QueryTree:
 class Node:
     """
     Class that is used to represent nodes in a QueryTree class
+
+    Nodes are immutable: every operation on a tree makes new nodes that refer to the old ones,
+    so one node can be shared by many trees. Children are always nodes kept in a tuple and
+    parameters are frozen on construction, so copies of a node share them.
+    Attributes can not be reassigned after construction (the structural hash is cached),
+    setting one raises an AttributeError.
     """
+    __slots__ = ('action', 'cube', 'children', 'params', 'size', '_digest')
+
+    def __init__(self, cube=None, action: str = None, params=None, children: tuple = ()) -> None:
+        children = children if type(children) is tuple else tuple(children)
+        size = 1
+        for child in children:
+            size += child.size
+        _set_action(self, action)
+        _set_cube(self, cube)
+        _set_children(self, children)
+        _set_params(self, Node.freeze_params(params))
+        _set_size(self, size)
+        # cached structural hash, computed on first use
+        _set_digest(self, None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Node is immutable, '{name}' can not be set")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Node is immutable, '{name}' can not be deleted")
 
-    def __init__(self, cube=None, action: str = None, params=None) -> None:
-        self.action = action
-        self.cube = cube
-        self.children = []
-        self.params = params
-        if params is not None:
-            self.params = params.copy()
-        self.size = 1
+    @staticmethod
+    def freeze_params(params):
+        """
+        Read-only version of parameters, frozen parameters are shared without copying
+
+        Args:
+            params (dict or list): parameters of an action
+        Returns:
+            MappingProxyType, tuple or None
+        """
+        if params is None or type(params) is MappingProxyType or type(params) is tuple:
+            return params
+        if isinstance(params, dict):
+            return MappingProxyType(dict(params))
+        return tuple(params)
 
     def copy(self) -> 'Node':
         """
         Make a non-leaf copy of this node
         Returns:
-            Node: New node with a copy of the list the children 
+            Node: New node that shares the children and parameters
         """
-        node = Node(self.cube, self.action, self.params)
-        node.children = self.children.copy()
-        node.size = self.size
-
+        node = Node(self.cube, self.action, self.params, self.children)
+        _set_digest(node, self._digest)
         return node
 
     def is_leaf(self):
         return self.action is None
+
+    def is_constant(self) -> bool:
+        """
+        True for leaves that hold a number instead of a coverage (see Datacube.cast_to_datacube)
+        """
+        if self.action is not None:
+            return False
+        name = self.cube.name
+        # generated names (c1, c2, ...) are rejected without the cost of an exception
+        if name[:1] not in _NUMBER_STARTS:
+            return False
+        try:
+            float(name)
+        except ValueError:
+            return False
+        return True
+
+    def params_key(self):
+        """
+        Hashable form of the parameters that matter for the query
+        """
+        if self.params is None:
+            return None
+        if isinstance(self.params, MappingProxyType):
+            return tuple(sorted((key, str(value)) for key, value in self.params.items()))
+        # refactor: the second element of a pair is only the name of the datacube of the axis
+        return tuple(el[0] for el in self.params)
+
+    def _leaf_digest(self) -> bytes:
+        # the generated name of a datacube (cN) is not a part of its structure
+        if self.is_constant():
+            content = f"constant\0{self.cube.name}"
+        else:
+            content = f"coverage\0{self.cube.coverage_name}\0{self.cube.index}"
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    def structural_hash(self) -> bytes:
+        """
+        Merkle hash of the subtree: action, params, coverage name and index of leaves
+        and the hashes of the children. The generated names of datacubes are ignored,
+        so separately built identical expressions have the same hash.
+        Every node is hashed once and caches its hash, so it costs O(1) per node
+
+        Returns:
+            bytes: 16 byte digest
+        """
+        if self.action is None:
+            return self._leaf_digest()
+        if self._digest is not None:
+            return self._digest
+        # explicit stack, children are hashed before their parents
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node.action is None or node._digest is not None:
+                continue
+            children = node.children
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children
+                             if child.action is not None and child._digest is None)
+                continue
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(f"{node.action}\0{node.params_key()}".encode('utf-8'))
+            for child in children:
+                digest.update(child.structural_hash())
+            _set_digest(node, digest.digest())
+        return self._digest
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self is other or self.structural_hash() == other.structural_hash()
+
+    def __hash__(self):
+        return int.from_bytes(self.structural_hash()[:8], 'little')
+
+
+# nodes are immutable, their slots are only set through the descriptors
+# (faster than object.__setattr__, Node.__setattr__ refuses every assignment)
+_set_action = Node.action.__set__
+_set_cube = Node.cube.__set__
+_set_children = Node.children.__set__
+_set_params = Node.params.__set__
+_set_size = Node.size.__set__
+_set_digest = Node._digest.__set__
@@ -2,85 +2,210 @@ from .query_tree import Node
 from .query_tree import QueryTree
 from ..action import Action
 
+_BINARY = (Action.ADD, Action.SUB, Action.MULT, Action.DIV)
+_AGGREGATES = (Action.MAX, Action.MIN, Action.AVG, Action.SUM)
 
-def iterate_tree(node: 'Node', datacubes: set, encodes: set, indexes: set, execution_lines: list, num=0):
+
+def _distinct_nodes(root: 'Node'):
     """
-    Recursive process of going through a tree
+    Assigns one id to every distinct subexpression of a tree
+
+    Nodes are the same subexpression if they are the same object or if they have the same
+    action, parameters and children. A leaf is identified by its datacube.
 
     Args:
-        node (Node): current node
-        datacubes (set): the set of pairs of datacubes' names and their coverage names 
-        encodes (set): set of encodes to check only one encoding
-        indexes (dict): dictionary of (name, index) for every datacube
-        execution_lines (list): lines to execute that will be formed by this function
-        num (int): index variable
-        
-    Raises:
-        AttributeError: The error of the wrong order of queries
+        root (Node): root of the tree
+    Returns:
+        tuple: id of the root, list of (node, ids of its children) indexed by id
+    """
+    canonical = {}  # id(node) -> id of its subexpression
+    interned = {}  # structural key -> id of its subexpression
+    expressions = []
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in canonical:
+            continue
+        children = node.children
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children)
+                         if id(child) not in canonical)
+            continue
+        child_ids = tuple(canonical[id(child)] for child in children)
+        if node.action is None:
+            key = (None, node.cube.name)
+        else:
+            key = (str(node.action), node.params_key(), child_ids)
+        expression_id = interned.get(key)
+        if expression_id is None:
+            expression_id = len(expressions)
+            interned[key] = expression_id
+            expressions.append((node, child_ids))
+        canonical[id(node)] = expression_id
+    return canonical[id(root)], expressions
+
+
+def _line(node: 'Node', num: int, child_nums: list, datacubes: set, encodes: set, indexes: dict):
+    """
+    Line that binds the variable $f{num} of a node, None for encode (it is not a variable)
+
+    Args:
+        node (Node): node of the line
+        num (int): variable of the node
+        child_nums (list): variables of its children
+        datacubes, encodes, indexes: see iterate_tree
     """
     if node.action is None:
         cube = node.cube
         # Digits case
-        if str.isnumeric(cube.name) or (cube.name.count('.') == 1
-                                        and cube.name.replace('.', '', 1).isnumeric()):
-            execution_lines.append(f"$f{num} := {cube.name}")
-            return
+        if node.is_constant():
+            return f"$f{num} := {cube.name}"
         datacubes.add((cube.name, cube.coverage_name))
         if not cube.index is None:
             indexes[cube.name] = cube.index
-            execution_lines.append(f'$f{num} := ${cube.name}[ $index{cube.name}]')
-        else:
-            execution_lines.append(f'$f{num} := ${cube.name}')
+            return f'$f{num} := ${cube.name}[ $index{cube.name}]'
+        return f'$f{num} := ${cube.name}'
     # Binary operator
-    elif node.action in [Action.ADD, Action.SUB, Action.MULT, Action.DIV]:
-        left_size = node.children[0].size
-        execution_lines.append(f'$f{num} := ' + '(' + f'$f{num + 1}' + ')' + node.action +
-                               '(' + f'$f{num + left_size + 1}' + ')')
-        iterate_tree(node.children[0],
-                     datacubes, encodes, indexes, execution_lines, num + 1)
-        iterate_tree(node.children[1],
-                     datacubes, encodes, indexes, execution_lines, num + left_size + 1)
+    if node.action in _BINARY:
+        return f'$f{num} := ($f{child_nums[0]}){node.action}($f{child_nums[1]})'
     # Aggregate queries
-    elif node.action in [Action.MAX, Action.MIN, Action.AVG]:
+    if node.action in _AGGREGATES:
         index = ""
         if not (node.params is None) and 'slice' in node.params:
             index = f"[{node.params['slice']}]"
-        execution_lines.append(f'$f{num} := {str(node.action)}(($f{num+1}){index})')
-        iterate_tree(node.children[0], datacubes, encodes, indexes, execution_lines, num + 1)
-        return
+        return f'$f{num} := {str(node.action)}(($f{child_nums[0]}){index})'
     # Refactor query
-    elif node.action is Action.REFACTOR:
-        line = f'$f{num} := ' + '{ '
-        prefix = 0
-        order = []
-        len_params = len(node.params)
-        for i in range(len_params):
-            el = node.params[i]
-            line += el[0] + ": "
-            line += f"$f{num + 1 + prefix}"
-            if i != len_params - 1:
-                line += '; '
-            order.append((node.children[i].root, prefix + 1 + num))
-            prefix += node.children[i].root.size
-        line += ' }'
-        execution_lines.append(line)
-        for el in order:
-            iterate_tree(el[0], datacubes, encodes, indexes, execution_lines, el[1])
-    elif node.action is Action.SUBINDEX:
+    if node.action is Action.REFACTOR:
+        axes = [f"{el[0]}: $f{child}" for el, child in zip(node.params, child_nums)]
+        return f'$f{num} := ' + '{ ' + '; '.join(axes) + ' }'
+    if node.action is Action.SUBINDEX:
         indexes[f"f{num}"] = node.params['index']
-        execution_lines.append(f'$f{num} := $f{num + 1}[ $indexf{num}]')
-        iterate_tree(node.children[0], datacubes, encodes, indexes, execution_lines, num + 1)
+        return f'$f{num} := $f{child_nums[0]}[ $indexf{num}]'
     # Encode
-    elif node.action == Action.ENCODE:
+    if node.action == Action.ENCODE:
         encodes.add(node.params['encode format'])
-        iterate_tree(node.children[0], datacubes, encodes, indexes, execution_lines, num)
-    else:
-        raise AttributeError("This action is not implemented yet")
+        return None
+    raise AttributeError("This action is not implemented yet")
+
+
+def _iterate_unshared(node: 'Node', num: int):
+    """
+    Lines of a tree without common subexpressions in DFS preorder, the variables of the
+    children follow from the sizes of the subtrees. Every node is visited once.
+
+    Returns:
+        tuple: lines, datacubes, encodes and indexes, None if a node is referenced more than
+            once or two leaves are the same datacube (then the tree is compiled as a DAG)
+    """
+    datacubes = set()
+    encodes = set()
+    indexes = {}
+    lines = []
+    # a subtree that is referenced twice is reached twice, and so are its leaves:
+    # a repeated datacube is enough to find any sharing
+    names = set()
+    stack = [(node, num)]
+    while stack:
+        current, num = stack.pop()
+        if current.action is None:
+            if current.cube.name in names:
+                return None
+            names.add(current.cube.name)
+            lines.append(_line(current, num, (), datacubes, encodes, indexes))
+            continue
+        children = current.children
+        if current.action == Action.ENCODE:
+            encodes.add(current.params['encode format'])
+            stack.append((children[0], num))
+            continue
+        child_nums = []
+        offset = num + 1
+        for child in children:
+            child_nums.append(offset)
+            offset += child.size
+        lines.append(_line(current, num, child_nums, datacubes, encodes, indexes))
+        stack.extend(zip(reversed(children), reversed(child_nums)))
+    return lines, datacubes, encodes, indexes
+
+
+def iterate_tree(node: 'Node', datacubes: set, encodes: set, indexes: set, execution_lines: list, num=0):
+    """
+    Process of going through a tree in DFS order.
+    The tree is compiled as a DAG: every distinct subexpression is bound to one variable,
+    that is referenced wherever the subexpression is used (e.g. both sides of (a+b)*(a+b)).
+    Trees without shared nodes are compiled in one pass, without looking for common
+    subexpressions. Explicit stacks are used instead of recursion, so the depth of a tree
+    is not limited
+
+    Args:
+        node (Node): current node
+        datacubes (set): the set of pairs of datacubes' names and their coverage names 
+        encodes (set): set of encodes to check only one encoding
+        indexes (dict): dictionary of (name, index) for every datacube
+        execution_lines (list): lines to execute that will be formed by this function,
+            every variable is defined after the variables it uses in the reversed list
+        num (int): index variable
+
+    Raises:
+        AttributeError: The error of the wrong order of queries
+    """
+    unshared = _iterate_unshared(node, num)
+    if unshared is not None:
+        lines, tree_datacubes, tree_encodes, tree_indexes = unshared
+        datacubes.update(tree_datacubes)
+        encodes.update(tree_encodes)
+        indexes.update(tree_indexes)
+        execution_lines.extend(lines)
+        return
+
+    root, expressions = _distinct_nodes(node)
+    # variables are numbered in DFS preorder, encode is not a variable of its own
+    numbers = {}
+    stack = [root]
+    while stack:
+        expression = stack.pop()
+        if expression in numbers:
+            continue
+        current, child_ids = expressions[expression]
+        if current.action != Action.ENCODE:
+            numbers[expression] = num
+            num += 1
+        stack.extend(reversed(child_ids))
+
+    def var(expression):
+        current, child_ids = expressions[expression]
+        while current.action == Action.ENCODE:
+            expression = child_ids[0]
+            current, child_ids = expressions[expression]
+        return numbers[expression]
+
+    # lines are formed in postorder from right to left, so every variable is defined before use
+    lines = []
+    visited = set()
+    stack = [(root, False)]
+    while stack:
+        expression, expanded = stack.pop()
+        if expression in visited:
+            continue
+        current, child_ids = expressions[expression]
+        if not expanded:
+            stack.append((expression, True))
+            stack.extend((child, False) for child in child_ids if child not in visited)
+            continue
+        visited.add(expression)
+        line = _line(current, numbers.get(expression), [var(child) for child in child_ids],
+                     datacubes, encodes, indexes)
+        if line is not None:
+            lines.append(line)
+    execution_lines.extend(reversed(lines))
 
 
 def make_process_query_from_tree(tree: 'QueryTree') -> str:
     """
-    Creates query string according to syntax of rasdaman 
+    Creates query string according to syntax of rasdaman.
+    The parts of the query are collected in a list and joined once at the end,
+    so the time and memory are linear in the size of the tree
 
     Args:
         tree (QueryTree): a tree to be processed
@@ -96,7 +221,7 @@ def make_process_query_from_tree(tree: 'QueryTree') -> str:
     indexes = {}
     execution_lines = []
     iterate_tree(tree.root, datacubes, encodes, indexes, execution_lines)
-    query = ""
+    query = []
     if len(encodes) > 1:
         raise AttributeError("Multiple encodes are not supported")
     if len(encodes) == 1 and tree.root.action != Action.ENCODE:
@@ -107,13 +232,13 @@ def make_process_query_from_tree(tree: 'QueryTree') -> str:
     for el in datacubes:
         i += 1
         if len(query) == 0:
-            query += 'for '
+            query.append('for ')
         else:
-            query += '    '
-        query += f'${el[0]} in ({el[1]})'
+            query.append('    ')
+        query.append(f'${el[0]} in ({el[1]})')
         if i != len(datacubes):
-            query += ','
-        query += '\n'
+            query.append(',')
+        query.append('\n')
     first_index = True
     i = 0
     #Index part
@@ -122,43 +247,41 @@ def make_process_query_from_tree(tree: 'QueryTree') -> str:
             continue
         i += 1
         if first_index:
-            query += f'    let $index{el[0]} := [{indexes[el[0]]}]'
+            query.append(f'    let $index{el[0]} := [{indexes[el[0]]}]')
         else:
-            query += f'        $index{el[0]} := [{indexes[el[0]]}]'
+            query.append(f'        $index{el[0]} := [{indexes[el[0]]}]')
         if i != len(datacubes) or len(execution_lines) > 0:
-            query += ','
-        query += '\n'
+            query.append(',')
+        query.append('\n')
         first_index = False
         indexes.pop(el[0])
     i = 0
-    len_indexes = len(list(indexes))
-    for el in sorted(list(indexes)):
-        
+    len_indexes = len(indexes)
+    for el in sorted(indexes):
         i += 1
         if first_index:
-            query += f'    let $index{el} := [{indexes[el]}]'
+            query.append(f'    let $index{el} := [{indexes[el]}]')
         else:
-            query += f'        $index{el} := [{indexes[el]}]'
+            query.append(f'        $index{el} := [{indexes[el]}]')
         if i != len_indexes or len(execution_lines) > 0:
-            query += ','
-        query += '\n'
+            query.append(',')
+        query.append('\n')
         first_index = False
     #Execution part
-    execution_lines = execution_lines[::-1]
-    for i in range(len(execution_lines)):
-        line = execution_lines[i]
-        if first_index: 
-            query += "     let " + line
+    last = len(execution_lines) - 1
+    for i, line in enumerate(reversed(execution_lines)):
+        if first_index:
+            query.append("     let " + line)
         else:
-            query += "        " + line
+            query.append("        " + line)
         first_index = False
-        if i != len(execution_lines) - 1:
-            query += ','
-        query += '\n'
+        if i != last:
+            query.append(',')
+        query.append('\n')
     #Return part
-    query += '    return '
+    query.append('    return ')
     if len(encodes) != 0:
-        query += f'encode($f0, "{list(encodes)[0]}")'
+        query.append(f'encode($f0, "{list(encodes)[0]}")')
     else:
-        query += '$f0'
-    return query
+        query.append('$f0')
+    return ''.join(query)